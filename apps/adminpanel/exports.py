@@ -0,0 +1,222 @@
+"""
+Exports des commandes et des billets (CSV ou NDJSON) pour la comptabilité.
+
+Les lignes sont lues avec values_list(...).iterator(chunk_size=...) : sur
+PostgreSQL un curseur côté serveur, donc une mémoire constante quel que
+soit le nombre de lignes, et aucune instance de modèle n'est créée. Le
+texte est produit par blocs d'environ EXPORT_BUFFER_SIZE octets,
+éventuellement compressés en gzip au fil de l'eau.
+
+Les clés des billets (key2, final_key) ne sont jamais exportées.
+"""
+
+import csv
+import json
+import zlib
+from datetime import datetime, time
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from apps.orders.models import Order
+from apps.tickets.models import Ticket
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+# (nom de la colonne, champ lu par values_list)
+EXPORTS = {
+    "orders": {
+        "model": Order,
+        "filename": "commandes",
+        "offer_field": "offer_id",
+        "columns": (
+            ("id", "id"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+            ("status", "status"),
+            ("offer_id", "offer_id"),
+            ("offer", "offer__name"),
+            ("amount", "amount"),
+            ("user_id", "user_id"),
+            ("email", "user__email"),
+        ),
+    },
+    "tickets": {
+        "model": Ticket,
+        "filename": "billets",
+        "offer_field": "order__offer_id",
+        "columns": (
+            ("id", "id"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+            ("status", "status"),
+            ("order_id", "order_id"),
+            ("offer_id", "order__offer_id"),
+            ("offer", "order__offer__name"),
+            ("user_id", "user_id"),
+            ("email", "user__email"),
+        ),
+    },
+}
+
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def export_chunk_size():
+    """Nombre de lignes lues par aller-retour avec la base."""
+    return getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+
+def parse_bound(value, name):
+    """
+    Borne de date (AAAA-MM-JJ, minuit heure locale) ou date-heure ISO 8601.
+    Retourne None si `value` est vide, lève ValueError si illisible.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{name} must be a date or an ISO 8601 datetime")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(kind, offer_id=None, status=None, since=None, until=None):
+    """
+    Lignes de l'export `kind` (tuples dans l'ordre des colonnes), triées par
+    id, créées entre since (inclus) et until (exclu). Lève ValueError si le
+    type ou le statut est inconnu.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"export must be one of {', '.join(EXPORTS)}")
+    export = EXPORTS[kind]
+    model = export["model"]
+    queryset = model.objects.all()
+    if model is Ticket:
+        # Les billets de la réserve sans commande ne sont pas encore vendus
+        queryset = queryset.filter(order__isnull=False)
+
+    if offer_id is not None:
+        queryset = queryset.filter(**{export["offer_field"]: offer_id})
+    if status:
+        statuses = dict(model.STATUS_CHOICES)
+        if status not in statuses:
+            raise ValueError(f"status must be one of {', '.join(statuses)}")
+        queryset = queryset.filter(status=status)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+
+    return (
+        queryset.order_by("id")
+        .values_list(*(field for _, field in export["columns"]))
+        .iterator(chunk_size=export_chunk_size())
+    )
+
+
+def _text(value):
+    """Valeur exportée : dates ISO 8601, montants en texte exact."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Line:
+    """Pseudo-fichier pour csv.writer : writerow retourne la ligne écrite."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(["" if value is None else _text(value) for value in row])
+
+
+def _ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(
+            dict(zip(header, map(_text, row))),
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ) + "\n"
+
+
+def _buffered(lines):
+    """Regroupe les lignes en blocs d'octets d'environ EXPORT_BUFFER_SIZE."""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _gzipped(chunks):
+    """Compresse les blocs au fil de l'eau (format gzip)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Vrai si l'en-tête Accept-Encoding accepte gzip : codage "gzip" (ou
+    "x-gzip"), à défaut "*", avec un q supérieur à 0. Un q illisible vaut 0.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        qvalue = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        coding = coding.lower()
+        if coding == "x-gzip":
+            coding = "gzip"
+        if coding:
+            qvalues[coding] = max(qvalue, qvalues.get(coding, 0.0))
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
+def stream_export(kind, fmt, rows, compress=False):
+    """
+    Blocs d'octets de l'export `kind` au format `fmt` (csv ou ndjson) pour
+    les lignes `rows` (voir export_rows), compressés en gzip si `compress`.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    header = [name for name, _ in EXPORTS[kind]["columns"]]
+    lines = _csv_lines(header, rows) if fmt == "csv" else _ndjson_lines(header, rows)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_filename(kind, fmt, compress=False):
+    """Nom du fichier téléchargé, daté de l'export."""
+    stamp = timezone.localtime().strftime("%Y%m%d-%H%M")
+    suffix = ".gz" if compress else ""
+    return f"{EXPORTS[kind]['filename']}-{stamp}.{FORMATS[fmt][1]}{suffix}"
@@ -0,0 +1,72 @@
+"""
+Management command dumping orders or tickets to a CSV or NDJSON file.
+
+Same exports as the admin panel API, for offline dumps: rows are streamed
+from a server-side cursor and written chunk by chunk, so memory stays
+constant whatever the table size.
+"""
+
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from apps.adminpanel.exports import (
+    EXPORTS,
+    FORMATS,
+    export_rows,
+    parse_bound,
+    stream_export,
+)
+
+
+class Command(BaseCommand):
+    help = "Export orders or tickets as CSV or NDJSON (optionally gzipped)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS), help="What to export")
+        parser.add_argument(
+            "--format", choices=list(FORMATS), default="csv", help="Default: csv"
+        )
+        parser.add_argument("--offer", type=int, help="Only this offer id")
+        parser.add_argument("--status", help="Only this status (e.g. paid)")
+        parser.add_argument("--since", help="Created on or after (date or datetime)")
+        parser.add_argument("--until", help="Created before (date or datetime)")
+        parser.add_argument(
+            "--output",
+            "-o",
+            default="-",
+            help="Output file (default: standard output)",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress the output with gzip"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_rows(
+                options["kind"],
+                offer_id=options["offer"],
+                status=options["status"],
+                since=parse_bound(options["since"], "since"),
+                until=parse_bound(options["until"], "until"),
+            )
+            chunks = stream_export(
+                options["kind"], options["format"], rows, compress=options["gzip"]
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["output"] == "-":
+            self._write(chunks, sys.stdout.buffer)
+        else:
+            with open(options["output"], "wb") as output:
+                written = self._write(chunks, output)
+            self.stderr.write(
+                self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}")
+            )
+
+    def _write(self, chunks, output):
+        written = 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+        output.flush()
+        return written
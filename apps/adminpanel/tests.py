@@ -0,0 +1,184 @@
+"""
+Tests for the adminpanel app.
+"""
+
+import csv
+import gzip
+import io
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from apps.adminpanel import exports
+from apps.catalog.models import Offer
+from apps.orders.models import Order
+from apps.tickets.models import Ticket
+
+User = get_user_model()
+
+
+class ExportTest(TestCase):
+    """Test cases for the streaming CSV/NDJSON exports."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            username="admin",
+            password="testpass123",
+            is_adminpanel=True,
+        )
+        self.buyer = User.objects.create_user(
+            email="buyer@example.com",
+            username="buyer",
+            password="testpass123",
+        )
+        self.solo = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.duo = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+        self.paid = Order.objects.create(
+            user=self.buyer, offer=self.solo, amount=Decimal("50.00"), status="paid"
+        )
+        self.pending = Order.objects.create(
+            user=self.buyer, offer=self.duo, amount=Decimal("90.00")
+        )
+        self.ticket = Ticket.objects.create(order=self.paid, user=self.buyer)
+        self.client.force_login(self.admin)
+
+    def content(self, response):
+        """Body of a streaming response."""
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_orders_csv_export(self):
+        """Test the CSV export of all orders."""
+        response = self.client.get(reverse("adminpanel:export_orders_api"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="commandes-', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(
+            [row["id"] for row in rows], [str(self.paid.id), str(self.pending.id)]
+        )
+        self.assertEqual(rows[0]["amount"], "50.00")
+        self.assertEqual(rows[0]["email"], "buyer@example.com")
+        self.assertEqual(rows[1]["offer"], "duo")
+
+    def test_filters(self):
+        """Test filtering by offer, status and creation date."""
+        url = reverse("adminpanel:export_orders_api")
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+
+        def ids(params):
+            rows = csv.DictReader(
+                io.StringIO(self.content(self.client.get(url, params)))
+            )
+            return [int(row["id"]) for row in rows]
+
+        self.assertEqual(ids({"offer": self.duo.id}), [self.pending.id])
+        self.assertEqual(ids({"status": "paid"}), [self.paid.id])
+        self.assertEqual(ids({"since": tomorrow}), [])
+        self.assertEqual(len(ids({"until": tomorrow})), 2)
+
+    def test_tickets_ndjson_export_without_keys(self):
+        """Test the NDJSON ticket export never leaks ticket keys."""
+        response = self.client.get(
+            reverse("adminpanel:export_tickets_api"), {"format": "ndjson"}
+        )
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = self.content(response)
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["order_id"], self.paid.id)
+        self.assertEqual(lines[0]["offer"], "solo")
+        self.assertNotIn(self.ticket.final_key, content)
+
+    def test_gzip_when_accepted(self):
+        """Test on-the-fly gzip compression."""
+        response = self.client.get(
+            reverse("adminpanel:export_orders_api"), HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(response.streaming_content)).decode("utf-8")
+        self.assertTrue(body.startswith("id,created_at,updated_at,status"))
+
+    def test_gzip_refused_with_zero_qvalue(self):
+        """Test that gzip;q=0 disables compression."""
+        response = self.client.get(
+            reverse("adminpanel:export_orders_api"),
+            HTTP_ACCEPT_ENCODING="br, gzip;q=0",
+        )
+
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertTrue(self.content(response).startswith("id,created_at"))
+
+    def test_accepts_gzip(self):
+        """Test Accept-Encoding parsing with q-values."""
+        for header, expected in (
+            ("gzip", True),
+            ("deflate, gzip;q=0.5", True),
+            ("*", True),
+            ("GZIP ; Q=1.0", True),
+            ("", False),
+            ("identity", False),
+            ("gzip;q=0", False),
+            ("gzip;q=0.000", False),
+            ("*;q=0", False),
+            ("*, gzip;q=0", False),
+            ("gzip;q=abc", False),
+        ):
+            self.assertEqual(exports.accepts_gzip(header), expected, header)
+
+    def test_invalid_parameters(self):
+        """Test 400 answers for unknown formats, statuses and dates."""
+        url = reverse("adminpanel:export_orders_api")
+        for params in (
+            {"format": "xlsx"},
+            {"status": "refunded"},
+            {"since": "hier"},
+            {"offer": "abc"},
+        ):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_requires_admin_panel_user(self):
+        """Test that regular users cannot export data."""
+        self.client.force_login(self.buyer)
+
+        response = self.client.get(reverse("adminpanel:export_orders_api"))
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command(self):
+        """Test the offline dump command with gzip."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "tickets.ndjson.gz"
+            err = io.StringIO()
+
+            call_command(
+                "export_data",
+                "tickets",
+                "--format",
+                "ndjson",
+                "--status",
+                "valid",
+                "--gzip",
+                "--output",
+                str(output),
+                stderr=err,
+            )
+
+            lines = gzip.decompress(output.read_bytes()).decode("utf-8").splitlines()
+        self.assertEqual(json.loads(lines[0])["id"], self.ticket.id)
+        self.assertIn("Wrote", err.getvalue())
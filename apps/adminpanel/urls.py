@@ -26,4 +26,41 @@ urlpatterns = [
         views.delete_offer_api,
         name="delete_offer_api",
     ),
+    path(
+        "api/administration/metriques/qr-cache/",
+        views.qr_cache_stats_api,
+        name="qr_cache_stats_api",
+    ),
+    path(
+        "api/administration/metriques/idempotence/",
+        views.idempotency_stats_api,
+        name="idempotency_stats_api",
+    ),
+    path(
+        "api/administration/metriques/delestage/",
+        views.load_shedding_stats_api,
+        name="load_shedding_stats_api",
+    ),
+    path(
+        "api/administration/metriques/journal-passages/",
+        views.scan_log_stats_api,
+        name="scan_log_stats_api",
+    ),
+    path(
+        "api/administration/export/commandes/",
+        views.export_api,
+        {"kind": "orders"},
+        name="export_orders_api",
+    ),
+    path(
+        "api/administration/export/billets/",
+        views.export_api,
+        {"kind": "tickets"},
+        name="export_tickets_api",
+    ),
+    path(
+        "api/administration/file-attente/",
+        views.waiting_room_api,
+        name="waiting_room_api",
+    ),
 ]
@@ -7,12 +7,18 @@ This app provides a custom admin panel for managing offers and viewing sales sta
 import json
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.db.models import Count, Sum
 from apps.catalog.models import Offer
-from apps.orders.models import Order
+from apps.orders.idempotency import idempotency_stats
+from apps.orders.rollups import sales_by_offer
+from apps.tickets.qr_cache import qr_cache
+from apps.tickets.scan_log import scan_log
+from apps.waitingroom.admission import configure, room_stats
+from apps.waitingroom.load_shedding import monitor as load_monitor
+from . import exports
 
 
 def is_admin_panel_user(user):
@@ -28,13 +34,8 @@ def dashboard_view(request):
     """
     Admin dashboard with sales statistics.
     """
-    # Get sales data by offer
-    sales_data = (
-        Order.objects.filter(status="paid")
-        .values("offer__name")
-        .annotate(count=Count("id"), total_amount=Sum("amount"))
-        .order_by("offer__name")
-    )
+    # Get sales data by offer (from the sales rollups, not the orders table)
+    sales_data = sales_by_offer()
 
     # Calculate average price for each offer
     for item in sales_data:
@@ -60,10 +61,8 @@ def dashboard_view(request):
     }
 
     # Get total statistics
-    total_orders = Order.objects.filter(status="paid").count()
-    total_revenue = (
-        Order.objects.filter(status="paid").aggregate(total=Sum("amount"))["total"] or 0
-    )
+    total_orders = sum(item["count"] for item in sales_data)
+    total_revenue = sum(item["total_amount"] for item in sales_data)
 
     # Get active offers count
     active_offers_count = Offer.objects.filter(is_active=True).count()
@@ -232,3 +231,116 @@ def delete_offer_api(request, offer_id):
 
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def qr_cache_stats_api(request):
+    """
+    API endpoint exposing the QR render cache counters of this worker.
+
+    GET /api/administration/metriques/qr-cache/
+    """
+    return JsonResponse({"success": True, "stats": qr_cache.stats()})
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def idempotency_stats_api(request):
+    """
+    API endpoint exposing the Idempotency-Key counters (replay rate).
+
+    GET /api/administration/metriques/idempotence/
+    """
+    return JsonResponse({"success": True, "stats": idempotency_stats()})
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def load_shedding_stats_api(request):
+    """
+    API endpoint exposing the load shedding counters of this worker.
+
+    GET /api/administration/metriques/delestage/
+    """
+    return JsonResponse({"success": True, "stats": load_monitor.stats()})
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def scan_log_stats_api(request):
+    """
+    API endpoint exposing the gate audit log buffer counters of this worker.
+
+    GET /api/administration/metriques/journal-passages/
+    """
+    return JsonResponse({"success": True, "stats": scan_log.stats()})
+
+
+@require_http_methods(["GET", "POST"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def waiting_room_api(request):
+    """
+    API endpoint to watch and tune the sale opening waiting room live.
+
+    GET /api/administration/file-attente/
+    POST /api/administration/file-attente/ {"enabled": true, "rate": 600}
+    """
+    if request.method == "POST":
+        try:
+            data = json.loads(request.body)
+            rate = data.get("rate")
+            if rate is not None and int(rate) < 1:
+                raise ValueError(
+                    "rate must be a positive number of visitors per minute"
+                )
+            configure(enabled=data.get("enabled"), rate=rate)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    return JsonResponse({"success": True, "stats": room_stats()})
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def export_api(request, kind):
+    """
+    API endpoint streaming orders or tickets as CSV or NDJSON.
+
+    GET /api/administration/export/commandes/?format=csv&offer=1&status=paid
+        &since=2024-07-01&until=2024-08-01
+    GET /api/administration/export/billets/?format=ndjson
+
+    Rows are streamed from a server-side cursor; the body is gzipped on the
+    fly when the client accepts it.
+    """
+    fmt = request.GET.get("format", "csv")
+    try:
+        offer_id = request.GET.get("offer")
+        rows = exports.export_rows(
+            kind,
+            offer_id=int(offer_id) if offer_id else None,
+            status=request.GET.get("status"),
+            since=exports.parse_bound(request.GET.get("since"), "since"),
+            until=exports.parse_bound(request.GET.get("until"), "until"),
+        )
+        compress = exports.accepts_gzip(request.headers.get("Accept-Encoding", ""))
+        chunks = exports.stream_export(kind, fmt, rows, compress=compress)
+    except ValueError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[fmt][0])
+    response["Content-Disposition"] = (
+        f'attachment; filename="{exports.export_filename(kind, fmt)}"'
+    )
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    patch_cache_control(response, private=True, no_store=True)
+    return response
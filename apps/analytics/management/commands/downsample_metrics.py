@@ -0,0 +1,45 @@
+"""
+Management command rolling old analytics buckets into coarser ones.
+
+Minutes older than ANALYTICS_MINUTE_RETENTION become hours and hours older
+than ANALYTICS_HOUR_RETENTION become days, which keeps the analytics table
+small. Run one instance next to the payment workers.
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from apps.analytics.timeseries import downsample
+
+
+class Command(BaseCommand):
+    help = "Roll old minute and hour analytics buckets into hours and days"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=300,
+            help="Seconds between two runs (default: 300)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Downsample once then exit instead of running forever",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                minutes, hours = downsample()
+                if minutes or hours:
+                    self.stdout.write(
+                        f"Rolled {minutes} minute rows into hours "
+                        f"and {hours} hour rows into days"
+                    )
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("Analytics downsampling done"))
@@ -0,0 +1,81 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="MetricBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        choices=[
+                            ("orders", "Commandes payées"),
+                            ("revenue", "Chiffre d'affaires"),
+                            ("tickets_issued", "Billets émis"),
+                            ("tickets_scanned", "Billets scannés"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("minute", "Minute"),
+                            ("hour", "Heure"),
+                            ("day", "Jour"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "start",
+                    models.DateTimeField(help_text="Début de l'intervalle (UTC)"),
+                ),
+                (
+                    "slot",
+                    models.PositiveSmallIntegerField(
+                        help_text="Numéro du slot (0 à N-1)"
+                    ),
+                ),
+                (
+                    "value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+            ],
+            options={
+                "verbose_name": "Statistique",
+                "verbose_name_plural": "Statistiques",
+                "db_table": "analytics_metricbucket",
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "start"], name="metricbucket_res_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="metricbucket",
+            constraint=models.UniqueConstraint(
+                fields=("metric", "resolution", "start", "slot"),
+                name="metricbucket_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+"""
+Modèles de statistiques dans le temps pour l'application JO Tickets.
+
+Projet étudiant - BTS SIO
+Date : Septembre 2024
+"""
+
+from django.db import models
+
+
+class MetricBucket(models.Model):
+    """
+    Valeur d'un indicateur (commandes, chiffre d'affaires, billets émis ou
+    scannés) sur un intervalle de temps : une minute, une heure ou un jour.
+
+    Les événements sont comptés dans la minute en cours ; la commande
+    downsample_metrics regroupe ensuite les vieilles minutes en heures et
+    les vieilles heures en jours (voir timeseries.py). Comme le stock, une
+    même période est répartie sur plusieurs lignes (slots).
+    """
+
+    METRIC_CHOICES = [
+        ("orders", "Commandes payées"),
+        ("revenue", "Chiffre d'affaires"),
+        ("tickets_issued", "Billets émis"),
+        ("tickets_scanned", "Billets scannés"),
+    ]
+    RESOLUTION_CHOICES = [
+        ("minute", "Minute"),
+        ("hour", "Heure"),
+        ("day", "Jour"),
+    ]
+
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField(help_text="Début de l'intervalle (UTC)")
+    slot = models.PositiveSmallIntegerField(help_text="Numéro du slot (0 à N-1)")
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "analytics_metricbucket"
+        verbose_name = "Statistique"
+        verbose_name_plural = "Statistiques"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "resolution", "start", "slot"],
+                name="metricbucket_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["resolution", "start"], name="metricbucket_res_idx"),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.metric} {self.resolution} {self.start:%Y-%m-%d %H:%M} : "
+            f"{self.value}"
+        )
@@ -0,0 +1,218 @@
+"""
+Tests for the analytics app.
+"""
+
+import json
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from apps.analytics import timeseries
+from apps.analytics.models import MetricBucket
+from apps.catalog.models import Offer
+from apps.orders.models import Order
+from apps.orders.payments import create_paid_orders
+from apps.tickets.models import Ticket
+from apps.tickets.scan_log import scan_log
+
+User = get_user_model()
+
+
+class TimeSeriesTest(TestCase):
+    """Test cases for the pre-bucketed time series."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.noon = datetime(2024, 7, 26, 12, 0, tzinfo=dt_timezone.utc)
+
+    def values(self, metric, resolution, start, end):
+        """Data points of one metric."""
+        return timeseries.series([metric], resolution, start, end)["datasets"][0][
+            "data"
+        ]
+
+    @override_settings(SCAN_LOG_FLUSH_INTERVAL=0)
+    def test_events_are_counted_in_the_current_minute(self):
+        """Test that checkouts and gate scans feed the minute buckets."""
+        scan_log.clear()
+        (order,) = create_paid_orders(
+            self.user, [{"offer_id": self.offer.id, "quantity": 1, "price": "50.00"}]
+        )
+        final_key = Ticket.objects.get(order=order).final_key
+        for _ in range(2):
+            self.client.post(
+                reverse("tickets:validate_ticket_api"),
+                data=json.dumps({"final_key": final_key}),
+                content_type="application/json",
+            )
+
+        # Les passages sont comptés à l'écriture du journal, pas à la validation
+        self.assertFalse(MetricBucket.objects.filter(metric="tickets_scanned").exists())
+        scan_log.flush()
+
+        start = timeseries.truncate(order.created_at, "minute")
+        data = timeseries.series(
+            list(timeseries.METRICS), "minute", start, start + timedelta(minutes=2)
+        )
+
+        self.assertEqual(len(data["labels"]), 2)
+        totals = {
+            dataset["metric"]: sum(dataset["data"]) for dataset in data["datasets"]
+        }
+        self.assertEqual(
+            totals,
+            {"orders": 1, "revenue": 50.0, "tickets_issued": 1, "tickets_scanned": 1},
+        )
+
+    def test_cancelling_a_paid_order_is_not_counted(self):
+        """Test that only paid orders reach the order series."""
+        order = Order.objects.create(user=self.user, offer=self.offer, amount=50)
+        order.mark_as_cancelled()
+
+        self.assertFalse(MetricBucket.objects.exists())
+
+    def test_series_fills_gaps_with_zeros(self):
+        """Test Chart.js-ready arrays aligned on the labels."""
+        timeseries.record({"orders": 2}, self.noon + timedelta(minutes=1))
+        timeseries.record({"orders": 1}, self.noon + timedelta(minutes=1, seconds=30))
+        timeseries.record({"orders": 4}, self.noon + timedelta(minutes=3))
+
+        data = timeseries.series(
+            ["orders"], "minute", self.noon, self.noon + timedelta(minutes=4)
+        )
+
+        self.assertEqual(data["labels"][0], "2024-07-26T12:00:00+00:00")
+        self.assertEqual(data["datasets"][0]["label"], "Commandes payées")
+        self.assertEqual(data["datasets"][0]["data"], [0, 3, 0, 4])
+
+    @override_settings(
+        ANALYTICS_MINUTE_RETENTION=3600, ANALYTICS_HOUR_RETENTION=86400 * 2
+    )
+    def test_downsampling_keeps_totals(self):
+        """Test that old minutes become hours and old hours become days."""
+        timeseries.record({"revenue": Decimal("10.50")}, self.noon)
+        timeseries.record(
+            {"revenue": Decimal("20.00")}, self.noon + timedelta(minutes=59)
+        )
+        timeseries.record({"revenue": Decimal("5.00")}, self.noon + timedelta(hours=1))
+        day = self.noon.replace(hour=0)
+
+        minutes, hours = timeseries.downsample(
+            now=self.noon + timedelta(hours=2, minutes=30)
+        )
+
+        self.assertEqual((minutes, hours), (2, 0))
+        self.assertEqual(
+            self.values("revenue", "hour", self.noon, self.noon + timedelta(hours=2)),
+            [30.5, 5.0],
+        )
+        # Heure regroupée : plus de détail à la minute
+        self.assertEqual(
+            self.values(
+                "revenue", "minute", self.noon, self.noon + timedelta(minutes=2)
+            ),
+            [0, 0],
+        )
+
+        timeseries.downsample(now=self.noon + timedelta(days=3))
+
+        self.assertEqual(
+            list(MetricBucket.objects.values_list("resolution", "value")),
+            [("day", Decimal("35.50"))],
+        )
+        self.assertEqual(
+            self.values("revenue", "day", day, day + timedelta(days=1)), [35.5]
+        )
+
+    def test_downsample_command(self):
+        """Test the downsampling command in single run mode."""
+        timeseries.record({"orders": 1}, timezone.now() - timedelta(hours=7))
+
+        out = StringIO()
+        call_command("downsample_metrics", "--once", stdout=out)
+
+        self.assertIn("Rolled 1 minute rows into hours", out.getvalue())
+        self.assertEqual(MetricBucket.objects.get().resolution, "hour")
+
+
+class TimeSeriesApiTest(TestCase):
+    """Test cases for the time series API."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            username="admin",
+            password="testpass123",
+            is_adminpanel=True,
+        )
+        self.url = reverse("analytics:timeseries_api")
+
+    def test_default_period(self):
+        """Test the last hour at minute resolution by default."""
+        timeseries.record({"tickets_scanned": 3})
+        self.client.force_login(self.admin)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["resolution"], "minute")
+        self.assertIn(len(data["labels"]), (60, 61))
+        scanned = {d["metric"]: d["data"] for d in data["datasets"]}["tickets_scanned"]
+        self.assertEqual(sum(scanned), 3)
+
+    def test_explicit_period_and_metrics(self):
+        """Test hourly buckets of chosen metrics over a given period."""
+        self.client.force_login(self.admin)
+
+        response = self.client.get(
+            self.url,
+            {
+                "resolution": "hour",
+                "metrics": "orders,revenue",
+                "start": "2024-07-26T00:00:00Z",
+                "end": "2024-07-27T00:00:00",
+            },
+        )
+
+        data = response.json()
+        self.assertEqual(len(data["labels"]), 24)
+        self.assertEqual([d["metric"] for d in data["datasets"]], ["orders", "revenue"])
+
+    def test_invalid_parameters(self):
+        """Test 400 answers for unknown metrics, resolutions or huge periods."""
+        self.client.force_login(self.admin)
+
+        for params in (
+            {"resolution": "second"},
+            {"metrics": "visits"},
+            {"start": "hier"},
+            {"resolution": "minute", "start": "2024-01-01T00:00:00Z"},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_requires_admin_panel_user(self):
+        """Test that regular users cannot read the series."""
+        user = User.objects.create_user(
+            email="test@example.com", username="testuser", password="testpass123"
+        )
+        self.client.force_login(user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 302)
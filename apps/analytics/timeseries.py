@@ -0,0 +1,192 @@
+"""
+Séries temporelles des ventes et des entrées.
+
+Chaque événement (commande payée, billet émis ou scanné) ajoute sa valeur
+à la minute en cours (MetricBucket de résolution "minute") par un
+INSERT ... ON CONFLICT DO UPDATE, dans un slot tiré au hasard parmi
+ANALYTICS_SHARDS pour que les écritures simultanées ne se bloquent pas.
+
+La commande downsample_metrics déplace ensuite les minutes plus vieilles
+que ANALYTICS_MINUTE_RETENTION dans des lignes horaires, puis les heures
+plus vieilles que ANALYTICS_HOUR_RETENTION dans des lignes journalières :
+une valeur n'est jamais comptée dans deux lignes et la table reste petite.
+
+Une série à l'heure somme les lignes horaires et les minutes pas encore
+regroupées ; une période déjà regroupée n'existe plus à une résolution
+plus fine. Les intervalles sont en UTC.
+"""
+
+import math
+import random
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import MetricBucket
+
+METRIC_LABELS = dict(MetricBucket.METRIC_CHOICES)
+METRICS = tuple(METRIC_LABELS)
+# De la plus fine à la plus grossière
+RESOLUTIONS = ("minute", "hour", "day")
+STEPS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+# Période affichée quand le client ne donne pas de début
+DEFAULT_WINDOWS = {
+    "minute": timedelta(hours=1),
+    "hour": timedelta(days=2),
+    "day": timedelta(days=30),
+}
+MAX_POINTS = 1500
+UPSERT_BATCH_SIZE = 500
+
+UPSERT_METRIC_SQL = """
+    INSERT INTO analytics_metricbucket (metric, resolution, start, slot, value)
+    VALUES {values}
+    ON CONFLICT (metric, resolution, start, slot) DO UPDATE SET
+        value = analytics_metricbucket.value + excluded.value
+"""
+
+
+def analytics_shards():
+    """Nombre de slots de chaque minute."""
+    return getattr(settings, "ANALYTICS_SHARDS", 4)
+
+
+def minute_retention():
+    """Durée pendant laquelle les minutes sont gardées avant regroupement."""
+    return timedelta(seconds=getattr(settings, "ANALYTICS_MINUTE_RETENTION", 21600))
+
+
+def hour_retention():
+    """Durée pendant laquelle les heures sont gardées avant regroupement."""
+    return timedelta(seconds=getattr(settings, "ANALYTICS_HOUR_RETENTION", 2592000))
+
+
+def truncate(when, resolution):
+    """Début (UTC) de l'intervalle de `resolution` contenant `when`."""
+    when = when.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if resolution != "minute":
+        when = when.replace(minute=0)
+    if resolution == "day":
+        when = when.replace(hour=0)
+    return when
+
+
+def current_bucket(when=None):
+    """(début de la minute, slot tiré au hasard) où compter un événement."""
+    return (
+        truncate(when or timezone.now(), "minute"),
+        random.randrange(analytics_shards()),
+    )
+
+
+def _add(rows):
+    """Ajoute les valeurs des lignes (metric, resolution, start, slot, value)."""
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        for first in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[first : first + UPSERT_BATCH_SIZE]
+            params = []
+            for metric, resolution, start, slot, value in batch:
+                params += [metric, resolution, adapt(start), slot, value]
+            cursor.execute(
+                UPSERT_METRIC_SQL.format(
+                    values=", ".join(["(%s, %s, %s, %s, %s)"] * len(batch))
+                ),
+                params,
+            )
+
+
+def record(values, when=None):
+    """
+    Ajoute {métrique: valeur} à la minute de `when` (maintenant par défaut),
+    en une requête. A appeler dans la transaction de l'événement compté.
+    """
+    metrics = sorted(metric for metric, value in values.items() if value)
+    if not metrics:
+        return
+    start, slot = current_bucket(when)
+    _add([(metric, "minute", start, slot, values[metric]) for metric in metrics])
+
+
+def _roll_up(source, target, cutoff):
+    """
+    Déplace les lignes de résolution `source` antérieures à `cutoff` dans
+    des lignes `target` (slot 0). Retourne le nombre de lignes supprimées.
+    """
+    with transaction.atomic():
+        old = MetricBucket.objects.filter(resolution=source, start__lt=cutoff)
+        totals = (
+            old.annotate(bucket=Trunc("start", target, tzinfo=dt_timezone.utc))
+            .values_list("metric", "bucket")
+            .annotate(total=Sum("value"))
+            .order_by("metric", "bucket")
+        )
+        _add([(metric, target, bucket, 0, total) for metric, bucket, total in totals])
+        deleted, _ = old.delete()
+    return deleted
+
+
+def downsample(now=None):
+    """
+    Regroupe les minutes anciennes en heures et les heures anciennes en
+    jours. Seules des heures (et des jours) complètes sont regroupées.
+    Retourne (minutes regroupées, heures regroupées).
+    """
+    now = now or timezone.now()
+    minutes = _roll_up("minute", "hour", truncate(now - minute_retention(), "hour"))
+    hours = _roll_up("hour", "day", truncate(now - hour_retention(), "day"))
+    return minutes, hours
+
+
+def series(metrics, resolution, start, end):
+    """
+    Série des métriques entre start (inclus) et end (exclus), prête pour
+    Chart.js : {"resolution", "labels", "datasets": [{"label", "metric", "data"}]}.
+
+    Une requête GROUP BY sur au plus (points x métriques) groupes. Lève
+    ValueError si une métrique ou la résolution est inconnue, ou si la
+    période est vide ou dépasse MAX_POINTS points.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    unknown = set(metrics) - set(METRICS)
+    if unknown or not metrics:
+        raise ValueError(f"metrics must be among {', '.join(METRICS)}")
+
+    step = STEPS[resolution]
+    start = truncate(start, resolution)
+    points = math.ceil((end - start) / step)
+    if points < 1 or points > MAX_POINTS:
+        raise ValueError(f"the period must cover between 1 and {MAX_POINTS} points")
+
+    finer = RESOLUTIONS[: RESOLUTIONS.index(resolution) + 1]
+    rows = (
+        MetricBucket.objects.filter(
+            metric__in=metrics, resolution__in=finer, start__gte=start, start__lt=end
+        )
+        .annotate(bucket=Trunc("start", resolution, tzinfo=dt_timezone.utc))
+        .values_list("metric", "bucket")
+        .annotate(total=Sum("value"))
+        .order_by()
+    )
+    data = {metric: [0] * points for metric in metrics}
+    for metric, bucket, total in rows:
+        data[metric][(bucket - start) // step] = (
+            float(total) if metric == "revenue" else int(total)
+        )
+
+    return {
+        "resolution": resolution,
+        "labels": [(start + index * step).isoformat() for index in range(points)],
+        "datasets": [
+            {"label": METRIC_LABELS[metric], "metric": metric, "data": data[metric]}
+            for metric in metrics
+        ],
+    }
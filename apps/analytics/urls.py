@@ -0,0 +1,16 @@
+"""
+URL configuration for the analytics app.
+"""
+
+from django.urls import path
+from . import views
+
+app_name = "analytics"
+
+urlpatterns = [
+    path(
+        "api/administration/series/",
+        views.timeseries_api,
+        name="timeseries_api",
+    ),
+]
@@ -0,0 +1,57 @@
+"""
+Views for the analytics app.
+"""
+
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_http_methods
+from apps.adminpanel.views import is_admin_panel_user
+from . import timeseries
+
+
+def _datetime_param(request, name, default):
+    """Aware datetime from an ISO 8601 query parameter (UTC when naive)."""
+    value = request.GET.get(name)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO 8601 datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_admin_panel_user)
+def timeseries_api(request):
+    """
+    API endpoint returning sales and entry time series ready for Chart.js.
+
+    GET /api/administration/series/?resolution=minute&metrics=orders,revenue
+        &start=2024-07-26T16:00:00Z&end=2024-07-26T18:00:00Z
+
+    resolution is minute, hour or day; metrics defaults to all of them and
+    the period defaults to the last hour, two days or thirty days.
+    """
+    resolution = request.GET.get("resolution", "minute")
+    metrics = [
+        metric for metric in request.GET.get("metrics", "").split(",") if metric
+    ] or list(timeseries.METRICS)
+    try:
+        end = _datetime_param(request, "end", timezone.now())
+        start = _datetime_param(
+            request,
+            "start",
+            end - timeseries.DEFAULT_WINDOWS.get(resolution, timedelta(0)),
+        )
+        data = timeseries.series(metrics, resolution, start, end)
+    except ValueError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    return JsonResponse({"success": True, **data})
@@ -0,0 +1,115 @@
+"""
+Panier des visiteurs non connectés.
+
+Le panier d'un visiteur anonyme est gardé dans un cookie signé
+({offer_id: quantité}) : parcourir les offres et remplir son panier
+n'écrit rien en base. Les prix et les noms viennent du catalogue en cache
+(apps.catalog.cache), sans requête SQL.
+
+A la connexion (ou à l'inscription), le panier du cookie est fusionné en
+une fois dans le panier en base (mutations.merge_items) et le cookie est
+supprimé par GuestCartMiddleware. Le stock n'est réservé qu'à ce moment-là.
+"""
+
+from decimal import Decimal
+from django.conf import settings
+from django.contrib import messages
+from django.core import signing
+from apps.catalog.cache import cached_active_offers
+from .mutations import merge_items
+
+GUEST_CART_COOKIE = "guest_cart"
+GUEST_CART_SALT = "apps.cart.guest"
+# Une offre ne peut pas dépasser cette quantité dans un panier invité
+MAX_GUEST_QUANTITY = 50
+
+
+class GuestCartItem:
+    """Ligne du panier invité, avec les attributs utilisés par cart.html."""
+
+    def __init__(self, offer, quantity):
+        # L'identifiant d'une ligne est celui de l'offre (une ligne par offre)
+        self.id = offer.id
+        self.offer = offer
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        """Prix total de la ligne."""
+        return self.offer.price * self.quantity
+
+
+def guest_cart_max_age():
+    """Durée de vie (secondes) du cookie du panier invité."""
+    return getattr(settings, "GUEST_CART_MAX_AGE", 604800)
+
+
+def read_guest_cart(request):
+    """Contenu du panier invité : {offer_id: quantité} (vide si cookie invalide)."""
+    value = request.COOKIES.get(GUEST_CART_COOKIE)
+    if not value:
+        return {}
+    try:
+        items = signing.loads(value, salt=GUEST_CART_SALT, max_age=guest_cart_max_age())
+        return {
+            int(offer_id): min(int(quantity), MAX_GUEST_QUANTITY)
+            for offer_id, quantity in items.items()
+            if int(quantity) > 0
+        }
+    except (signing.BadSignature, ValueError, TypeError, AttributeError):
+        return {}
+
+
+def store_guest_cart(response, items):
+    """Enregistre le panier invité dans le cookie (supprimé s'il est vide)."""
+    if not items:
+        response.delete_cookie(GUEST_CART_COOKIE)
+        return response
+    response.set_cookie(
+        GUEST_CART_COOKIE,
+        signing.dumps(
+            {str(offer_id): quantity for offer_id, quantity in items.items()},
+            salt=GUEST_CART_SALT,
+            compress=True,
+        ),
+        max_age=guest_cart_max_age(),
+        httponly=True,
+        samesite="Lax",
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+    return response
+
+
+def guest_cart_lines(items):
+    """Lignes du panier invité pour les offres encore actives, triées par prix."""
+    return [
+        GuestCartItem(offer, items[offer.id])
+        for offer in cached_active_offers()
+        if offer.id in items
+    ]
+
+
+def guest_cart_summary(lines):
+    """(items_count, total_amount) du panier invité."""
+    return (
+        sum(line.quantity for line in lines),
+        sum((line.total_price for line in lines), Decimal("0.00")),
+    )
+
+
+def merge_guest_cart(request, user):
+    """
+    Fusionne le panier du cookie dans le panier de l'utilisateur qui vient
+    de se connecter. Le cookie est supprimé par GuestCartMiddleware.
+    """
+    items = read_guest_cart(request)
+    if not items:
+        return
+    skipped, _ = merge_items(user, items)
+    request.guest_cart_merged = True
+    if skipped:
+        messages.warning(
+            request,
+            "Certains billets de votre panier ne sont plus disponibles "
+            "et n'ont pas été ajoutés.",
+        )
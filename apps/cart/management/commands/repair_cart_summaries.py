@@ -0,0 +1,45 @@
+"""
+Management command to check and repair the denormalized cart summaries.
+
+Cart.items_count and Cart.total_amount are maintained by the cart views; this
+command recomputes them from the cart items and fixes any drift (for example
+after items were deleted by a cascade or edited outside the views).
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from apps.cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Recompute Cart.items_count and Cart.total_amount from the cart items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the carts whose stored summary is out of date",
+        )
+
+    def handle(self, *args, **options):
+        expressions = Cart.summary_expressions()
+        drifted = Cart.objects.exclude(
+            Q(items_count=expressions["items_count"])
+            & Q(total_amount=expressions["total_amount"])
+        )
+        drifted_ids = list(drifted.values_list("id", flat=True))
+
+        if not drifted_ids:
+            self.stdout.write(self.style.SUCCESS("All cart summaries are consistent"))
+            return
+
+        if options["dry_run"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Dry run: {len(drifted_ids)} cart summaries are out of date"
+                )
+            )
+            return
+
+        updated = Cart.objects.filter(id__in=drifted_ids).update(**expressions)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {updated} cart summaries"))
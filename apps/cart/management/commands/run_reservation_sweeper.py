@@ -0,0 +1,56 @@
+"""
+Management command releasing expired cart reservations.
+
+Expired reservations are returned to the offer stock in batches (one short
+transaction per batch, rows locked by a request in progress are skipped).
+Run one instance next to the payment workers.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.cart.reservations import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Return expired cart reservations to the offer stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Reservations released per transaction (default: 500)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=30,
+            help="Seconds between two sweeps (default: 30)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Sweep once then exit instead of running forever",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        released = 0
+        try:
+            while True:
+                swept = expire_reservations(batch_size)
+                released += swept
+                if swept:
+                    self.stdout.write(f"Released {swept} expired reservations")
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Released {released} expired reservations in total")
+        )
@@ -0,0 +1,21 @@
+"""
+Middleware for the cart app.
+"""
+
+from .guest import GUEST_CART_COOKIE
+
+
+class GuestCartMiddleware:
+    """
+    Delete the guest cart cookie once its content has been merged into the
+    user's cart at login (see guest.merge_guest_cart).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, "guest_cart_merged", False):
+            response.delete_cookie(GUEST_CART_COOKIE, samesite="Lax")
+        return response
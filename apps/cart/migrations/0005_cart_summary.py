@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:04
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_summary(apps, schema_editor):
+    Cart = apps.get_model("cart", "Cart")
+    CartItem = apps.get_model("cart", "CartItem")
+    items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+    Cart.objects.update(
+        items_count=Coalesce(
+            Subquery(items.annotate(count=Sum("quantity")).values("count")), 0
+        ),
+        total_amount=Coalesce(
+            Subquery(
+                items.annotate(total=Sum(F("quantity") * F("offer__price"))).values(
+                    "total"
+                )
+            ),
+            Decimal("0.00"),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0004_alter_cart_options_alter_cartitem_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="items_count",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Nombre total d'articles (dénormalisé)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="total_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0.00"),
+                help_text="Prix total du panier (dénormalisé)",
+                max_digits=10,
+            ),
+        ),
+        migrations.RunPython(backfill_cart_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0005_cart_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="reserved_quantity",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Billets réservés dans le stock de l'offre"
+            ),
+        ),
+        migrations.AddField(
+            model_name="cartitem",
+            name="reserved_until",
+            field=models.DateTimeField(
+                blank=True, help_text="Fin de la réservation", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cartitem",
+            index=models.Index(
+                condition=models.Q(("reserved_quantity__gt", 0)),
+                fields=["reserved_until"],
+                name="cartitem_reservation_idx",
+            ),
+        ),
+    ]
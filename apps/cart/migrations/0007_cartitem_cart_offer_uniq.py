@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """Regroupe les articles en double (même panier, même offre) avant la contrainte."""
+    CartItem = apps.get_model("cart", "CartItem")
+    duplicates = (
+        CartItem.objects.values("cart_id", "offer_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        items = list(
+            CartItem.objects.filter(
+                cart_id=duplicate["cart_id"], offer_id=duplicate["offer_id"]
+            ).order_by("id")
+        )
+        kept, others = items[0], items[1:]
+        for item in others:
+            kept.quantity += item.quantity
+            kept.reserved_quantity += item.reserved_quantity
+            if item.reserved_until and (
+                kept.reserved_until is None or item.reserved_until > kept.reserved_until
+            ):
+                kept.reserved_until = item.reserved_until
+        kept.save(update_fields=["quantity", "reserved_quantity", "reserved_until"])
+        CartItem.objects.filter(id__in=[item.id for item in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0006_cartitem_reservation"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "offer"), name="cartitem_cart_offer_uniq"
+            ),
+        ),
+    ]
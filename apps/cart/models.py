@@ -8,7 +8,13 @@ J'ai créé ces modèles pour gérer le panier d'achat.
 C'est comme un panier de supermarché mais pour les billets !
 """
 
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.conf import settings
 from apps.catalog.models import Offer
 
@@ -21,6 +27,17 @@ class Cart(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cart"
     )
+    # Résumé dénormalisé lu par l'API du badge (une seule lecture indexée),
+    # mis à jour par différence dans mutations.py ou recalculé par refresh_summary.
+    items_count = models.PositiveIntegerField(
+        default=0, help_text="Nombre total d'articles (dénormalisé)"
+    )
+    total_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        help_text="Prix total du panier (dénormalisé)",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -42,6 +59,42 @@ class Cart(models.Model):
         """Calcule le nombre total d'articles dans le panier."""
         return sum(item.quantity for item in self.items.all())
 
+    @staticmethod
+    def summary_expressions():
+        """
+        Expressions (sous-requêtes) recalculant items_count et total_amount
+        à partir des articles, pour un UPDATE ensembliste des paniers.
+        """
+        items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+        return {
+            "items_count": Coalesce(
+                Subquery(items.annotate(count=Sum("quantity")).values("count")), 0
+            ),
+            "total_amount": Coalesce(
+                Subquery(
+                    items.annotate(total=Sum(F("quantity") * F("offer__price"))).values(
+                        "total"
+                    )
+                ),
+                Decimal("0.00"),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+        }
+
+    @classmethod
+    def refresh_summary(cls, cart_id):
+        """
+        Recalcule le résumé du panier en une requête UPDATE et retourne
+        (items_count, total_amount). A appeler dans la transaction qui modifie
+        les articles pour que le résumé reste cohérent.
+        """
+        cls.objects.filter(pk=cart_id).update(**cls.summary_expressions())
+        return (
+            cls.objects.filter(pk=cart_id)
+            .values_list("items_count", "total_amount")
+            .get()
+        )
+
 
 class CartItem(models.Model):
     """
@@ -51,6 +104,14 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     offer = models.ForeignKey(Offer, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Billets retirés du stock de l'offre pour cet article, jusqu'à
+    # reserved_until (voir reservations.py)
+    reserved_quantity = models.PositiveIntegerField(
+        default=0, help_text="Billets réservés dans le stock de l'offre"
+    )
+    reserved_until = models.DateTimeField(
+        null=True, blank=True, help_text="Fin de la réservation"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -58,6 +119,21 @@ class CartItem(models.Model):
         db_table = "cart_cartitem"
         verbose_name = "Article du panier"
         verbose_name_plural = "Articles du panier"
+        constraints = [
+            # Une seule ligne par offre : add_to_cart incrémente la quantité
+            # avec INSERT ... ON CONFLICT (voir mutations.py)
+            models.UniqueConstraint(
+                fields=["cart", "offer"], name="cartitem_cart_offer_uniq"
+            ),
+        ]
+        indexes = [
+            # Index partiel parcouru par le balayage des réservations expirées
+            models.Index(
+                fields=["reserved_until"],
+                name="cartitem_reservation_idx",
+                condition=models.Q(reserved_quantity__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.offer.name} dans le panier de {self.cart.user.email}"
@@ -66,3 +142,27 @@ class CartItem(models.Model):
     def total_price(self):
         """Calcule le prix total pour cet article."""
         return self.offer.price * self.quantity
+
+
+@receiver(post_save, sender=Offer)
+def refresh_carts_on_offer_change(sender, instance, created, **kwargs):
+    """
+    Recalcule le résumé des paniers contenant l'offre quand elle est modifiée
+    (changement de prix depuis l'admin par exemple).
+    """
+    if created:
+        return
+    Cart.objects.filter(items__offer=instance).update(**Cart.summary_expressions())
+
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    """
+    Reprend le panier rempli avant la connexion (ou l'inscription) dans le
+    panier de l'utilisateur (voir guest.py).
+    """
+    if request is None:
+        return
+    from .guest import merge_guest_cart
+
+    merge_guest_cart(request, user)
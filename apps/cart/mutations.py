@@ -0,0 +1,272 @@
+"""
+Modifications du panier (ajout, changement de quantité, retrait).
+
+Toutes les vues du panier passent par ces fonctions. Chacune verrouille la
+ligne du panier, modifie l'article en une requête et met à jour le résumé
+(items_count, total_amount) par différence avec les valeurs lues sous le
+verrou : il n'est plus recalculé à partir de tous les articles.
+
+L'ajout est un seul INSERT ... ON CONFLICT DO UPDATE : la contrainte
+unique (cart, offer) empêche les doublons (double clic) et la quantité est
+incrémentée dans la même requête, qui vérifie aussi que l'offre est active
+et retourne son prix.
+"""
+
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.catalog.inventory import SoldOut, reserve
+from apps.catalog.models import Offer
+from .models import Cart, CartItem
+from .reservations import drop, hold, reservation_ttl
+
+UPSERT_ITEM_SQL = f"""
+    INSERT INTO {CartItem._meta.db_table}
+        (cart_id, offer_id, quantity, reserved_quantity, reserved_until,
+         created_at, updated_at)
+    SELECT %s, id, %s, %s, %s, %s, %s
+    FROM {Offer._meta.db_table}
+    WHERE id = %s AND is_active
+    ON CONFLICT (cart_id, offer_id) DO UPDATE SET
+        quantity = {CartItem._meta.db_table}.quantity + excluded.quantity,
+        reserved_quantity =
+            {CartItem._meta.db_table}.reserved_quantity + excluded.reserved_quantity,
+        reserved_until = excluded.reserved_until,
+        updated_at = excluded.updated_at
+    RETURNING
+        quantity,
+        (SELECT price FROM {Offer._meta.db_table}
+         WHERE {Offer._meta.db_table}.id = {CartItem._meta.db_table}.offer_id),
+        (SELECT name FROM {Offer._meta.db_table}
+         WHERE {Offer._meta.db_table}.id = {CartItem._meta.db_table}.offer_id)
+"""
+
+
+def lock_cart(user):
+    """
+    Verrouille le panier de l'utilisateur (créé au besoin) pour la
+    transaction en cours et retourne (cart_id, items_count, total_amount).
+    """
+    locked = Cart.objects.select_for_update().filter(user=user)
+    row = locked.values_list("id", "items_count", "total_amount").first()
+    if row is None:
+        Cart.objects.get_or_create(user=user)
+        row = locked.values_list("id", "items_count", "total_amount").get()
+    return row
+
+
+def _store_summary(cart_id, items_count, total_amount):
+    """Enregistre le nouveau résumé du panier et le retourne."""
+    Cart.objects.filter(pk=cart_id).update(
+        items_count=items_count, total_amount=total_amount, updated_at=timezone.now()
+    )
+    return items_count, total_amount
+
+
+def _lock_item(cart_id, item_id):
+    """Verrouille un article du panier (lève CartItem.DoesNotExist)."""
+    return (
+        CartItem.objects.select_for_update(of=("self",))
+        .select_related("offer")
+        .get(id=item_id, cart_id=cart_id)
+    )
+
+
+def add_item(user, offer_id, quantity):
+    """
+    Ajoute `quantity` billets de l'offre au panier et les réserve.
+
+    Retourne (quantité de l'article, nom de l'offre, (items_count, total_amount)).
+    Lève Offer.DoesNotExist si l'offre n'est pas active, SoldOut si le stock
+    ne suffit pas.
+    """
+    if quantity < 1:
+        raise ValueError("La quantité doit être positive")
+    with transaction.atomic():
+        cart_id, items_count, total_amount = lock_cart(user)
+        reserve(offer_id, quantity)
+
+        now = timezone.now()
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPSERT_ITEM_SQL,
+                [
+                    cart_id,
+                    quantity,
+                    quantity,
+                    adapt(now + reservation_ttl()),
+                    adapt(now),
+                    adapt(now),
+                    offer_id,
+                ],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise Offer.DoesNotExist("Cette offre n'est pas disponible")
+
+        item_quantity, price, name = row
+        price = Offer._meta.get_field("price").to_python(price)
+        summary = _store_summary(
+            cart_id, items_count + quantity, total_amount + price * quantity
+        )
+    return item_quantity, name, summary
+
+
+def set_item_quantity(user, item_id, quantity):
+    """
+    Fixe la quantité d'un article (0 ou moins le retire) et ajuste sa réservation.
+
+    Retourne (article, (items_count, total_amount)). Lève CartItem.DoesNotExist
+    si l'article n'est pas dans le panier de l'utilisateur, SoldOut si le
+    stock ne suffit pas.
+    """
+    if quantity <= 0:
+        return remove_item(user, item_id)
+    with transaction.atomic():
+        cart_id, items_count, total_amount = lock_cart(user)
+        cart_item = _lock_item(cart_id, item_id)
+        delta = quantity - cart_item.quantity
+        hold(cart_item, quantity)
+        cart_item.quantity = quantity
+        cart_item.save(
+            update_fields=[
+                "quantity",
+                "reserved_quantity",
+                "reserved_until",
+                "updated_at",
+            ]
+        )
+        summary = _store_summary(
+            cart_id, items_count + delta, total_amount + cart_item.offer.price * delta
+        )
+    return cart_item, summary
+
+
+def remove_item(user, item_id):
+    """
+    Retire un article du panier et rend ses billets réservés au stock.
+
+    Retourne (article supprimé, (items_count, total_amount)).
+    """
+    with transaction.atomic():
+        cart_id, items_count, total_amount = lock_cart(user)
+        cart_item = _lock_item(cart_id, item_id)
+        drop(cart_item)
+        CartItem.objects.filter(pk=cart_item.pk).delete()
+        summary = _store_summary(
+            cart_id,
+            items_count - cart_item.quantity,
+            total_amount - cart_item.total_price,
+        )
+    return cart_item, summary
+
+
+def apply_quantities(user, quantities):
+    """
+    Applique plusieurs changements de quantité ({item_id: quantité}, 0 ou
+    moins retire l'article) dans une seule transaction : un verrou du
+    panier, une lecture des articles, un bulk_update, un DELETE et une
+    seule mise à jour du résumé.
+
+    Retourne (articles modifiés, ids retirés, (items_count, total_amount)).
+    Tout est annulé si un article n'existe pas (CartItem.DoesNotExist) ou
+    si le stock ne suffit pas (SoldOut).
+    """
+    with transaction.atomic():
+        cart_id, items_count, total_amount = lock_cart(user)
+        cart_items = list(
+            CartItem.objects.select_for_update(of=("self",))
+            .select_related("offer")
+            .filter(cart_id=cart_id, id__in=quantities)
+            # Ordre fixe des offres pour éviter les interblocages sur le stock
+            .order_by("offer_id")
+        )
+        if len(cart_items) != len(quantities):
+            raise CartItem.DoesNotExist("Article introuvable dans votre panier")
+
+        now = timezone.now()
+        updated, removed = [], []
+        for cart_item in cart_items:
+            quantity = max(quantities[cart_item.id], 0)
+            delta = quantity - cart_item.quantity
+            items_count += delta
+            total_amount += cart_item.offer.price * delta
+            if quantity:
+                hold(cart_item, quantity)
+                cart_item.quantity = quantity
+                cart_item.updated_at = now
+                updated.append(cart_item)
+            else:
+                drop(cart_item)
+                removed.append(cart_item.id)
+
+        CartItem.objects.bulk_update(
+            updated, ["quantity", "reserved_quantity", "reserved_until", "updated_at"]
+        )
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+        summary = _store_summary(cart_id, items_count, total_amount)
+    return updated, removed, summary
+
+
+def merge_items(user, quantities):
+    """
+    Fusionne un panier invité ({offer_id: quantité}) dans le panier de
+    l'utilisateur : les quantités s'ajoutent à celles déjà présentes et
+    sont réservées, le tout écrit par un seul bulk_create
+    (INSERT ... ON CONFLICT DO UPDATE).
+
+    Les offres inactives ou épuisées sont ignorées. Retourne
+    (ids des offres ignorées, (items_count, total_amount)).
+    """
+    with transaction.atomic():
+        cart_id, _, _ = lock_cart(user)
+        active = sorted(
+            Offer.objects.filter(id__in=quantities, is_active=True).values_list(
+                "id", flat=True
+            )
+        )
+        existing = {
+            cart_item.offer_id: cart_item
+            for cart_item in CartItem.objects.select_for_update().filter(
+                cart_id=cart_id, offer_id__in=active
+            )
+        }
+
+        now = timezone.now()
+        merged, skipped = [], [
+            offer_id for offer_id in quantities if offer_id not in active
+        ]
+        for offer_id in active:
+            quantity = quantities[offer_id]
+            try:
+                reserve(offer_id, quantity)
+            except SoldOut:
+                skipped.append(offer_id)
+                continue
+            current = existing.get(offer_id)
+            merged.append(
+                CartItem(
+                    cart_id=cart_id,
+                    offer_id=offer_id,
+                    quantity=quantity + (current.quantity if current else 0),
+                    reserved_quantity=quantity
+                    + (current.reserved_quantity if current else 0),
+                    reserved_until=now + reservation_ttl(),
+                    updated_at=now,
+                )
+            )
+
+        CartItem.objects.bulk_create(
+            merged,
+            update_conflicts=True,
+            unique_fields=["cart", "offer"],
+            update_fields=[
+                "quantity",
+                "reserved_quantity",
+                "reserved_until",
+                "updated_at",
+            ],
+        )
+        summary = Cart.refresh_summary(cart_id)
+    return skipped, summary
@@ -0,0 +1,89 @@
+"""
+Réservation du stock des offres pendant que les billets sont dans le panier.
+
+Ajouter un article (ou augmenter sa quantité) retire les billets du stock de
+l'offre (apps.catalog.inventory) pour CART_RESERVATION_TTL secondes : au
+moment de payer, l'utilisateur ne peut plus perdre ses billets au profit
+d'un autre acheteur. Chaque modification du panier prolonge la réservation.
+
+Les réservations expirées ne sont pas libérées pendant les requêtes : la
+commande run_reservation_sweeper les rend au stock par lots, en parcourant
+l'index partiel cartitem_reservation_idx (jamais toute la table).
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from apps.catalog.inventory import release, reserve
+from .models import CartItem
+
+
+def reservation_ttl():
+    """Durée d'une réservation de panier."""
+    return timedelta(seconds=getattr(settings, "CART_RESERVATION_TTL", 900))
+
+
+def hold(cart_item, quantity):
+    """
+    Ajuste la réservation de l'article à `quantity` billets et la prolonge.
+
+    Lève SoldOut si le stock ne suffit pas. L'article doit être verrouillé
+    (select_for_update) par l'appelant, qui l'enregistre ensuite.
+    """
+    delta = quantity - cart_item.reserved_quantity
+    if delta > 0:
+        reserve(cart_item.offer_id, delta)
+    elif delta < 0:
+        release(cart_item.offer_id, -delta)
+    cart_item.reserved_quantity = quantity
+    cart_item.reserved_until = timezone.now() + reservation_ttl() if quantity else None
+
+
+def drop(cart_item):
+    """Rend au stock les billets réservés par un article retiré du panier."""
+    if cart_item.reserved_quantity:
+        release(cart_item.offer_id, cart_item.reserved_quantity)
+        cart_item.reserved_quantity = 0
+        cart_item.reserved_until = None
+
+
+def expire_batch(batch_size=500, now=None):
+    """
+    Libère au plus `batch_size` réservations expirées et retourne leur nombre.
+
+    Les articles verrouillés par une requête en cours sont ignorés
+    (SKIP LOCKED) : ils seront repris au prochain passage.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(
+            CartItem.objects.select_for_update(skip_locked=True)
+            .filter(reserved_quantity__gt=0, reserved_until__lte=now)
+            .order_by("reserved_until")
+            .values_list("id", "offer_id", "reserved_quantity")[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        quantities = {}
+        for _, offer_id, quantity in expired:
+            quantities[offer_id] = quantities.get(offer_id, 0) + quantity
+        # Ordre fixe des offres pour éviter les interblocages avec les paiements
+        for offer_id in sorted(quantities):
+            release(offer_id, quantities[offer_id])
+        CartItem.objects.filter(id__in=[item_id for item_id, _, _ in expired]).update(
+            reserved_quantity=0, reserved_until=None
+        )
+    return len(expired)
+
+
+def expire_reservations(batch_size=500):
+    """Libère toutes les réservations expirées, lot par lot. Retourne leur nombre."""
+    now = timezone.now()
+    total = 0
+    while True:
+        released = expire_batch(batch_size, now)
+        total += released
+        if released < batch_size:
+            return total
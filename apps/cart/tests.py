@@ -0,0 +1,534 @@
+"""
+Tests for the cart app.
+"""
+
+import json
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from apps.cart.guest import GUEST_CART_COOKIE
+from apps.cart.models import Cart, CartItem
+from apps.catalog.cache import bump_catalog_version, get_cached_offer
+from apps.catalog.inventory import remaining_stock, set_quota
+from apps.catalog.models import Offer
+from apps.orders.models import Order, PaymentJob
+from apps.orders.payments import claim_jobs, process_job
+
+User = get_user_model()
+
+
+class CartSummaryTest(TestCase):
+    """Test cases for the denormalized cart summary."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.solo = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.duo = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def post_json(self, url_name, data):
+        return self.client.post(
+            reverse(url_name),
+            data=json.dumps(data),
+            content_type="application/json",
+        ).json()
+
+    def stored_summary(self):
+        return Cart.objects.values_list("items_count", "total_amount").get(
+            user=self.user
+        )
+
+    def test_add_to_cart_updates_summary(self):
+        """Test that adding items keeps the stored summary in sync."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+        data = self.post_json(
+            "cart:add_to_cart", {"offer_id": self.duo.id, "quantity": 1}
+        )
+
+        self.assertTrue(data["success"])
+        self.assertEqual(data["cart_total"], 3)
+        self.assertEqual(data["cart_price"], 190.0)
+        self.assertEqual(self.stored_summary(), (3, Decimal("190.00")))
+
+    def test_update_and_remove_update_summary(self):
+        """Test quantity updates and removals through the AJAX views."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 1})
+        self.post_json("cart:add_to_cart", {"offer_id": self.duo.id, "quantity": 1})
+        item = CartItem.objects.get(offer=self.solo)
+
+        data = self.post_json(
+            "cart:update_quantity_ajax", {"item_id": item.id, "quantity": 3}
+        )
+        self.assertEqual(data["total_items"], 4)
+        self.assertEqual(data["item_total"], 150.0)
+        self.assertEqual(self.stored_summary(), (4, Decimal("240.00")))
+
+        data = self.post_json("cart:remove_item_ajax", {"item_id": item.id})
+        self.assertEqual(data["total_items"], 1)
+        self.assertEqual(self.stored_summary(), (1, Decimal("90.00")))
+
+    def test_summary_api_reads_stored_summary(self):
+        """Test the cart badge endpoint (session, user and one cart read)."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("cart:summary_api"))
+
+        self.assertEqual(
+            response.json(),
+            {"authenticated": True, "items_count": 2, "total_price": 100.0},
+        )
+        self.assertEqual(response["Cache-Control"], "private, no-store")
+
+    def test_summary_api_for_anonymous_user(self):
+        """Test that anonymous visitors get an empty guest cart and a CSRF token."""
+        self.client.logout()
+
+        data = self.client.get(reverse("cart:summary_api")).json()
+
+        self.assertFalse(data["authenticated"])
+        self.assertEqual(data["items_count"], 0)
+        self.assertTrue(data["csrf_token"])
+
+    def test_offer_price_change_refreshes_carts(self):
+        """Test that changing an offer price refreshes the carts containing it."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+
+        self.solo.price = Decimal("60.00")
+        self.solo.save()
+
+        self.assertEqual(self.stored_summary(), (2, Decimal("120.00")))
+
+    def test_repair_command_fixes_drift(self):
+        """Test the repair_cart_summaries command."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+        Cart.objects.filter(user=self.user).update(items_count=7)
+
+        out = StringIO()
+        call_command("repair_cart_summaries", "--dry-run", stdout=out)
+        self.assertIn("1 cart summaries are out of date", out.getvalue())
+        self.assertEqual(self.stored_summary()[0], 7)
+
+        out = StringIO()
+        call_command("repair_cart_summaries", stdout=out)
+        self.assertIn("Repaired 1 cart summaries", out.getvalue())
+        self.assertEqual(self.stored_summary(), (2, Decimal("100.00")))
+
+
+@override_settings(PAYMENT_PSP_DELAY=0)
+class CheckoutPaymentTest(TestCase):
+    """Test cases for the queued checkout payment views."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, offer=self.offer, quantity=2)
+        Cart.refresh_summary(cart.id)
+        self.client.force_login(self.user)
+
+    def pay(self):
+        return self.client.post(
+            reverse("cart:process_payment"),
+            data=json.dumps(
+                {"payment_method": "card", "card_number": "4242 4242 4242 4242"}
+            ),
+            content_type="application/json",
+        )
+
+    def test_process_payment_enqueues_job(self):
+        """Test that checkout answers immediately with a job id."""
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        job = PaymentJob.objects.get(id=data["job_id"])
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(
+            data["status_url"], reverse("cart:payment_status", args=[job.id])
+        )
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_payment_status_follows_job(self):
+        """Test the status endpoint before and after the worker ran."""
+        status_url = self.pay().json()["status_url"]
+        self.assertEqual(self.client.get(status_url).json()["status"], "queued")
+
+        for job in claim_jobs():
+            process_job(job)
+
+        data = self.client.get(status_url).json()
+        self.assertEqual(data["status"], "succeeded")
+        self.assertEqual(len(data["orders"]), 2)
+        self.assertEqual(data["redirect_url"], "/mes-billets/")
+
+    def test_payment_status_is_private(self):
+        """Test that a user cannot read another user's payment job."""
+        status_url = self.pay().json()["status_url"]
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="testpass123"
+        )
+        self.client.force_login(other)
+
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+
+class CartMutationTest(TestCase):
+    """Test cases for the upsert-based cart mutations."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def add(self, offer_id, quantity=1):
+        return self.client.post(
+            reverse("cart:add_to_cart"),
+            data=json.dumps({"offer_id": offer_id, "quantity": quantity}),
+            content_type="application/json",
+        )
+
+    def test_repeated_add_increments_single_item(self):
+        """Test that adding the same offer twice updates one row."""
+        self.add(self.offer.id, 2)
+        data = self.add(self.offer.id, 1).json()
+
+        item = CartItem.objects.get()
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(item.reserved_quantity, 3)
+        self.assertGreater(item.reserved_until, timezone.now())
+        self.assertEqual(data["cart_total"], 3)
+        self.assertEqual(data["cart_price"], 150.0)
+        self.assertIn("(+1)", data["message"])
+
+    def test_add_runs_constant_number_of_queries(self):
+        """Test that an add is a lock, an upsert and a summary update."""
+        self.add(self.offer.id)
+        with self.assertNumQueries(8):
+            # session, user, savepoint, cart lock, stock read, upsert, summary
+            # update, release savepoint
+            self.add(self.offer.id)
+
+    def test_inactive_offer_is_refused(self):
+        """Test that the upsert does not insert items for inactive offers."""
+        Offer.objects.filter(pk=self.offer.pk).update(is_active=False)
+
+        response = self.add(self.offer.id)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_other_users_item_is_not_found(self):
+        """Test that an item of another cart cannot be changed."""
+        self.add(self.offer.id)
+        item = CartItem.objects.get()
+        other = User.objects.create_user(
+            email="other@example.com", username="other", password="testpass123"
+        )
+        self.client.force_login(other)
+
+        response = self.client.post(
+            reverse("cart:update_quantity_ajax"),
+            data=json.dumps({"item_id": item.id, "quantity": 5}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class CartBatchUpdateTest(TestCase):
+    """Test cases for the batch cart update API."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        solo = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        duo = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        self.solo_item = CartItem.objects.create(cart=self.cart, offer=solo, quantity=1)
+        self.duo_item = CartItem.objects.create(cart=self.cart, offer=duo, quantity=1)
+        Cart.refresh_summary(self.cart.id)
+        self.client.force_login(self.user)
+
+    def batch(self, operations):
+        return self.client.post(
+            reverse("cart:update_cart_batch"),
+            data=json.dumps({"operations": operations}),
+            content_type="application/json",
+        )
+
+    def test_batch_applies_all_operations(self):
+        """Test quantity changes and removals in one request."""
+        response = self.batch(
+            [
+                {"item_id": self.solo_item.id, "quantity": 2},
+                {"item_id": self.solo_item.id, "quantity": 3},
+                {"item_id": self.duo_item.id, "quantity": 0},
+            ]
+        )
+
+        data = response.json()
+        self.assertTrue(data["success"])
+        self.assertEqual(data["items"][str(self.solo_item.id)]["quantity"], 3)
+        self.assertEqual(data["items"][str(self.solo_item.id)]["item_total"], 150.0)
+        self.assertEqual(data["removed"], [self.duo_item.id])
+        self.assertEqual(data["total_items"], 3)
+        self.assertEqual(data["cart_total"], 150.0)
+        self.assertEqual(
+            list(CartItem.objects.values_list("id", "quantity")),
+            [(self.solo_item.id, 3)],
+        )
+        self.assertEqual(
+            Cart.objects.values_list("items_count", "total_amount").get(),
+            (3, Decimal("150.00")),
+        )
+
+    def test_batch_is_all_or_nothing(self):
+        """Test that an unknown item cancels the whole batch."""
+        response = self.batch(
+            [
+                {"item_id": self.solo_item.id, "quantity": 4},
+                {"item_id": self.duo_item.id + 100, "quantity": 1},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.solo_item.refresh_from_db()
+        self.assertEqual(self.solo_item.quantity, 1)
+
+    def test_batch_rejects_invalid_payload(self):
+        """Test that malformed operations are refused."""
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{"item_id": "x"}]).status_code, 400)
+
+
+@override_settings(PAYMENT_PSP_DELAY=0)
+class CartReservationTest(TestCase):
+    """Test cases for the stock held by cart items."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        set_quota(self.offer, 5, shards=2)
+        self.client.force_login(self.user)
+
+    def post_json(self, url_name, data):
+        return self.client.post(
+            reverse(url_name), data=json.dumps(data), content_type="application/json"
+        )
+
+    def add(self, quantity):
+        return self.post_json(
+            "cart:add_to_cart", {"offer_id": self.offer.id, "quantity": quantity}
+        )
+
+    def test_add_and_update_hold_stock(self):
+        """Test that cart changes take and give back stock."""
+        self.add(2)
+        item = CartItem.objects.get()
+        self.assertEqual(item.reserved_quantity, 2)
+        self.assertGreater(item.reserved_until, timezone.now())
+        self.assertEqual(remaining_stock(self.offer.id), 3)
+
+        self.post_json("cart:update_quantity_ajax", {"item_id": item.id, "quantity": 1})
+        self.assertEqual(remaining_stock(self.offer.id), 4)
+
+        self.post_json("cart:remove_item_ajax", {"item_id": item.id})
+        self.assertEqual(remaining_stock(self.offer.id), 5)
+
+    def test_add_beyond_stock_is_refused(self):
+        """Test that a cart cannot hold more tickets than the stock."""
+        self.add(4)
+        response = self.add(2)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+        self.assertEqual(remaining_stock(self.offer.id), 1)
+
+    def test_sweeper_releases_expired_reservations(self):
+        """Test that expired reservations go back to the stock in batches."""
+        self.add(3)
+        CartItem.objects.update(reserved_until=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command("run_reservation_sweeper", "--once", "--batch-size=1", stdout=out)
+
+        item = CartItem.objects.get()
+        self.assertEqual(item.reserved_quantity, 0)
+        self.assertIsNone(item.reserved_until)
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(remaining_stock(self.offer.id), 5)
+        self.assertIn("Released 1 expired reservations in total", out.getvalue())
+
+    def test_payment_consumes_reservation(self):
+        """Test that paying uses the held tickets instead of taking more."""
+        self.add(2)
+        self.post_json(
+            "cart:process_payment",
+            {"payment_method": "card", "card_number": "4242 4242 4242 4242"},
+        )
+
+        for job in claim_jobs():
+            self.assertTrue(process_job(job))
+
+        self.assertEqual(Order.objects.filter(status="paid").count(), 2)
+        self.assertEqual(remaining_stock(self.offer.id), 3)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class GuestCartTest(TestCase):
+    """Test cases for the cookie cart of anonymous visitors."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.solo = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.duo = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+        bump_catalog_version()
+
+    def post_json(self, url_name, data):
+        return self.client.post(
+            reverse(url_name), data=json.dumps(data), content_type="application/json"
+        )
+
+    def test_guest_add_writes_no_rows(self):
+        """Test that an anonymous add only sets the signed cookie."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+        data = self.post_json(
+            "cart:add_to_cart", {"offer_id": self.duo.id, "quantity": 1}
+        ).json()
+
+        self.assertTrue(data["success"])
+        self.assertEqual(data["cart_total"], 3)
+        self.assertEqual(data["cart_price"], 190.0)
+        self.assertIn(GUEST_CART_COOKIE, self.client.cookies)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+        summary = self.client.get(reverse("cart:summary_api")).json()
+        self.assertFalse(summary["authenticated"])
+        self.assertEqual(summary["items_count"], 3)
+        self.assertTrue(summary["csrf_token"])
+
+    def test_guest_add_rechecks_stale_snapshot(self):
+        """Test that a deactivated or repriced offer is caught on add."""
+        # Changements sans signal : le catalogue en cache n'est pas invalidé
+        Offer.objects.filter(id=self.solo.id).update(is_active=False)
+        Offer.objects.filter(id=self.duo.id).update(price=Decimal("99.00"))
+
+        response = self.post_json("cart:add_to_cart", {"offer_id": self.solo.id})
+        data = self.post_json("cart:add_to_cart", {"offer_id": self.duo.id}).json()
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data["cart_price"], 99.0)
+        self.assertIsNone(get_cached_offer(self.solo.id))
+
+    def test_guest_cart_page_and_batch_update(self):
+        """Test the cart page and stepper updates for a guest cart."""
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 1})
+
+        response = self.client.get(reverse("cart:cart"))
+        self.assertContains(response, f'data-item-id="{self.solo.id}"')
+
+        data = self.post_json(
+            "cart:update_cart_batch",
+            {"operations": [{"item_id": self.solo.id, "quantity": 4}]},
+        ).json()
+        self.assertEqual(data["items"][str(self.solo.id)]["quantity"], 4)
+        self.assertEqual(data["cart_total"], 200.0)
+
+    def test_tampered_cookie_is_ignored(self):
+        """Test that an unsigned guest cart is treated as empty."""
+        self.client.cookies[GUEST_CART_COOKIE] = "forged"
+
+        summary = self.client.get(reverse("cart:summary_api")).json()
+
+        self.assertEqual(summary["items_count"], 0)
+
+    def test_login_merges_guest_cart(self):
+        """Test that the guest cart is merged into the user's cart at login."""
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, offer=self.solo, quantity=1)
+        Cart.refresh_summary(cart.id)
+        self.post_json("cart:add_to_cart", {"offer_id": self.solo.id, "quantity": 2})
+        self.post_json("cart:add_to_cart", {"offer_id": self.duo.id, "quantity": 1})
+
+        response = self.client.post(
+            reverse("users:login") + "?next=" + reverse("cart:cart"),
+            {"email": "test@example.com", "password": "testpass123"},
+        )
+
+        self.assertRedirects(response, reverse("cart:cart"))
+        self.assertEqual(response.cookies[GUEST_CART_COOKIE]["max-age"], 0)
+        self.assertEqual(
+            dict(CartItem.objects.values_list("offer_id", "quantity")),
+            {self.solo.id: 3, self.duo.id: 1},
+        )
+        self.assertEqual(CartItem.objects.get(offer=self.duo).reserved_quantity, 1)
+        cart.refresh_from_db()
+        self.assertEqual(cart.items_count, 4)
+        self.assertEqual(cart.total_amount, Decimal("240.00"))
@@ -9,6 +9,7 @@ app_name = "cart"
 
 urlpatterns = [
     path("panier/", views.cart_view, name="cart"),
+    path("panier/resume/", views.cart_summary_api, name="summary_api"),
     path("panier/ajouter/", views.add_to_cart, name="add_to_cart"),
     path(
         "panier/modifier/<int:item_id>/",
@@ -26,6 +27,12 @@ urlpatterns = [
         name="update_quantity_ajax",
     ),
     path("panier/supprimer/", views.remove_item_ajax, name="remove_item_ajax"),
+    path("panier/modifier-lot/", views.update_cart_batch, name="update_cart_batch"),
     path("panier/finaliser/", views.checkout_view, name="checkout"),
     path("panier/paiement/", views.process_payment, name="process_payment"),
+    path(
+        "panier/paiement/<int:job_id>/statut/",
+        views.payment_status,
+        name="payment_status",
+    ),
 ]
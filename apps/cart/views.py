@@ -6,23 +6,131 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.middleware.csrf import get_token
+from django.urls import reverse
 from django.views.decorators.http import require_POST
 import json
+from .guest import (
+    MAX_GUEST_QUANTITY,
+    guest_cart_lines,
+    guest_cart_summary,
+    read_guest_cart,
+    store_guest_cart,
+)
 from .models import Cart, CartItem
+from .mutations import add_item, apply_quantities, remove_item, set_item_quantity
+from apps.catalog.cache import bump_catalog_version, get_cached_offer
+from apps.catalog.inventory import SoldOut
 from apps.catalog.models import Offer
+from apps.orders.idempotency import idempotent
+from apps.orders.models import PaymentJob
+from apps.orders.payments import enqueue_payment
+
+MAX_BATCH_OPERATIONS = 50
+
+
+def _sold_out(error):
+    """JSON response for a cart change refused for lack of stock."""
+    return JsonResponse({"success": False, "message": str(error)}, status=409)
+
+
+def _item_not_found():
+    """JSON response for an item that is not in the user's cart."""
+    return JsonResponse(
+        {"success": False, "message": "Article introuvable dans votre panier"},
+        status=404,
+    )
+
+
+def cart_summary_api(request):
+    """
+    Return the cart badge data of the current user (hydrates base.html).
+
+    GET /panier/resume/
+
+    Anonymous visitors get their guest cart and a CSRF token: the cached
+    pages they are served do not contain one.
+    """
+    summary = {"authenticated": request.user.is_authenticated}
+    if request.user.is_authenticated:
+        items_count, total_amount = Cart.objects.filter(user=request.user).values_list(
+            "items_count", "total_amount"
+        ).first() or (0, 0)
+    else:
+        items_count, total_amount = guest_cart_summary(
+            guest_cart_lines(read_guest_cart(request))
+        )
+        summary["csrf_token"] = get_token(request)
+    summary.update(items_count=items_count, total_price=float(total_amount))
+
+    response = JsonResponse(summary)
+    response["Cache-Control"] = "private, no-store"
+    return response
 
 
-@login_required
 def cart_view(request):
     """
-    Display the shopping cart.
+    Display the shopping cart (the cookie guest cart for anonymous visitors).
     """
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    context = {"cart": cart, "title": "Mon Panier"}
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        cart_items = cart.items.select_related("offer")
+        items_count, total_amount = cart.items_count, cart.total_amount
+    else:
+        cart_items = guest_cart_lines(read_guest_cart(request))
+        items_count, total_amount = guest_cart_summary(cart_items)
+
+    context = {
+        "cart_items": cart_items,
+        "items_count": items_count,
+        "total_amount": total_amount,
+        "title": "Mon Panier",
+    }
     return render(request, "cart/cart.html", context)
 
 
-@login_required
+def _add_to_guest_cart(request, offer_id, quantity):
+    """Add an offer to the cookie guest cart (no database write)."""
+    # Availability and price are re-checked in the database: another worker
+    # may still serve a catalog snapshot older than the last offer change
+    offer = (
+        Offer.objects.filter(id=offer_id, is_active=True)
+        .values("id", "name", "price")
+        .first()
+    )
+    cached = get_cached_offer(offer_id)
+    if (offer is None) != (cached is None) or (
+        offer is not None and offer["price"] != cached["price"]
+    ):
+        # Snapshot out of date: refreshed by every process
+        bump_catalog_version()
+    if offer is None:
+        return JsonResponse(
+            {"success": False, "message": "Cette offre n'est pas disponible"},
+            status=404,
+        )
+
+    items = read_guest_cart(request)
+    previous = items.get(offer_id, 0)
+    items[offer_id] = min(previous + quantity, MAX_GUEST_QUANTITY)
+    items_count, total_amount = guest_cart_summary(guest_cart_lines(items))
+
+    offer_label = dict(Offer.OFFER_TYPES).get(offer["name"], offer["name"])
+    if previous:
+        message = f"Quantité de l'offre {offer_label} mise à jour (+{quantity})"
+    else:
+        message = f"Offre {offer_label} ajoutée au panier"
+    response = JsonResponse(
+        {
+            "success": True,
+            "message": message,
+            "cart_total": items_count,
+            "cart_price": float(total_amount),
+        }
+    )
+    return store_guest_cart(response, items)
+
+
 @require_POST
 def add_to_cart(request):
     """
@@ -32,33 +140,38 @@ def add_to_cart(request):
         data = json.loads(request.body)
         offer_id = data.get("offer_id")
         quantity = int(data.get("quantity", 1))
+        if quantity < 1:
+            raise ValueError("La quantité doit être positive")
 
-        offer = get_object_or_404(Offer, id=offer_id, is_active=True)
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        if not request.user.is_authenticated:
+            return _add_to_guest_cart(request, int(offer_id), quantity)
 
-        # Check if this offer already exists in the cart
-        try:
-            cart_item = CartItem.objects.get(cart=cart, offer=offer)
-            # If it exists, increment the quantity
-            cart_item.quantity += quantity
-            cart_item.save()
-            message = f"Quantité de l'offre {offer.get_name_display()} mise à jour (+{quantity})"
-        except CartItem.DoesNotExist:
-            # If it doesn't exist, create a new item
-            cart_item = CartItem.objects.create(
-                cart=cart, offer=offer, quantity=quantity
-            )
-            message = f"Offre {offer.get_name_display()} ajoutée au panier"
+        # One upsert creates the item or increments its quantity
+        item_quantity, offer_name, (items_count, total_amount) = add_item(
+            request.user, int(offer_id), quantity
+        )
+        offer_label = dict(Offer.OFFER_TYPES).get(offer_name, offer_name)
+        if item_quantity > quantity:
+            message = f"Quantité de l'offre {offer_label} mise à jour (+{quantity})"
+        else:
+            message = f"Offre {offer_label} ajoutée au panier"
 
         return JsonResponse(
             {
                 "success": True,
                 "message": message,
-                "cart_total": cart.total_items,
-                "cart_price": float(cart.total_price),
+                "cart_total": items_count,
+                "cart_price": float(total_amount),
             }
         )
 
+    except Offer.DoesNotExist:
+        return JsonResponse(
+            {"success": False, "message": "Cette offre n'est pas disponible"},
+            status=404,
+        )
+    except SoldOut as e:
+        return _sold_out(e)
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Erreur: {str(e)}"})
 
@@ -73,27 +186,28 @@ def update_cart_item(request, item_id):
         data = json.loads(request.body)
         quantity = int(data.get("quantity", 1))
 
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-
+        cart_item, (items_count, total_amount) = set_item_quantity(
+            request.user, item_id, quantity
+        )
         if quantity <= 0:
-            cart_item.delete()
             message = f"{cart_item.offer.name} retiré du panier"
         else:
-            cart_item.quantity = quantity
-            cart_item.save()
             message = f"Quantité de {cart_item.offer.name} mise à jour"
 
-        cart = cart_item.cart
         return JsonResponse(
             {
                 "success": True,
                 "message": message,
-                "cart_total": cart.total_items,
-                "cart_price": float(cart.total_price),
+                "cart_total": items_count,
+                "cart_price": float(total_amount),
                 "item_total": float(cart_item.total_price) if quantity > 0 else 0,
             }
         )
 
+    except CartItem.DoesNotExist:
+        return _item_not_found()
+    except SoldOut as e:
+        return _sold_out(e)
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Erreur: {str(e)}"})
 
@@ -105,20 +219,19 @@ def remove_from_cart(request, item_id):
     Remove an item from the cart.
     """
     try:
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        offer_name = cart_item.offer.name
-        cart_item.delete()
+        cart_item, (items_count, total_amount) = remove_item(request.user, item_id)
 
-        cart = Cart.objects.get(user=request.user)
         return JsonResponse(
             {
                 "success": True,
-                "message": f"{offer_name} retiré du panier",
-                "cart_total": cart.total_items,
-                "cart_price": float(cart.total_price),
+                "message": f"{cart_item.offer.name} retiré du panier",
+                "cart_total": items_count,
+                "cart_price": float(total_amount),
             }
         )
 
+    except CartItem.DoesNotExist:
+        return _item_not_found()
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Erreur: {str(e)}"})
 
@@ -140,6 +253,7 @@ def checkout_view(request):
 
 @login_required
 @require_POST
+@idempotent
 def process_payment(request):
     """
     Process payment (mock implementation).
@@ -168,55 +282,56 @@ def process_payment(request):
                 {"success": False, "message": "Méthode de paiement invalide."}
             )
 
-        # Simulate payment processing
-        import time
-
-        time.sleep(1)  # Simulate processing time
-
-        # Create orders for each individual ticket (one per quantity)
-        from apps.orders.models import Order
-        from apps.tickets.models import Ticket
+        # The payment itself runs in the payment worker (run_payment_worker):
+        # the web worker only records the job and answers immediately.
+        job = enqueue_payment(request.user, cart, payment_method)
 
-        orders = []
-        tickets = []
+        return JsonResponse(
+            {
+                "success": True,
+                "message": "Paiement en cours de traitement...",
+                "job_id": job.id,
+                "status_url": reverse("cart:payment_status", args=[job.id]),
+            },
+            status=202,
+        )
 
-        for item in cart.items.all():
-            # Create one order per individual ticket
-            for i in range(item.quantity):
-                order = Order.objects.create(
-                    user=request.user,
-                    offer=item.offer,
-                    status="paid",
-                    amount=item.offer.price,  # Price per individual ticket
-                )
-                orders.append(order)
+    except Exception as e:
+        return JsonResponse(
+            {"success": False, "message": f"Erreur lors du paiement: {str(e)}"},
+            status=500,
+        )
 
-                # Create ticket immediately for each order
-                ticket = Ticket.objects.create(
-                    order=order,
-                    user=order.user,
-                    final_key=f"{order.user.key1}_{order.id}_{order.created_at.timestamp()}",
-                )
-                # Generate QR code
-                ticket.generate_qr_code()
-                tickets.append(ticket)
 
-        # Clear the cart
-        cart.items.all().delete()
+@login_required
+def payment_status(request, job_id):
+    """
+    Return the status of a queued payment (polled by the checkout page).
+    """
+    job = get_object_or_404(PaymentJob, id=job_id, user=request.user)
 
+    if job.status == "succeeded":
         return JsonResponse(
             {
                 "success": True,
-                "message": f"Paiement effectué avec succès ! {len(orders)} billet(s) généré(s).",
-                "orders": [order.id for order in orders],
-                "redirect_url": "/mes-billets/" if orders else "/",
+                "status": job.status,
+                "message": (
+                    "Paiement effectué avec succès ! "
+                    f"{len(job.order_ids)} billet(s) généré(s)."
+                ),
+                "orders": job.order_ids,
+                "redirect_url": "/mes-billets/" if job.order_ids else "/",
             }
         )
-
-    except Exception as e:
+    if job.status == "failed":
         return JsonResponse(
-            {"success": False, "message": f"Erreur lors du paiement: {str(e)}"}
+            {
+                "success": False,
+                "status": job.status,
+                "message": f"Erreur lors du paiement: {job.error}",
+            }
         )
+    return JsonResponse({"success": True, "status": job.status})
 
 
 @login_required
@@ -230,32 +345,23 @@ def update_quantity_ajax(request):
         item_id = data.get("item_id")
         quantity = int(data.get("quantity", 1))
 
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+        cart_item, (items_count, total_amount) = set_item_quantity(
+            request.user, item_id, quantity
+        )
 
-        if quantity <= 0:
-            cart_item.delete()
-            cart = Cart.objects.get(user=request.user)
-            return JsonResponse(
-                {
-                    "success": True,
-                    "total_items": cart.total_items,
-                    "cart_total": float(cart.total_price),
-                    "item_total": 0,
-                }
-            )
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
-            cart = cart_item.cart
-            return JsonResponse(
-                {
-                    "success": True,
-                    "total_items": cart.total_items,
-                    "cart_total": float(cart.total_price),
-                    "item_total": float(cart_item.total_price),
-                }
-            )
+        return JsonResponse(
+            {
+                "success": True,
+                "total_items": items_count,
+                "cart_total": float(total_amount),
+                "item_total": float(cart_item.total_price) if quantity > 0 else 0,
+            }
+        )
 
+    except CartItem.DoesNotExist:
+        return _item_not_found()
+    except SoldOut as e:
+        return _sold_out(e)
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Erreur: {str(e)}"})
 
@@ -270,17 +376,113 @@ def remove_item_ajax(request):
         data = json.loads(request.body)
         item_id = data.get("item_id")
 
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        cart_item.delete()
+        cart_item, (items_count, total_amount) = remove_item(request.user, item_id)
 
-        cart = Cart.objects.get(user=request.user)
         return JsonResponse(
             {
                 "success": True,
-                "total_items": cart.total_items,
-                "cart_total": float(cart.total_price),
+                "total_items": items_count,
+                "cart_total": float(total_amount),
             }
         )
 
+    except CartItem.DoesNotExist:
+        return _item_not_found()
     except Exception as e:
         return JsonResponse({"success": False, "message": f"Erreur: {str(e)}"})
+
+
+def _update_guest_cart(request, quantities):
+    """Apply batch quantity changes to the cookie guest cart."""
+    items = read_guest_cart(request)
+    if any(offer_id not in items for offer_id in quantities):
+        return _item_not_found()
+
+    removed = []
+    for offer_id, quantity in quantities.items():
+        if quantity > 0:
+            items[offer_id] = min(quantity, MAX_GUEST_QUANTITY)
+        else:
+            del items[offer_id]
+            removed.append(offer_id)
+    lines = guest_cart_lines(items)
+    items_count, total_amount = guest_cart_summary(lines)
+
+    response = JsonResponse(
+        {
+            "success": True,
+            "items": {
+                line.id: {
+                    "quantity": line.quantity,
+                    "item_total": float(line.total_price),
+                }
+                for line in lines
+                if line.id in quantities
+            },
+            "removed": removed,
+            "total_items": items_count,
+            "cart_total": float(total_amount),
+        }
+    )
+    return store_guest_cart(response, items)
+
+
+@require_POST
+def update_cart_batch(request):
+    """
+    Apply several quantity changes at once (debounced stepper clicks).
+
+    POST /panier/modifier-lot/
+    {"operations": [{"item_id": 1, "quantity": 3}, {"item_id": 2, "quantity": 0}]}
+
+    A quantity of 0 removes the item. The operations are applied in one
+    transaction with a single cart total update: either all of them succeed
+    or none does. For anonymous visitors, item ids are offer ids of the
+    guest cart.
+    """
+    try:
+        data = json.loads(request.body)
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("operations doit être une liste non vide")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise ValueError(
+                f"{MAX_BATCH_OPERATIONS} modifications au maximum par requête"
+            )
+        # The last operation on an item wins
+        quantities = {
+            int(operation["item_id"]): int(operation["quantity"])
+            for operation in operations
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse(
+            {"success": False, "message": f"Requête invalide: {str(e)}"}, status=400
+        )
+
+    if not request.user.is_authenticated:
+        return _update_guest_cart(request, quantities)
+
+    try:
+        updated, removed, (items_count, total_amount) = apply_quantities(
+            request.user, quantities
+        )
+    except CartItem.DoesNotExist:
+        return _item_not_found()
+    except SoldOut as e:
+        return _sold_out(e)
+
+    return JsonResponse(
+        {
+            "success": True,
+            "items": {
+                cart_item.id: {
+                    "quantity": cart_item.quantity,
+                    "item_total": float(cart_item.total_price),
+                }
+                for cart_item in updated
+            },
+            "removed": removed,
+            "total_items": items_count,
+            "cart_total": float(total_amount),
+        }
+    )
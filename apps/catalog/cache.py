@@ -0,0 +1,113 @@
+"""
+Cache du catalogue des offres.
+
+Les offres ne changent que quelques fois par saison : la liste des offres
+actives est gardée dans le cache Django partagé (settings.CATALOG_CACHE_ALIAS)
+sous une clé versionnée, et mémorisée dans chaque processus. Toute écriture
+sur une offre (API d'administration, admin Django, commandes) incrémente la
+version via les signaux de apps.catalog.models : les anciennes entrées ne
+sont plus lues et expirent d'elles-mêmes.
+
+Chaque processus ne relit la version partagée que toutes les
+CATALOG_CACHE_LOCAL_TTL secondes ; entre deux, aucun accès réseau ni SQL.
+"""
+
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from .models import Offer
+
+VERSION_KEY = "catalog:version"
+SNAPSHOT_KEY = "catalog:offers:v{version}"
+SNAPSHOT_TIMEOUT = 86400
+
+# Champs copiés dans le cache (suffisants pour recréer les instances Offer)
+OFFER_FIELDS = (
+    "id",
+    "name",
+    "capacity",
+    "price",
+    "is_active",
+    "description",
+    "created_at",
+    "updated_at",
+)
+
+_local = {"version": None, "checked_at": 0.0, "offers": None}
+_lock = threading.Lock()
+
+
+def catalog_cache():
+    """Backend de cache Django partagé utilisé par le catalogue."""
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def current_version():
+    """Version actuelle du catalogue (créée à 1 si absente du cache)."""
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalide le catalogue en cache (appelé à chaque écriture sur une offre)."""
+    cache = catalog_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Clé absente (cache vidé ou redémarré) : on repart d'une nouvelle valeur
+        cache.set(VERSION_KEY, int(time.time()), None)
+    with _lock:
+        _local.update(version=None, checked_at=0.0, offers=None)
+
+
+def load_offer_snapshot():
+    """Lit les offres actives en base (triées par prix) sous forme de dicts."""
+    return list(
+        Offer.objects.filter(is_active=True).order_by("price").values(*OFFER_FIELDS)
+    )
+
+
+def get_offer_snapshot():
+    """
+    Retourne la liste des offres actives (dicts), depuis la mémoire du
+    processus, sinon le cache partagé, sinon la base.
+    """
+    local_ttl = getattr(settings, "CATALOG_CACHE_LOCAL_TTL", 5)
+    now = time.monotonic()
+    with _lock:
+        if _local["offers"] is not None and now - _local["checked_at"] < local_ttl:
+            return _local["offers"]
+        local_version, local_offers = _local["version"], _local["offers"]
+
+    version = current_version()
+    if version == local_version and local_offers is not None:
+        offers = local_offers
+    else:
+        cache = catalog_cache()
+        key = SNAPSHOT_KEY.format(version=version)
+        offers = cache.get(key)
+        if offers is None:
+            offers = load_offer_snapshot()
+            cache.set(key, offers, SNAPSHOT_TIMEOUT)
+
+    with _lock:
+        _local.update(version=version, checked_at=now, offers=offers)
+    return offers
+
+
+def cached_active_offers():
+    """Offres actives (instances Offer non liées à une requête) pour les templates."""
+    return [Offer(**fields) for fields in get_offer_snapshot()]
+
+
+def get_cached_offer(offer_id):
+    """Dict d'une offre active, ou None si elle n'existe pas ou n'est pas active."""
+    for fields in get_offer_snapshot():
+        if fields["id"] == offer_id:
+            return fields
+    return None
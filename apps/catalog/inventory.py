@@ -0,0 +1,153 @@
+"""
+Stock des offres réparti sur plusieurs lignes (compteurs shardés).
+
+Une offre avec un quota a N lignes OfferStockShard (settings.INVENTORY_SHARDS).
+Un achat décrémente un slot tiré au hasard avec un UPDATE conditionnel
+(remaining >= quantité) : deux acheteurs ne se bloquent que s'ils tombent
+sur le même slot, et la condition garantit qu'aucun slot ne passe sous zéro
+(pas de survente). Quand aucun slot ne suffit seul, toutes les parts de
+l'offre sont verrouillées et le stock est pris sur plusieurs slots.
+
+La commande compact_inventory rééquilibre périodiquement les slots.
+Une offre sans parts de stock est considérée comme illimitée.
+"""
+
+import random
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from .models import Offer, OfferStockShard
+
+FAST_PATH_ATTEMPTS = 3
+
+
+class SoldOut(Exception):
+    """Stock insuffisant pour l'offre demandée."""
+
+
+def shard_count():
+    """Nombre de slots créés par défaut pour une offre."""
+    return getattr(settings, "INVENTORY_SHARDS", 16)
+
+
+def split_evenly(total, shards):
+    """Répartit `total` sur `shards` slots (écart maximal de 1 entre slots)."""
+    base, extra = divmod(total, shards)
+    return [base + (1 if slot < extra else 0) for slot in range(shards)]
+
+
+def set_quota(offer, quota, sold=0, shards=None):
+    """
+    Fixe le quota d'une offre et remet son stock à quota - sold billets,
+    répartis sur `shards` slots. quota=None rend l'offre illimitée.
+    """
+    shards = shards or shard_count()
+    with transaction.atomic():
+        offer = Offer.objects.select_for_update().get(pk=offer.pk)
+        OfferStockShard.objects.filter(offer=offer).delete()
+        if quota is not None:
+            remaining = max(quota - sold, 0)
+            OfferStockShard.objects.bulk_create(
+                OfferStockShard(offer=offer, slot=slot, remaining=count)
+                for slot, count in enumerate(split_evenly(remaining, shards))
+            )
+        offer.quota = quota
+        offer.save(update_fields=["quota", "updated_at"])
+    return offer
+
+
+def remaining_stock(offer_id):
+    """Billets restants pour l'offre, ou None si elle est illimitée."""
+    return OfferStockShard.objects.filter(offer_id=offer_id).aggregate(
+        total=Sum("remaining")
+    )["total"]
+
+
+def _take(offer_id, slot, quantity):
+    """Décrémente un slot s'il a assez de stock (UPDATE conditionnel)."""
+    return (
+        OfferStockShard.objects.filter(
+            offer_id=offer_id, slot=slot, remaining__gte=quantity
+        ).update(remaining=F("remaining") - quantity)
+        == 1
+    )
+
+
+def _reserve_locked(offer_id, quantity):
+    """Prend le stock sur plusieurs slots, toutes les parts étant verrouillées."""
+    shards = list(
+        OfferStockShard.objects.select_for_update()
+        .filter(offer_id=offer_id)
+        .order_by("slot")
+    )
+    if sum(shard.remaining for shard in shards) < quantity:
+        raise SoldOut(f"Plus assez de billets disponibles pour l'offre {offer_id}")
+
+    needed = quantity
+    for shard in sorted(shards, key=lambda shard: -shard.remaining):
+        taken = min(shard.remaining, needed)
+        if taken:
+            shard.remaining -= taken
+            needed -= taken
+        if not needed:
+            break
+    OfferStockShard.objects.bulk_update(shards, ["remaining"])
+
+
+def reserve(offer_id, quantity):
+    """
+    Retire `quantity` billets du stock de l'offre ou lève SoldOut.
+
+    A appeler dans la transaction qui crée les commandes : en cas d'échec
+    plus loin, le stock est restitué par le rollback.
+    """
+    for _ in range(FAST_PATH_ATTEMPTS):
+        shards = list(
+            OfferStockShard.objects.filter(offer_id=offer_id).values_list(
+                "slot", "remaining"
+            )
+        )
+        if not shards:
+            return
+        if sum(remaining for _, remaining in shards) < quantity:
+            raise SoldOut(f"Plus assez de billets disponibles pour l'offre {offer_id}")
+
+        candidates = [slot for slot, remaining in shards if remaining >= quantity]
+        random.shuffle(candidates)
+        for slot in candidates:
+            if _take(offer_id, slot, quantity):
+                return
+
+    # Stock trop fragmenté (ou très disputé) pour un seul slot
+    _reserve_locked(offer_id, quantity)
+
+
+def release(offer_id, quantity):
+    """Remet `quantity` billets dans un slot tiré au hasard (annulation)."""
+    slots = list(
+        OfferStockShard.objects.filter(offer_id=offer_id).values_list("slot", flat=True)
+    )
+    if slots:
+        OfferStockShard.objects.filter(
+            offer_id=offer_id, slot=random.choice(slots)
+        ).update(remaining=F("remaining") + quantity)
+
+
+def compact(offer_id):
+    """
+    Rééquilibre les slots d'une offre (les achats vident certains slots plus
+    vite que d'autres). Retourne le stock restant (None si illimitée).
+    """
+    with transaction.atomic():
+        shards = list(
+            OfferStockShard.objects.select_for_update()
+            .filter(offer_id=offer_id)
+            .order_by("slot")
+        )
+        if not shards:
+            return None
+        total = sum(shard.remaining for shard in shards)
+        for shard, count in zip(shards, split_evenly(total, len(shards))):
+            shard.remaining = count
+        OfferStockShard.objects.bulk_update(shards, ["remaining"])
+    return total
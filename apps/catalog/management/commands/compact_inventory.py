@@ -0,0 +1,22 @@
+"""
+Management command to rebalance the sharded stock counters.
+
+Purchases drain random shards, so over time some shards are empty while
+others still hold stock; run this periodically (cron) to spread the
+remaining stock evenly again.
+"""
+
+from django.core.management.base import BaseCommand
+from apps.catalog.inventory import compact
+from apps.catalog.models import Offer
+
+
+class Command(BaseCommand):
+    help = "Rebalance the stock shards of every offer with a quota"
+
+    def handle(self, *args, **options):
+        offers = Offer.objects.filter(quota__isnull=False).order_by("name")
+        for offer in offers:
+            remaining = compact(offer.id)
+            self.stdout.write(f"{offer.name}: {remaining} remaining")
+        self.stdout.write(self.style.SUCCESS(f"Compacted {len(offers)} offers"))
@@ -0,0 +1,56 @@
+"""
+Management command to set the number of tickets on sale for an offer.
+
+The remaining stock (quota minus tickets already paid) is split over
+INVENTORY_SHARDS counter rows so concurrent checkouts do not all wait on
+the same row lock.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from apps.catalog.inventory import remaining_stock, set_quota, shard_count
+from apps.catalog.models import Offer
+from apps.orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Set the ticket quota of an offer (sharded stock counters)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("offer", type=str, help="Offer name (solo, duo...)")
+        parser.add_argument(
+            "quota",
+            type=int,
+            nargs="?",
+            default=None,
+            help="Tickets on sale; omit to make the offer unlimited",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=shard_count(),
+            help=f"Number of counter rows (default: {shard_count()})",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            offer = Offer.objects.get(name=options["offer"])
+        except Offer.DoesNotExist:
+            raise CommandError(f"Unknown offer {options['offer']}")
+
+        quota = options["quota"]
+        if (quota is not None and quota < 0) or options["shards"] < 1:
+            raise CommandError("quota and --shards must be positive")
+
+        sold = Order.objects.filter(offer=offer, status="paid").count()
+        set_quota(offer, quota, sold=sold, shards=options["shards"])
+
+        if quota is None:
+            self.stdout.write(self.style.SUCCESS(f"{offer.name} is now unlimited"))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{offer.name}: quota {quota}, {sold} sold, "
+                    f"{remaining_stock(offer.id)} remaining "
+                    f"in {options['shards']} shards"
+                )
+            )
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="offer",
+            name="quota",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Nombre de billets mis en vente (vide = illimité, voir inventory.py)",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="OfferStockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.PositiveSmallIntegerField(
+                        help_text="Numéro du slot (0 à N-1)"
+                    ),
+                ),
+                (
+                    "remaining",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Billets restants dans ce slot"
+                    ),
+                ),
+                (
+                    "offer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_shards",
+                        to="catalog.offer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Part de stock",
+                "verbose_name_plural": "Parts de stock",
+                "db_table": "catalog_offerstockshard",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="offerstockshard",
+            constraint=models.UniqueConstraint(
+                fields=("offer", "slot"), name="stock_shard_offer_slot_uniq"
+            ),
+        ),
+    ]
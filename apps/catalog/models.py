@@ -9,7 +9,9 @@ C'est assez simple mais ça fait le travail !
 """
 
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.core.validators import MinValueValidator
 
 
@@ -48,6 +50,11 @@ class Offer(models.Model):
     description = models.TextField(
         blank=True, help_text="Description détaillée de l'offre"
     )
+    quota = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Nombre de billets mis en vente (vide = illimité, voir inventory.py)",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -69,3 +76,49 @@ class Offer(models.Model):
     def is_available(self):
         """Vérifie si l'offre est disponible à l'achat."""
         return self.is_active
+
+
+class OfferStockShard(models.Model):
+    """
+    Part du stock restant d'une offre.
+
+    Le stock d'une offre est réparti sur plusieurs lignes (slots) : chaque
+    achat décrémente un slot tiré au hasard, ce qui évite que tous les
+    acheteurs attendent le verrou d'une seule ligne (voir inventory.py).
+    """
+
+    offer = models.ForeignKey(
+        Offer, on_delete=models.CASCADE, related_name="stock_shards"
+    )
+    slot = models.PositiveSmallIntegerField(help_text="Numéro du slot (0 à N-1)")
+    remaining = models.PositiveIntegerField(
+        default=0, help_text="Billets restants dans ce slot"
+    )
+
+    class Meta:
+        db_table = "catalog_offerstockshard"
+        verbose_name = "Part de stock"
+        verbose_name_plural = "Parts de stock"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["offer", "slot"], name="stock_shard_offer_slot_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.offer.name} - slot {self.slot} : {self.remaining}"
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """
+    Invalide le catalogue en cache à chaque écriture sur une offre
+    (API d'administration, admin Django ou commande seed_offers).
+
+    L'invalidation attend le commit : sinon un autre processus pourrait
+    relire l'ancienne offre et la mettre en cache sous la nouvelle version.
+    """
+    from .cache import bump_catalog_version
+
+    transaction.on_commit(bump_catalog_version)
@@ -2,9 +2,23 @@
 Tests for the catalog app.
 """
 
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from decimal import Decimal
-from apps.catalog.models import Offer
+from apps.catalog.cache import bump_catalog_version, get_offer_snapshot
+from apps.catalog.inventory import (
+    SoldOut,
+    compact,
+    remaining_stock,
+    reserve,
+    set_quota,
+)
+from apps.catalog.models import Offer, OfferStockShard
 
 
 class OfferModelTest(TestCase):
@@ -98,3 +112,172 @@ class OfferModelTest(TestCase):
                 price=Decimal("100.00"),
                 is_active=True,
             )
+
+
+class CatalogCacheTest(TestCase):
+    """Test cases for the versioned catalog cache."""
+
+    def setUp(self):
+        """Set up test data."""
+        bump_catalog_version()
+        self.solo = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.duo = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+        Offer.objects.create(
+            name="familiale", capacity=4, price=Decimal("150.00"), is_active=False
+        )
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_warm_catalog_does_not_query_database(self):
+        """Test that the offers page is rendered from the catalog cache once warm."""
+        self.client.get(reverse("catalog:offers"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("catalog:offers"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [offer.name for offer in response.context["offers"]], ["solo", "duo"]
+        )
+        self.assertContains(response, "Duo (2 personnes)")
+
+    def test_offer_save_invalidates_snapshot(self):
+        """Test that saving an offer is visible on the next read."""
+        get_offer_snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.duo.price = Decimal("80.00")
+            self.duo.save()
+
+        prices = {offer["name"]: offer["price"] for offer in get_offer_snapshot()}
+        self.assertEqual(prices["duo"], Decimal("80.00"))
+
+    def test_offer_delete_invalidates_snapshot(self):
+        """Test that deleting an offer removes it from the cached catalog."""
+        get_offer_snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.solo.delete()
+
+        self.assertEqual([offer["name"] for offer in get_offer_snapshot()], ["duo"])
+
+
+class InventoryTest(TestCase):
+    """Test cases for the sharded offer stock."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+
+    def shard_values(self):
+        return list(
+            OfferStockShard.objects.filter(offer=self.offer)
+            .order_by("slot")
+            .values_list("remaining", flat=True)
+        )
+
+    def test_set_quota_splits_remaining_stock(self):
+        """Test that the quota minus sold tickets is spread over the shards."""
+        set_quota(self.offer, 10, sold=3, shards=4)
+
+        self.offer.refresh_from_db()
+        self.assertEqual(self.offer.quota, 10)
+        self.assertEqual(self.shard_values(), [2, 2, 2, 1])
+
+    def test_offer_without_quota_is_unlimited(self):
+        """Test that reserving on an offer without shards always succeeds."""
+        reserve(self.offer.id, 1000)
+
+        self.assertIsNone(remaining_stock(self.offer.id))
+
+    def test_reserve_until_sold_out(self):
+        """Test that reservations stop exactly at the quota."""
+        set_quota(self.offer, 5, shards=2)
+
+        reserve(self.offer.id, 2)
+        reserve(self.offer.id, 2)
+        self.assertEqual(remaining_stock(self.offer.id), 1)
+        with self.assertRaises(SoldOut):
+            reserve(self.offer.id, 2)
+        reserve(self.offer.id, 1)
+        self.assertEqual(remaining_stock(self.offer.id), 0)
+
+    def test_reserve_across_fragmented_shards(self):
+        """Test that a quantity larger than any shard is taken from several."""
+        set_quota(self.offer, 8, shards=4)
+
+        reserve(self.offer.id, 5)
+
+        self.assertEqual(remaining_stock(self.offer.id), 3)
+        self.assertTrue(all(value >= 0 for value in self.shard_values()))
+
+    def test_compact_rebalances_shards(self):
+        """Test the compaction of drained shards."""
+        set_quota(self.offer, 8, shards=4)
+        OfferStockShard.objects.filter(offer=self.offer, slot=0).update(remaining=0)
+
+        self.assertEqual(compact(self.offer.id), 6)
+        self.assertEqual(self.shard_values(), [2, 2, 1, 1])
+
+    def test_set_offer_quota_command(self):
+        """Test the set_offer_quota management command."""
+        out = StringIO()
+        call_command("set_offer_quota", "solo", "12", "--shards", "3", stdout=out)
+
+        self.assertIn("quota 12, 0 sold, 12 remaining in 3 shards", out.getvalue())
+        self.assertEqual(self.shard_values(), [4, 4, 4])
+
+
+class InventoryConcurrencyTest(TransactionTestCase):
+    """Concurrent checkouts must never sell more than the quota."""
+
+    threads = 24
+    quota = 10
+
+    def setUp(self):
+        """Set up test data."""
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        set_quota(self.offer, self.quota, shards=4)
+
+    def buy(self, results, barrier):
+        barrier.wait()
+        try:
+            for attempt in range(500):
+                try:
+                    with transaction.atomic():
+                        reserve(self.offer.id, 1)
+                    results.append("sold")
+                    return
+                except SoldOut:
+                    results.append("sold_out")
+                    return
+                except OperationalError:
+                    # SQLite n'a qu'un écrivain à la fois ("database is locked")
+                    time.sleep(0.01)
+            results.append("error")
+        finally:
+            connection.close()
+
+    def test_no_oversell_under_concurrency(self):
+        """Test that many threads buying at once sell exactly the quota."""
+        results = []
+        barrier = threading.Barrier(self.threads)
+        workers = [
+            threading.Thread(target=self.buy, args=(results, barrier))
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results.count("sold"), self.quota)
+        self.assertEqual(results.count("sold_out"), self.threads - self.quota)
+        self.assertEqual(remaining_stock(self.offer.id), 0)
@@ -2,10 +2,14 @@
 Views for the catalog app.
 """
 
+from django.utils.decorators import method_decorator
 from django.views.generic import ListView
+from apps.users.page_cache import cache_anonymous_page
+from .cache import cached_active_offers
 from .models import Offer
 
 
+@method_decorator(cache_anonymous_page, name="dispatch")
 class OfferListView(ListView):
     """
     View to display all available offers.
@@ -16,8 +20,8 @@ class OfferListView(ListView):
     context_object_name = "offers"
 
     def get_queryset(self):
-        """Return only active offers."""
-        return Offer.objects.filter(is_active=True).order_by("price")
+        """Return only active offers (from the catalog cache, no SQL query)."""
+        return cached_active_offers()
 
     def get_context_data(self, **kwargs):
         """Add additional context data."""
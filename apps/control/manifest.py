@@ -0,0 +1,195 @@
+"""
+Manifeste de validation hors ligne pour les appareils de contrôle.
+
+Le manifeste contient, pour les billets des commandes payées :
+- un tableau trié de condensés tronqués de SHA-256(final_key),
+- un bitmap "déjà utilisé" aligné sur ce tableau (bit i = condensé i).
+
+Avec QR_PAYLOAD_FORMAT = "signed", les QR codes ne contiennent plus la
+final_key mais une charge utile JO1 (voir apps.tickets.signed_payload) :
+chaque billet a alors aussi une entrée SHA-256("id:<ticket_id>") (taille du
+manifeste doublée). L'appareil vérifie la signature JO1 avec la clé publique
+puis cherche l'id du billet ; les QR codes final_key déjà imprimés restent
+reconnus.
+
+Avec 6 octets par condensé, 80 000 billets tiennent dans ~470 Ko bruts
+(~640 Ko en base64, ~480 Ko une fois compressé en gzip). L'appareil calcule
+SHA-256 du QR scanné, tronque, et fait une recherche dichotomique.
+Les deltas (billets ajoutés, utilisés ou retirés depuis un curseur) permettent
+de rester synchronisé sans retélécharger le manifeste.
+
+Manifeste et deltas sont signés en Ed25519 avec la clé des QR codes signés :
+l'appareil vérifie la signature avec la clé publique avant de s'y fier.
+"""
+
+import base64
+import hashlib
+import json
+from bisect import bisect_left
+from django.conf import settings
+from django.utils import timezone
+from apps.tickets.models import Ticket
+from apps.tickets.signed_payload import (
+    decode_signed_payload,
+    is_signed_payload,
+    sign_message,
+    verify_message,
+)
+
+
+def digest_size():
+    """Nombre d'octets conservés de SHA-256(final_key)."""
+    return getattr(settings, "MANIFEST_DIGEST_BYTES", 6)
+
+
+def key_digest(final_key, size=None):
+    """Condensé tronqué d'une final_key (octets)."""
+    digest = hashlib.sha256(final_key.encode("utf-8")).digest()
+    return digest[: size or digest_size()]
+
+
+def ticket_id_key(ticket_id):
+    """Clé du manifeste d'un billet scanné au format signé."""
+    return f"id:{ticket_id}"
+
+
+def manifest_keys(ticket_id, final_key):
+    """Clés du manifeste d'un billet selon le format des QR codes."""
+    if getattr(settings, "QR_PAYLOAD_FORMAT", "legacy") == "signed":
+        return [final_key, ticket_id_key(ticket_id)]
+    return [final_key]
+
+
+def scanned_key(value):
+    """
+    Clé du manifeste d'un QR code scanné : l'id du billet d'une charge utile
+    signée (vérifiée), sinon la valeur scannée. None si la signature est invalide.
+    """
+    if not is_signed_payload(value):
+        return value
+    try:
+        return ticket_id_key(decode_signed_payload(value)["ticket_id"])
+    except ValueError:
+        return None
+
+
+def manifest_tickets(offer_id=None):
+    """Billets couverts par le manifeste (commandes payées, offre optionnelle)."""
+    tickets = Ticket.objects.filter(order__status="paid")
+    if offer_id is not None:
+        tickets = tickets.filter(order__offer_id=offer_id)
+    return tickets
+
+
+def signed_message(payload):
+    """
+    Message signé d'un manifeste ou d'un delta : JSON canonique (clés triées,
+    sans espaces) des champs hors signature, reproduit par l'appareil.
+    """
+    fields = {key: value for key, value in payload.items() if key != "signature"}
+    return json.dumps(fields, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def sign_manifest(payload):
+    """
+    Signature Ed25519 (base64) d'un manifeste ou d'un delta, avec la clé des
+    QR codes signés : l'appareil la vérifie avec la clé publique.
+    """
+    return sign_message(signed_message(payload))
+
+
+def verify_manifest(payload):
+    """Vérifie la signature d'un manifeste ou d'un delta."""
+    return verify_message(payload.get("signature", ""), signed_message(payload))
+
+
+def build_manifest(offer_id=None):
+    """
+    Construit le manifeste signé (dict sérialisable en JSON).
+
+    Le curseur est pris avant la lecture : un billet modifié pendant la
+    construction sera renvoyé par le prochain delta (les deltas sont idempotents).
+    """
+    cursor = timezone.now()
+    rows = sorted(
+        (key_digest(key), status == "used")
+        for ticket_id, final_key, status in manifest_tickets(offer_id)
+        .values_list("id", "final_key", "status")
+        .iterator(chunk_size=5000)
+        for key in manifest_keys(ticket_id, final_key)
+    )
+
+    used = bytearray((len(rows) + 7) // 8)
+    for index, (_, is_used) in enumerate(rows):
+        if is_used:
+            used[index // 8] |= 1 << (index % 8)
+
+    payload = {
+        "offer_id": offer_id,
+        "cursor": cursor.isoformat(),
+        "digest_bytes": digest_size(),
+        "count": len(rows),
+        "digests": base64.b64encode(b"".join(d for d, _ in rows)).decode("ascii"),
+        "used": base64.b64encode(bytes(used)).decode("ascii"),
+    }
+    payload["signature"] = sign_manifest(payload)
+    return payload
+
+
+def build_delta(since, offer_id=None):
+    """
+    Changements depuis `since` : billets ajoutés ou utilisés (upserts) et
+    billets dont la commande n'est plus payée (removed), en hexadécimal.
+    """
+    cursor = timezone.now()
+    upserts = [
+        {"digest": key_digest(key).hex(), "used": status == "used"}
+        for ticket_id, final_key, status in manifest_tickets(offer_id)
+        .filter(updated_at__gt=since)
+        .values_list("id", "final_key", "status")
+        .iterator(chunk_size=5000)
+        for key in manifest_keys(ticket_id, final_key)
+    ]
+
+    removed_tickets = Ticket.objects.filter(order__updated_at__gt=since).exclude(
+        order__status="paid"
+    )
+    if offer_id is not None:
+        removed_tickets = removed_tickets.filter(order__offer_id=offer_id)
+    removed = [
+        key_digest(key).hex()
+        for ticket_id, final_key in removed_tickets.values_list("id", "final_key")
+        for key in manifest_keys(ticket_id, final_key)
+    ]
+
+    payload = {
+        "offer_id": offer_id,
+        "since": since.isoformat(),
+        "cursor": cursor.isoformat(),
+        "upserts": upserts,
+        "removed": removed,
+    }
+    payload["signature"] = sign_manifest(payload)
+    return payload
+
+
+def manifest_lookup(payload, value):
+    """
+    Recherche côté serveur d'un QR code scanné (même algorithme que l'appareil).
+
+    Retourne None si le billet est absent (ou la charge utile signée invalide),
+    sinon True/False selon qu'il est utilisé.
+    """
+    key = scanned_key(value)
+    if key is None:
+        return None
+    size = payload["digest_bytes"]
+    digests = base64.b64decode(payload["digests"])
+    used = base64.b64decode(payload["used"])
+    entries = [digests[i : i + size] for i in range(0, len(digests), size)]
+
+    target = key_digest(key, size)
+    index = bisect_left(entries, target)
+    if index == len(entries) or entries[index] != target:
+        return None
+    return bool(used[index // 8] & (1 << (index % 8)))
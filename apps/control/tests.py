@@ -0,0 +1,396 @@
+"""
+Tests for the control app.
+"""
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+from django.test import AsyncClient, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from apps.catalog.models import Offer
+from apps.control.manifest import build_manifest, manifest_lookup, verify_manifest
+from apps.orders.models import Order
+from apps.tickets.checks import check_gate_dashboard_cache
+from apps.tickets.gate_stats import (
+    NAMES_KEY,
+    SLOTS_KEY,
+    SNAPSHOT_KEY,
+    dashboard,
+    dashboard_cache,
+    gate_stats,
+    total_key,
+)
+from apps.tickets.models import ScanEvent, Ticket
+from apps.tickets.scan_log import scan_log
+
+User = get_user_model()
+
+
+@override_settings(SCAN_LOG_FLUSH_INTERVAL=0)
+class OfflineManifestTest(TestCase):
+    """Test cases for the offline validation manifest."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.employee = User.objects.create_user(
+            email="employee@example.com",
+            username="employee",
+            first_name="Employee",
+            last_name="User",
+            password="testpass123",
+            is_employee=True,
+        )
+        self.customer = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.tickets = [self.create_ticket("paid") for _ in range(3)]
+        self.tickets[0].mark_as_used()
+        self.unpaid_ticket = self.create_ticket("pending")
+        self.client.force_login(self.employee)
+        scan_log.clear()
+        gate_stats.clear()
+
+    def create_ticket(self, status):
+        order = Order.objects.create(
+            user=self.customer, offer=self.offer, amount=Decimal("50.00"), status=status
+        )
+        return Ticket.objects.create(order=order, user=self.customer)
+
+    def test_manifest_membership_and_used_bitmap(self):
+        """Test that paid tickets are found with their used flag."""
+        manifest = build_manifest()
+
+        self.assertEqual(manifest["count"], 3)
+        self.assertTrue(verify_manifest(manifest))
+        self.assertTrue(manifest_lookup(manifest, self.tickets[0].final_key))
+        self.assertFalse(manifest_lookup(manifest, self.tickets[1].final_key))
+        self.assertIsNone(manifest_lookup(manifest, self.unpaid_ticket.final_key))
+        self.assertIsNone(manifest_lookup(manifest, "unknown"))
+
+    @override_settings(QR_PAYLOAD_FORMAT="signed")
+    def test_signed_qr_codes_are_found_by_ticket_id(self):
+        """Test that signed QR codes are looked up by ticket id."""
+        manifest = build_manifest()
+        payload = self.tickets[1].qr_payload()
+
+        self.assertEqual(manifest["count"], 6)
+        self.assertTrue(manifest_lookup(manifest, self.tickets[0].qr_payload()))
+        self.assertFalse(manifest_lookup(manifest, payload))
+        self.assertFalse(manifest_lookup(manifest, self.tickets[1].final_key))
+        self.assertIsNone(manifest_lookup(manifest, payload[:-4] + "AAAA"))
+        self.assertIsNone(manifest_lookup(manifest, self.unpaid_ticket.qr_payload()))
+
+    def test_tampered_manifest_fails_verification(self):
+        """Test that modifying the manifest invalidates its signature."""
+        manifest = build_manifest()
+        manifest["count"] = 4
+
+        self.assertFalse(verify_manifest(manifest))
+        self.assertFalse(verify_manifest({**manifest, "signature": "not base64!"}))
+
+    def test_manifest_api_filters_by_offer(self):
+        """Test the manifest endpoint with an offer filter."""
+        other = Offer.objects.create(
+            name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+        )
+
+        response = self.client.get(reverse("control:manifest_api"), {"offre": other.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["manifest"]["count"], 0)
+
+    def test_delta_reports_used_tickets(self):
+        """Test that a ticket used after the cursor shows up in the delta."""
+        since = timezone.now() - timedelta(seconds=1)
+        Ticket.objects.filter(id=self.tickets[1].id).update(
+            status="used", updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        Ticket.objects.exclude(id=self.tickets[1].id).update(
+            updated_at=since - timedelta(minutes=1)
+        )
+
+        response = self.client.get(
+            reverse("control:manifest_delta_api"), {"since": since.isoformat()}
+        )
+
+        delta = response.json()["delta"]
+        self.assertEqual(len(delta["upserts"]), 1)
+        self.assertTrue(delta["upserts"][0]["used"])
+        self.assertTrue(verify_manifest(delta))
+        delta["upserts"][0]["used"] = False
+        self.assertFalse(verify_manifest(delta))
+
+    def test_reconciliation_reports_conflicts(self):
+        """Test that offline scans are applied and double entries reported."""
+        scans = [
+            {"final_key": self.tickets[1].final_key, "scanned_at": "2024-07-26T18:00Z"},
+            {"final_key": self.tickets[0].final_key, "scanned_at": "2024-07-26T18:01Z"},
+        ]
+
+        response = self.client.post(
+            reverse("control:manifest_reconcile_api"),
+            data=json.dumps({"scans": scans}),
+            content_type="application/json",
+        )
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["summary"]["valid"], 1)
+        self.assertEqual(len(data["conflicts"]), 1)
+        self.tickets[1].refresh_from_db()
+        self.assertEqual(self.tickets[1].status, "used")
+
+    def test_reconciliation_replays_scans_in_order(self):
+        """Test that offline scans are sorted on their parsed scan time."""
+        key = self.tickets[1].final_key
+        scans = [
+            {"final_key": key, "scanned_at": "2024-07-26T20:00:00+02:00"},
+            {"final_key": key, "scanned_at": "2024-07-26T17:30Z"},
+            {"final_key": "unknown"},
+        ]
+
+        response = self.client.post(
+            reverse("control:manifest_reconcile_api"),
+            data=json.dumps({"scans": scans}),
+            content_type="application/json",
+        )
+
+        results = response.json()["results"]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result["outcome"], result["scanned_at"]) for result in results],
+            [
+                ("unknown", None),
+                ("valid", "2024-07-26T17:30Z"),
+                ("used", "2024-07-26T20:00:00+02:00"),
+            ],
+        )
+
+    def test_reconciliation_rejects_invalid_scan_times(self):
+        """Test that a malformed scanned_at is a 400, not a server error."""
+        for scanned_at in ("hier", 1722016800, "2024-13-01T10:00Z", ["2024"]):
+            scans = [
+                {"final_key": self.tickets[1].final_key, "scanned_at": "2024-07-26"},
+                {"final_key": self.tickets[2].final_key, "scanned_at": scanned_at},
+            ]
+
+            response = self.client.post(
+                reverse("control:manifest_reconcile_api"),
+                data=json.dumps({"scans": scans}),
+                content_type="application/json",
+            )
+
+            self.assertEqual(response.status_code, 400, scanned_at)
+        # Aucun scan du lot n'est appliqué
+        self.tickets[1].refresh_from_db()
+        self.assertEqual(self.tickets[1].status, "valid")
+
+    def test_reconciliation_logs_scans(self):
+        """Test that offline scans reach the audit log and the dashboard."""
+        scans = [{"final_key": self.tickets[1].final_key}, {"final_key": "unknown"}]
+
+        self.client.post(
+            reverse("control:manifest_reconcile_api"),
+            data=json.dumps({"scans": scans, "gate": "Porte A"}),
+            content_type="application/json",
+        )
+        scan_log.flush()
+
+        self.assertEqual(
+            sorted(ScanEvent.objects.values_list("outcome", flat=True)),
+            ["unknown", "valid"],
+        )
+        self.assertEqual(gate_stats.snapshot()["Porte A"]["admitted"], 1)
+
+    def test_reconciliation_is_capped(self):
+        """Test that a reconciliation batch above the limit is rejected."""
+        scans = [{"final_key": ticket.final_key} for ticket in self.tickets]
+
+        with self.settings(VALIDATION_BATCH_MAX_KEYS=2):
+            response = self.client.post(
+                reverse("control:manifest_reconcile_api"),
+                data=json.dumps({"scans": scans}),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ScanEvent.objects.exists())
+
+    def test_manifest_requires_employee(self):
+        """Test that customers cannot download the manifest."""
+        self.client.force_login(self.customer)
+
+        response = self.client.get(reverse("control:manifest_api"))
+
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(SCAN_LOG_FLUSH_INTERVAL=0)
+class GateDashboardTest(TestCase):
+    """Test cases for the live gate dashboard."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.employee = User.objects.create_user(
+            email="employee@example.com",
+            username="employee",
+            password="testpass123",
+            is_employee=True,
+        )
+        self.customer = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            password="testpass123",
+        )
+        offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        order = Order.objects.create(
+            user=self.customer, offer=offer, amount=Decimal("50.00"), status="paid"
+        )
+        self.ticket = Ticket.objects.create(order=order, user=self.customer)
+        gate_stats.clear()
+        dashboard_cache().clear()
+
+    def scan(self, final_key, gate):
+        return self.client.post(
+            reverse("tickets:validate_ticket_api"),
+            data=json.dumps({"final_key": final_key, "gate": gate}),
+            content_type="application/json",
+        )
+
+    def test_scans_feed_the_dashboard(self):
+        """Test that the validation path updates the per-gate counters."""
+        self.scan(self.ticket.final_key, "Porte A")
+        self.scan(self.ticket.final_key, "Porte A")
+        self.scan("unknown", "Porte B")
+
+        with self.assertNumQueries(0):
+            stats = dashboard()
+
+        self.assertEqual(
+            stats["gates"][0],
+            {
+                "gate": "Porte A",
+                "scans_per_minute": 2,
+                "rejected_per_minute": 1,
+                "admitted": 1,
+                "rejected": 1,
+            },
+        )
+        self.assertEqual(stats["gates"][1]["gate"], "Porte B")
+        self.assertEqual(
+            stats["totals"],
+            {
+                "scans_per_minute": 3,
+                "rejected_per_minute": 2,
+                "admitted": 1,
+                "rejected": 2,
+            },
+        )
+
+    def test_other_processes_are_merged(self):
+        """Test that published snapshots and shared totals are added up."""
+        now = 1_722_000_000.0
+        gate_stats.record("Porte A", ["valid", "used"], now=now)
+        cache = dashboard_cache()
+        cache.set(SLOTS_KEY, [7])
+        cache.set(NAMES_KEY, ["Porte A"])
+        cache.set(total_key("Porte A", "admitted"), 40)
+        cache.set(total_key("Porte A", "rejected"), 2)
+        # Une seconde récente, une hors de la fenêtre
+        cache.set(
+            SNAPSHOT_KEY.format(7),
+            {"Porte A": {int(now) - 10: [3, 1], int(now) - 90: [39, 1]}},
+        )
+
+        row = dashboard(now=now)["gates"][0]
+
+        self.assertEqual((row["scans_per_minute"], row["rejected_per_minute"]), (5, 2))
+        self.assertEqual((row["admitted"], row["rejected"]), (41, 3))
+
+    def test_counters_are_published(self):
+        """Test that a process publishes its counters to the shared cache."""
+        gate_stats.record("Porte A", ["valid"])
+        gate_stats.publish()
+        gate_stats.record("Porte A", ["valid", "used"])
+        gate_stats.publish()
+        cache = dashboard_cache()
+
+        self.assertEqual(cache.get(SLOTS_KEY), [1])
+        seconds = cache.get(SNAPSHOT_KEY.format(1))["Porte A"]
+        self.assertEqual(sum(scans for scans, _ in seconds.values()), 3)
+        self.assertEqual(cache.get(total_key("Porte A", "admitted")), 2)
+        self.assertEqual(cache.get(total_key("Porte A", "rejected")), 1)
+        # Les compteurs de ce processus ne sont pas comptés deux fois
+        self.assertEqual(dashboard()["totals"]["admitted"], 2)
+
+    def test_stopped_processes_are_dropped(self):
+        """Test that slots whose snapshot expired leave the slot list."""
+        cache = dashboard_cache()
+        cache.set(SLOTS_KEY, [3, 4])
+        cache.set(SNAPSHOT_KEY.format(4), {})
+
+        dashboard()
+
+        self.assertEqual(cache.get(SLOTS_KEY), [4])
+
+    def test_deploy_check_requires_shared_cache(self):
+        """Test the deploy check against a per-process cache."""
+        errors = check_gate_dashboard_cache(None)
+
+        self.assertEqual([error.id for error in errors], ["tickets.E001"])
+
+    def test_stream_sends_current_state(self):
+        """Test the one-shot event sent when served over WSGI."""
+        self.scan(self.ticket.final_key, "Porte A")
+        self.client.force_login(self.employee)
+
+        response = self.client.get(reverse("control:gate_dashboard_stream"))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertTrue(content.startswith("retry: "))
+        data = json.loads(content.split("data: ", 1)[1])
+        self.assertEqual(data["totals"]["admitted"], 1)
+
+    async def test_stream_stays_open_over_asgi(self):
+        """Test that the ASGI stream pushes events without closing."""
+        client = AsyncClient()
+        await client.aforce_login(self.employee)
+
+        response = await client.get(reverse("control:gate_dashboard_stream"))
+        events = aiter(response.streaming_content)
+
+        self.assertTrue((await anext(events)).startswith(b"retry: "))
+        self.assertTrue((await anext(events)).startswith(b"event: stats\n"))
+        await events.aclose()
+
+    def test_requires_supervisor(self):
+        """Test that customers cannot open the dashboard or its stream."""
+        self.client.force_login(self.customer)
+
+        page = self.client.get(reverse("control:gate_dashboard"))
+        stream = self.client.get(reverse("control:gate_dashboard_stream"))
+
+        self.assertEqual(page.status_code, 302)
+        self.assertEqual(stream.status_code, 403)
+
+    def test_dashboard_page(self):
+        """Test that employees get the dashboard page."""
+        self.client.force_login(self.employee)
+
+        response = self.client.get(reverse("control:gate_dashboard"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse("control:gate_dashboard_stream"))
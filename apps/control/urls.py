@@ -9,4 +9,21 @@ app_name = "control"
 
 urlpatterns = [
     path("controle/scanner/", views.scan_view, name="scan"),
+    path("controle/portiques/", views.gate_dashboard_view, name="gate_dashboard"),
+    path(
+        "api/controle/portiques/flux/",
+        views.gate_dashboard_stream,
+        name="gate_dashboard_stream",
+    ),
+    path("api/controle/manifeste/", views.manifest_api, name="manifest_api"),
+    path(
+        "api/controle/manifeste/delta/",
+        views.manifest_delta_api,
+        name="manifest_delta_api",
+    ),
+    path(
+        "api/controle/manifeste/reconciliation/",
+        views.manifest_reconcile_api,
+        name="manifest_reconcile_api",
+    ),
 ]
@@ -4,8 +4,22 @@ Views for the control app.
 This app handles QR code scanning and ticket validation for employees.
 """
 
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_http_methods
+from apps.tickets.gate_stats import dashboard as gate_dashboard
+from apps.tickets.validation import OUTCOME_MESSAGES, OUTCOME_USED, validate_final_keys
+from apps.tickets.views import _log_scans
+from .manifest import build_delta, build_manifest
 
 
 def is_employee(user):
@@ -15,6 +29,46 @@ def is_employee(user):
     return user.is_authenticated and user.is_employee
 
 
+def is_supervisor(user):
+    """
+    Check if user can follow the live gate dashboard (employees and admins).
+    """
+    return user.is_authenticated and (user.is_employee or user.is_adminpanel)
+
+
+# Délai de reconnexion d'EventSource (ms) et intervalle des commentaires
+# de maintien de connexion quand rien ne change (secondes)
+SSE_RETRY_MS = 3000
+SSE_HEARTBEAT = 15
+
+
+def _offer_id_param(request):
+    """Read the optional ?offre=<id> filter of the manifest endpoints."""
+    offer_id = request.GET.get("offre")
+    if offer_id in (None, ""):
+        return None
+    return int(offer_id)
+
+
+def _scanned_at_param(scan):
+    """
+    Parse the optional "scanned_at" of an offline scan (naive values are in
+    the current time zone). Raise ValueError when it is not ISO 8601.
+    """
+    value = scan.get("scanned_at")
+    if value is None:
+        return None
+    try:
+        scanned_at = parse_datetime(value)
+    except (TypeError, ValueError):
+        scanned_at = None
+    if scanned_at is None:
+        raise ValueError(value)
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    return scanned_at
+
+
 @login_required
 @user_passes_test(is_employee)
 def scan_view(request):
@@ -23,4 +77,188 @@ def scan_view(request):
 
     Only accessible to users with is_employee=True.
     """
-    return render(request, "control/scan.html", {"title": "Scan des Billets"})
+    return render(
+        request,
+        "control/scan.html",
+        {
+            "title": "Scan des Billets",
+            "reconcile_batch_size": settings.VALIDATION_BATCH_MAX_KEYS,
+        },
+    )
+
+
+@login_required
+@user_passes_test(is_supervisor)
+def gate_dashboard_view(request):
+    """
+    Live gate dashboard for supervisors (consumes the SSE stream below).
+    """
+    return render(
+        request, "control/gate_dashboard.html", {"title": "Portiques en direct"}
+    )
+
+
+def _sse_stats(stats):
+    return f"event: stats\ndata: {json.dumps(stats)}\n\n"
+
+
+async def _gate_dashboard_events():
+    """Push the gate counters whenever they change, with keep-alive comments."""
+    interval = getattr(settings, "GATE_DASHBOARD_INTERVAL", 1.0)
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    last, quiet = None, 0.0
+    while True:
+        stats = await sync_to_async(gate_dashboard)()
+        current = (stats["gates"], stats["totals"])
+        if current != last:
+            yield _sse_stats(stats)
+            last, quiet = current, 0.0
+        elif quiet >= SSE_HEARTBEAT:
+            yield ": ping\n\n"
+            quiet = 0.0
+        await asyncio.sleep(interval)
+        quiet += interval
+
+
+@require_http_methods(["GET"])
+async def gate_dashboard_stream(request):
+    """
+    Server-Sent Events stream of per-gate scans/minute, rejections and
+    admissions, read from the in-memory gate counters (no database query).
+
+    GET /api/controle/portiques/flux/
+
+    The stream stays open when served by an ASGI server (jo_tickets.asgi).
+    Under WSGI a worker cannot be held open, so the current state is sent
+    once and EventSource reconnects after SSE_RETRY_MS.
+    """
+    user = await request.auser()
+    if not is_supervisor(user):
+        return JsonResponse({"success": False, "error": "Forbidden"}, status=403)
+
+    if isinstance(request, ASGIRequest):
+        events = _gate_dashboard_events()
+    else:
+        stats = await sync_to_async(gate_dashboard)()
+        events = [f"retry: {SSE_RETRY_MS}\n\n", _sse_stats(stats)]
+
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Pas de mise en tampon par un proxy nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@gzip_page
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_employee)
+def manifest_api(request):
+    """
+    API endpoint returning the signed offline validation manifest.
+
+    GET /api/controle/manifeste/?offre=<offer_id>
+    """
+    try:
+        offer_id = _offer_id_param(request)
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Invalid offer id"}, status=400)
+
+    return JsonResponse({"success": True, "manifest": build_manifest(offer_id)})
+
+
+@require_http_methods(["GET"])
+@login_required
+@user_passes_test(is_employee)
+def manifest_delta_api(request):
+    """
+    API endpoint returning manifest changes since a cursor.
+
+    GET /api/controle/manifeste/delta/?since=<cursor>&offre=<offer_id>
+    """
+    since = parse_datetime(request.GET.get("since", ""))
+    if since is None:
+        return JsonResponse(
+            {"success": False, "error": "since must be an ISO 8601 cursor"},
+            status=400,
+        )
+    try:
+        offer_id = _offer_id_param(request)
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Invalid offer id"}, status=400)
+
+    return JsonResponse({"success": True, "delta": build_delta(since, offer_id)})
+
+
+@require_http_methods(["POST"])
+@login_required
+@user_passes_test(is_employee)
+def manifest_reconcile_api(request):
+    """
+    API endpoint receiving the scans performed offline.
+
+    POST /api/controle/manifeste/reconciliation/
+    Body: {"scans": [{"final_key": "abc123...", "scanned_at": "2024-07-26T18:00:00Z"}]}
+
+    Each scan goes through the normal validation; scans reported as already
+    used are returned as conflicts (same ticket admitted twice). At most
+    VALIDATION_BATCH_MAX_KEYS scans per request; scans are logged like
+    online ones (audit log and gate dashboard).
+    """
+    try:
+        data = json.loads(request.body)
+        scans = data.get("scans")
+
+        if not isinstance(scans, list) or not all(
+            isinstance(scan, dict) and scan.get("final_key") for scan in scans
+        ):
+            return JsonResponse(
+                {"success": False, "error": "scans must be a list of final_key"},
+                status=400,
+            )
+
+        max_keys = settings.VALIDATION_BATCH_MAX_KEYS
+        if len(scans) > max_keys:
+            return JsonResponse(
+                {"success": False, "error": f"At most {max_keys} scans per batch"},
+                status=400,
+            )
+
+        try:
+            dated = [(_scanned_at_param(scan), scan) for scan in scans]
+        except ValueError:
+            return JsonResponse(
+                {"success": False, "error": "scanned_at must be an ISO 8601 datetime"},
+                status=400,
+            )
+
+        # Les scans sont rejoués dans l'ordre chronologique, les scans sans
+        # date en premier
+        dated.sort(key=lambda pair: (pair[0] is not None, pair[0]))
+        scans = [scan for _, scan in dated]
+        results = validate_final_keys([scan["final_key"] for scan in scans])
+        _log_scans(request, data, results)
+
+        summary = dict.fromkeys(OUTCOME_MESSAGES, 0)
+        for scan, result in zip(scans, results):
+            result["scanned_at"] = scan.get("scanned_at")
+            summary[result["outcome"]] += 1
+
+        return JsonResponse(
+            {
+                "success": True,
+                "count": len(results),
+                "summary": summary,
+                "conflicts": [
+                    result for result in results if result["outcome"] == OUTCOME_USED
+                ],
+                "results": results,
+            }
+        )
+
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"success": False, "error": "Invalid JSON data"}, status=400
+        )
+    except Exception as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=500)
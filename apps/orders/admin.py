@@ -3,7 +3,7 @@ Admin configuration for the orders app.
 """
 
 from django.contrib import admin
-from .models import Order
+from .models import Order, PaymentJob
 
 
 @admin.register(Order)
@@ -27,3 +27,20 @@ class OrderAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queryset with select_related."""
         return super().get_queryset(request).select_related("user", "offer")
+
+
+@admin.register(PaymentJob)
+class PaymentJobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the PaymentJob model.
+    """
+
+    list_display = ("id", "user", "amount", "status", "attempts", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("user__email",)
+    readonly_fields = ("order_ids", "locked_at", "created_at", "updated_at")
+    ordering = ("-created_at",)
+
+    def get_queryset(self, request):
+        """Optimize queryset with select_related."""
+        return super().get_queryset(request).select_related("user")
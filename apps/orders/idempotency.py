@@ -0,0 +1,182 @@
+"""
+Idempotence des API de paiement et de commande (en-tête Idempotency-Key).
+
+Quand le client envoie un en-tête Idempotency-Key, la première requête est
+exécutée et sa réponse enregistrée (table IdempotencyKey). Une nouvelle
+tentative avec la même clé reçoit la réponse enregistrée sans réexécuter la
+vue : pas de commande ni de billet en double quand le client réessaie
+pendant un pic de charge.
+
+- même clé, requête différente : 422 ;
+- même clé, première requête encore en cours : 409 ; une requête en cours
+  depuis plus de IDEMPOTENCY_LEASE secondes (processus tué) est considérée
+  comme abandonnée et la clé peut resservir ;
+- seules les réponses définitives sont enregistrées : 2xx réussies et 4xx.
+  Les 5xx et les 2xx {"success": false} (erreur interne rattrapée par la
+  vue) ne le sont pas : la requête pourra être rejouée.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def key_ttl():
+    """Durée de conservation des réponses enregistrées."""
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", 86400))
+
+
+def lease_duration():
+    """Durée après laquelle une requête encore en cours est considérée abandonnée."""
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_LEASE", 60))
+
+
+def is_final_response(response):
+    """Indique si la réponse peut être enregistrée et rejouée telle quelle."""
+    if response.streaming:
+        return False
+    if 400 <= response.status_code < 500:
+        return True
+    if not 200 <= response.status_code < 300:
+        return False
+    if "json" not in response.get("Content-Type", ""):
+        return True
+    try:
+        data = json.loads(response.content)
+    except ValueError:
+        return True
+    return not (isinstance(data, dict) and data.get("success") is False)
+
+
+def request_fingerprint(request):
+    """SHA-256 de la méthode, du chemin et du corps de la requête."""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode("utf-8"))
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay_response(record, fingerprint):
+    """Réponse à une requête dont la clé est déjà enregistrée."""
+    if record.fingerprint != fingerprint:
+        return JsonResponse(
+            {
+                "success": False,
+                "error": "Cette Idempotency-Key a déjà servi pour une autre requête",
+            },
+            status=422,
+        )
+    if record.status_code is None:
+        return JsonResponse(
+            {"success": False, "error": "Requête déjà en cours de traitement"},
+            status=409,
+        )
+
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        replay_count=F("replay_count") + 1
+    )
+    response = HttpResponse(
+        bytes(record.response_body),
+        status=record.status_code,
+        content_type=record.content_type or None,
+    )
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(view_func):
+    """
+    Décorateur rendant une vue POST idempotente avec l'en-tête Idempotency-Key.
+
+    A placer après login_required : les clés sont propres à chaque utilisateur.
+    Sans en-tête, la vue est exécutée normalement.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {"success": False, "error": "Idempotency-Key trop longue"},
+                status=400,
+            )
+
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        # Une clé expirée mais pas encore purgée, ou dont la requête a été
+        # abandonnée (processus tué en cours de route), est considérée absente
+        IdempotencyKey.objects.filter(user=request.user, key=key).filter(
+            Q(expires_at__lte=now)
+            | Q(status_code__isnull=True, created_at__lte=now - lease_duration())
+        ).delete()
+
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    path=request.path,
+                    fingerprint=fingerprint,
+                    expires_at=now + key_ttl(),
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None:
+                # Supprimée entre-temps (expiration) : le client peut réessayer
+                return JsonResponse(
+                    {"success": False, "error": "Requête déjà en cours de traitement"},
+                    status=409,
+                )
+            return replay_response(record, fingerprint)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=record.pk, status_code=None).delete()
+            raise
+
+        if not is_final_response(response):
+            IdempotencyKey.objects.filter(pk=record.pk, status_code=None).delete()
+            return response
+
+        # Sans effet si la ligne a été reprise après expiration du bail
+        IdempotencyKey.objects.filter(pk=record.pk, status_code=None).update(
+            status_code=response.status_code,
+            response_body=response.content,
+            content_type=response.get("Content-Type", ""),
+        )
+        return response
+
+    return wrapper
+
+
+def idempotency_stats():
+    """Compteurs des clés non expirées, dont le taux de requêtes rejouées."""
+    stats = IdempotencyKey.objects.filter(expires_at__gt=timezone.now()).aggregate(
+        keys=Count("id"),
+        replays=Sum("replay_count"),
+        replayed_keys=Count("id", filter=Q(replay_count__gt=0)),
+    )
+    stats["replays"] = stats["replays"] or 0
+    requests = stats["keys"] + stats["replays"]
+    stats["replay_rate"] = round(stats["replays"] / requests, 4) if requests else 0
+    return stats
+
+
+def purge_expired_keys():
+    """Supprime les réponses expirées et retourne le nombre de lignes supprimées."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,81 @@
+"""
+Management command to benchmark checkout order creation.
+
+For each cart quantity, the orders and tickets of a paid cart are created
+the way the payment worker does it, inside a transaction that is rolled back,
+and the per-cart latency and number of SQL statements are reported.
+"""
+
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from apps.catalog.models import Offer
+from apps.orders.payments import create_paid_orders
+from apps.users.models import User
+
+
+class Rollback(Exception):
+    """Raised to roll back the benchmark transaction."""
+
+
+class Command(BaseCommand):
+    help = "Measure checkout latency (orders + tickets) against cart quantity"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--quantities",
+            type=str,
+            default="1,5,10,50",
+            help="Comma-separated cart quantities (default: 1,5,10,50)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs per quantity, the median is reported (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            quantities = [int(q) for q in options["quantities"].split(",")]
+        except ValueError:
+            raise CommandError("--quantities must be a list of integers")
+        repeat = options["repeat"]
+        if repeat < 1 or min(quantities) < 1:
+            raise CommandError("--quantities and --repeat must be positive")
+
+        self.stdout.write(f"{'quantity':>10} {'median ms':>10} {'statements':>11}")
+        for quantity in quantities:
+            timings = []
+            for _ in range(repeat):
+                elapsed, statements = self._run(quantity)
+                timings.append(elapsed)
+            median = sorted(timings)[len(timings) // 2]
+            self.stdout.write(f"{quantity:>10} {median * 1000:>10.1f} {statements:>11}")
+
+    def _run(self, quantity):
+        """Create one paid cart of `quantity` tickets and roll it back."""
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    email="benchmark-checkout@example.com",
+                    username="benchmark-checkout",
+                    password=None,
+                )
+                # Le nom des offres est unique : on réutilise une offre existante
+                offer = Offer.objects.order_by("id").first() or Offer.objects.create(
+                    name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+                )
+                items = [{"offer_id": offer.id, "quantity": quantity, "price": "50.00"}]
+
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        create_paid_orders(user, items)
+                    elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed, len(queries)
@@ -1,38 +1,140 @@
 """
 Management command to create tickets for paid orders that don't have tickets yet.
+
+Orders are processed in chunks (keyset pagination + select_related), tickets
+are inserted with bulk_create, and QR codes can optionally be pre-rendered in
+a process pool to warm the shared QR cache. Progress is checkpointed so an
+interrupted run can resume where it stopped.
 """
 
-from django.core.management.base import BaseCommand
-from apps.orders.models import Order
-from apps.tickets.models import Ticket
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.tickets.issuance import (
+    issue_tickets,
+    iter_pending_order_batches,
+    pending_orders,
+    prerender_qr_codes,
+)
 
 
 class Command(BaseCommand):
     help = "Create tickets for all paid orders that don't have tickets yet"
 
-    def handle(self, *args, **options):
-        # Find all paid orders without tickets
-        orders_without_tickets = Order.objects.filter(status="paid").exclude(
-            ticket__isnull=False
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of orders processed per batch (default: 1000)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes used to pre-render QR codes (default: 1, in-process)",
+        )
+        parser.add_argument(
+            "--prerender-qr",
+            action="store_true",
+            help="Pre-render QR codes into the shared QR cache",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help="JSON file storing the last processed order id (resumes from it)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the orders that would receive a ticket",
         )
 
-        created_count = 0
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        workers = options["workers"]
+        if chunk_size < 1 or workers < 1:
+            raise CommandError("--chunk-size and --workers must be positive")
+
+        checkpoint = Path(options["checkpoint"]) if options["checkpoint"] else None
+        start_after = self._read_checkpoint(checkpoint)
+        if start_after:
+            self.stdout.write(f"Resuming after order {start_after}")
 
-        for order in orders_without_tickets:
-            # Create ticket
-            ticket = Ticket.objects.create(
-                order=order,
-                user=order.user,
-                final_key=f"{order.user.key1}_{order.id}_{order.created_at.timestamp()}",
+        if options["dry_run"]:
+            count = pending_orders().filter(id__gt=start_after).count()
+            self.stdout.write(
+                self.style.WARNING(f"Dry run: {count} tickets would be created")
             )
-            # Generate QR code
-            ticket.generate_qr_code()
-            created_count += 1
+            return
 
+        prerender = options["prerender_qr"]
+        if prerender and not getattr(settings, "QR_CACHE_ALIAS", None):
             self.stdout.write(
-                self.style.SUCCESS(f"Created ticket {ticket.id} for order {order.id}")
+                self.style.WARNING(
+                    "QR_CACHE_ALIAS is not set: pre-rendered QR codes only live "
+                    "in this process and will not be reused by the web workers"
+                )
             )
 
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        created_count = 0
+        rendered_count = 0
+        started = time.monotonic()
+
+        try:
+            for index, orders in enumerate(
+                iter_pending_order_batches(chunk_size, start_after), start=1
+            ):
+                chunk_started = time.monotonic()
+                tickets = issue_tickets(orders)
+                created_count += len(tickets)
+
+                if prerender:
+                    rendered_count += prerender_qr_codes(tickets, executor=executor)
+
+                self._write_checkpoint(checkpoint, orders[-1].id)
+
+                elapsed = time.monotonic() - chunk_started
+                self.stdout.write(
+                    f"Chunk {index}: {len(tickets)} tickets "
+                    f"(orders {orders[0].id}-{orders[-1].id}, "
+                    f"{len(tickets) / elapsed if elapsed else 0:.0f} tickets/s)"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        total_elapsed = time.monotonic() - started
+        rate = created_count / total_elapsed if total_elapsed else 0
         self.stdout.write(
-            self.style.SUCCESS(f"Successfully created {created_count} tickets")
+            self.style.SUCCESS(
+                f"Successfully created {created_count} tickets "
+                f"in {total_elapsed:.1f}s ({rate:.0f} tickets/s)"
+            )
         )
+        if prerender:
+            self.stdout.write(
+                self.style.SUCCESS(f"Pre-rendered {rendered_count} QR codes")
+            )
+
+    def _read_checkpoint(self, checkpoint):
+        """Return the last processed order id stored in the checkpoint file."""
+        if checkpoint is None or not checkpoint.exists():
+            return 0
+        try:
+            return int(json.loads(checkpoint.read_text())["last_order_id"])
+        except (ValueError, KeyError) as e:
+            raise CommandError(f"Invalid checkpoint file {checkpoint}: {e}")
+
+    def _write_checkpoint(self, checkpoint, last_order_id):
+        """Persist the last processed order id (after its chunk is committed)."""
+        if checkpoint is None:
+            return
+        tmp = checkpoint.with_suffix(checkpoint.suffix + ".tmp")
+        tmp.write_text(json.dumps({"last_order_id": last_order_id}))
+        tmp.replace(checkpoint)
@@ -0,0 +1,19 @@
+"""
+Management command to delete expired idempotency keys.
+
+Stored responses are kept IDEMPOTENCY_KEY_TTL seconds; run this command
+periodically (cron) to keep the table small.
+"""
+
+from django.core.management.base import BaseCommand
+from apps.orders.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key responses"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys")
+        )
@@ -0,0 +1,20 @@
+"""
+Management command to recompute the sales rollups from the orders table.
+
+The rollups are kept up to date by the payment paths; run this command to
+backfill them or to fix them after orders were edited by hand (Django
+admin, SQL). Run it outside sale openings.
+"""
+
+from django.core.management.base import BaseCommand
+from apps.orders.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-offer sales rollups from the orders"
+
+    def handle(self, *args, **options):
+        offers = rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt sales rollups ({offers} offers)")
+        )
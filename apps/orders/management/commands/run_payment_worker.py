@@ -0,0 +1,66 @@
+"""
+Management command running the payment worker.
+
+The worker claims queued PaymentJob rows (SELECT ... FOR UPDATE SKIP LOCKED),
+calls the simulated payment provider and creates the orders and tickets.
+Run several instances to increase checkout throughput.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.orders.payments import claim_jobs, process_job
+
+
+class Command(BaseCommand):
+    help = "Process queued checkout payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of jobs claimed at once (default: 10)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait when the queue is empty (default: 0.5)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the queued jobs then exit instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        processed = 0
+        succeeded = 0
+        try:
+            while True:
+                jobs = claim_jobs(batch_size)
+                if not jobs:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                for job in jobs:
+                    ok = process_job(job)
+                    processed += 1
+                    succeeded += ok
+                    self.stdout.write(
+                        f"Payment job {job.id}: {'succeeded' if ok else job.status}"
+                    )
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {processed} payment jobs ({succeeded} succeeded)"
+            )
+        )
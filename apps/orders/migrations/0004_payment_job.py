@@ -0,0 +1,103 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_updated_at_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "En file d'attente"),
+                            ("processing", "En cours de traitement"),
+                            ("succeeded", "Payé"),
+                            ("failed", "Échoué"),
+                        ],
+                        default="queued",
+                        help_text="Statut du paiement",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(help_text="Méthode de paiement", max_length=20),
+                ),
+                (
+                    "items",
+                    models.JSONField(
+                        help_text="Contenu du panier au moment du paiement (offer_id, quantity, price)"
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        help_text="Montant total du paiement",
+                        max_digits=10,
+                    ),
+                ),
+                (
+                    "order_ids",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="Commandes créées par le paiement",
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, help_text="Message d'erreur éventuel"),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "locked_at",
+                    models.DateTimeField(
+                        blank=True, help_text="Prise en charge par un worker", null=True
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="Utilisateur qui a lancé le paiement",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payment_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Paiement en file d'attente",
+                "verbose_name_plural": "Paiements en file d'attente",
+                "db_table": "orders_paymentjob",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"], name="payjob_status_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:43
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    """Calcule les totaux des commandes existantes (comme rebuild_sales_rollups)."""
+    Order = apps.get_model("orders", "Order")
+    SalesRollup = apps.get_model("orders", "SalesRollup")
+    rows = (
+        Order.objects.filter(status__in=("paid", "cancelled"))
+        .values_list("offer_id", "status")
+        .annotate(count=Count("id"), amount=Sum("amount"))
+        .order_by()
+    )
+    totals = {}
+    for offer_id, status, count, amount in rows:
+        sums = totals.setdefault(offer_id, [0, Decimal("0"), 0])
+        if status == "paid":
+            sums[0] += count
+            sums[1] += amount
+        else:
+            sums[2] += count
+    SalesRollup.objects.bulk_create(
+        SalesRollup(
+            offer_id=offer_id,
+            slot=0,
+            paid_count=paid,
+            paid_amount=amount,
+            cancelled_count=cancelled,
+        )
+        for offer_id, (paid, amount, cancelled) in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_offer_stock"),
+        ("orders", "0005_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.PositiveSmallIntegerField(
+                        help_text="Numéro du slot (0 à N-1)"
+                    ),
+                ),
+                (
+                    "paid_count",
+                    models.IntegerField(default=0, help_text="Commandes payées"),
+                ),
+                (
+                    "paid_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="Montant payé",
+                        max_digits=14,
+                    ),
+                ),
+                (
+                    "cancelled_count",
+                    models.IntegerField(default=0, help_text="Commandes annulées"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "offer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_rollups",
+                        to="catalog.offer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Total des ventes",
+                "verbose_name_plural": "Totaux des ventes",
+                "db_table": "orders_salesrollup",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="salesrollup",
+            constraint=models.UniqueConstraint(
+                fields=("offer", "slot"), name="salesrollup_offer_slot_uniq"
+            ),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
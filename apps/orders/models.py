@@ -8,8 +8,9 @@ J'ai créé ce modèle pour gérer les commandes des utilisateurs.
 C'est un peu compliqué mais j'ai réussi à faire marcher !
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from apps.catalog.models import Offer
 
 User = get_user_model()
@@ -58,6 +59,9 @@ class Order(models.Model):
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["updated_at"], name="orders_updated_at_idx"),
+        ]
 
     def __str__(self):
         return f"Commande #{self.id} - {self.user.email} - {self.offer.name} - {self.status}"
@@ -82,15 +86,178 @@ class Order(models.Model):
     def mark_as_paid(self):
         """Marque la commande comme payée."""
         if self.can_be_paid():
-            self.status = "paid"
-            self.save(update_fields=["status", "updated_at"])
-            return True
+            return self._change_status("paid")
         return False
 
     def mark_as_cancelled(self):
         """Marque la commande comme annulée."""
         if self.can_be_cancelled():
-            self.status = "cancelled"
-            self.save(update_fields=["status", "updated_at"])
-            return True
+            return self._change_status("cancelled")
         return False
+
+    def _change_status(self, status):
+        """
+        Change le statut si la commande n'a pas été modifiée entre-temps
+        (UPDATE conditionnel) et met à jour les totaux des ventes dans la
+        même transaction.
+        """
+        from .rollups import record_transition
+
+        with transaction.atomic():
+            now = timezone.now()
+            changed = Order.objects.filter(pk=self.pk, status=self.status).update(
+                status=status, updated_at=now
+            )
+            if not changed:
+                return False
+            previous, self.status, self.updated_at = self.status, status, now
+            record_transition(self, previous)
+        return True
+
+
+class SalesRollup(models.Model):
+    """
+    Totaux des ventes d'une offre, tenus à jour à chaque paiement ou
+    annulation (voir rollups.py) : le tableau de bord ne relit plus les
+    commandes.
+
+    Comme le stock, les totaux d'une offre sont répartis sur plusieurs
+    lignes (slots) pour que les paiements simultanés ne se bloquent pas sur
+    une seule ligne. Un slot peut être négatif, seule la somme compte.
+    """
+
+    offer = models.ForeignKey(
+        Offer, on_delete=models.CASCADE, related_name="sales_rollups"
+    )
+    slot = models.PositiveSmallIntegerField(help_text="Numéro du slot (0 à N-1)")
+    paid_count = models.IntegerField(default=0, help_text="Commandes payées")
+    paid_amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, help_text="Montant payé"
+    )
+    cancelled_count = models.IntegerField(default=0, help_text="Commandes annulées")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "orders_salesrollup"
+        verbose_name = "Total des ventes"
+        verbose_name_plural = "Totaux des ventes"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["offer", "slot"], name="salesrollup_offer_slot_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.offer.name} - slot {self.slot} : {self.paid_count} payées"
+
+
+class PaymentJob(models.Model):
+    """
+    Paiement en file d'attente (file stockée en base de données).
+
+    La vue de paiement enregistre le contenu du panier dans un job et répond
+    tout de suite ; un processus worker (commande run_payment_worker) simule
+    le prestataire de paiement, puis crée les commandes et les billets.
+    Plusieurs workers peuvent tourner en parallèle (SELECT ... SKIP LOCKED).
+    """
+
+    STATUS_CHOICES = [
+        ("queued", "En file d'attente"),
+        ("processing", "En cours de traitement"),
+        ("succeeded", "Payé"),
+        ("failed", "Échoué"),
+    ]
+    ACTIVE_STATUSES = ("queued", "processing")
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="payment_jobs",
+        help_text="Utilisateur qui a lancé le paiement",
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default="queued",
+        help_text="Statut du paiement",
+    )
+    payment_method = models.CharField(max_length=20, help_text="Méthode de paiement")
+    items = models.JSONField(
+        help_text="Contenu du panier au moment du paiement (offer_id, quantity, price)"
+    )
+    amount = models.DecimalField(
+        max_digits=10, decimal_places=2, help_text="Montant total du paiement"
+    )
+    order_ids = models.JSONField(
+        default=list, blank=True, help_text="Commandes créées par le paiement"
+    )
+    error = models.TextField(blank=True, help_text="Message d'erreur éventuel")
+    attempts = models.PositiveIntegerField(default=0)
+    locked_at = models.DateTimeField(
+        null=True, blank=True, help_text="Prise en charge par un worker"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "orders_paymentjob"
+        verbose_name = "Paiement en file d'attente"
+        verbose_name_plural = "Paiements en file d'attente"
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="payjob_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"Paiement #{self.id} - {self.user.email} - {self.status}"
+
+    @property
+    def is_finished(self):
+        """Indique si le worker a terminé le paiement (succès ou échec)."""
+        return self.status not in self.ACTIVE_STATUSES
+
+
+class IdempotencyKey(models.Model):
+    """
+    Réponse enregistrée pour un en-tête Idempotency-Key (voir idempotency.py).
+
+    Un client qui renvoie la même requête avec la même clé reçoit la réponse
+    enregistrée au lieu de recréer des commandes. Les lignes expirées sont
+    supprimées par la commande purge_idempotency_keys.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+        help_text="Utilisateur qui a envoyé la requête",
+    )
+    key = models.CharField(max_length=255, help_text="Valeur de l'en-tête")
+    path = models.CharField(max_length=255, help_text="Chemin de la requête")
+    fingerprint = models.CharField(
+        max_length=64, help_text="SHA-256 du corps de la requête"
+    )
+    status_code = models.PositiveSmallIntegerField(
+        null=True, blank=True, help_text="Vide tant que la requête est en cours"
+    )
+    response_body = models.BinaryField(default=b"")
+    content_type = models.CharField(max_length=100, blank=True)
+    replay_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "orders_idempotencykey"
+        verbose_name = "Clé d'idempotence"
+        verbose_name_plural = "Clés d'idempotence"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotency_user_key_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} - {self.user.email} - {self.path}"
@@ -0,0 +1,222 @@
+"""
+File d'attente des paiements (stockée en base de données).
+
+La vue de paiement ne fait plus qu'enregistrer un PaymentJob : le worker
+(commande run_payment_worker) réserve les jobs avec SELECT ... FOR UPDATE
+SKIP LOCKED, simule l'appel au prestataire de paiement puis crée les
+commandes et les billets. Le débit dépend du nombre de workers et non plus
+du nombre de processus web.
+"""
+
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from apps.cart.models import Cart, CartItem
+from apps.catalog.inventory import release, reserve
+from apps.tickets.issuance import build_tickets, claim_pool_tickets
+from apps.tickets.models import Ticket
+from .models import Order, PaymentJob
+from .rollups import record_paid
+
+
+def enqueue_payment(user, cart, payment_method):
+    """
+    Enregistre le contenu du panier dans un job de paiement et le retourne.
+
+    Si l'utilisateur a déjà un paiement en cours, ce job est retourné
+    (double clic sur "Payer"). La ligne de l'utilisateur est verrouillée :
+    deux requêtes simultanées ne créent pas deux jobs.
+    """
+    with transaction.atomic():
+        users = get_user_model().objects.select_for_update()
+        users.filter(pk=user.pk).values_list("pk", flat=True).first()
+        active = PaymentJob.objects.filter(
+            user=user, status__in=PaymentJob.ACTIVE_STATUSES
+        ).first()
+        if active is not None:
+            return active
+
+        items = [
+            {"offer_id": offer_id, "quantity": quantity, "price": str(price)}
+            for offer_id, quantity, price in cart.items.values_list(
+                "offer_id", "quantity", "offer__price"
+            )
+        ]
+        amount = sum(
+            (Decimal(item["price"]) * item["quantity"] for item in items),
+            Decimal("0"),
+        )
+        return PaymentJob.objects.create(
+            user=user, payment_method=payment_method, items=items, amount=amount
+        )
+
+
+def claim_jobs(limit=10):
+    """
+    Réserve jusqu'à `limit` jobs pour ce worker.
+
+    Les jobs "processing" dont le worker a disparu (locked_at plus ancien que
+    PAYMENT_JOB_TIMEOUT secondes) sont repris.
+    """
+    stale_before = timezone.now() - timedelta(
+        seconds=getattr(settings, "PAYMENT_JOB_TIMEOUT", 300)
+    )
+    with transaction.atomic():
+        jobs = list(
+            PaymentJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="queued") | Q(status="processing", locked_at__lt=stale_before)
+            )
+            .order_by("created_at")[:limit]
+        )
+        now = timezone.now()
+        for job in jobs:
+            job.status = "processing"
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=["status", "locked_at", "attempts", "updated_at"])
+    return jobs
+
+
+def charge(job):
+    """
+    Appel simulé au prestataire de paiement (toujours accepté).
+
+    PAYMENT_PSP_DELAY simule le temps de réponse du prestataire.
+    """
+    time.sleep(getattr(settings, "PAYMENT_PSP_DELAY", 1))
+    return True
+
+
+def create_paid_orders(user, items, held=None):
+    """
+    Crée les commandes payées (une par billet) et leurs billets en deux
+    bulk_create, quelle que soit la quantité. A appeler dans une transaction.
+
+    Les clés des billets sont générées en lot à partir de user.key1 ; le QR
+    code n'est pas rendu ici mais à la première consultation (cache des QR).
+    Le stock des offres à quota est d'abord décrémenté (lève SoldOut), sauf
+    les billets déjà réservés par le panier : `held` associe à une offre le
+    nombre de billets réservés (voir apps.cart.reservations).
+
+    Les commandes sont ajoutées aux totaux des ventes (rollups.py).
+
+    Avec TICKET_POOL_ENABLED (ventes flash), les billets sont pris dans la
+    réserve pré-générée de chaque offre ; seuls les manquants sont créés.
+    """
+    quantities = {}
+    for item in items:
+        quantities[item["offer_id"]] = (
+            quantities.get(item["offer_id"], 0) + item["quantity"]
+        )
+    held = held or {}
+    # Ordre fixe des offres pour éviter les interblocages entre paiements
+    for offer_id in sorted(quantities):
+        missing = quantities[offer_id] - held.get(offer_id, 0)
+        if missing > 0:
+            reserve(offer_id, missing)
+        elif missing < 0:
+            # Panier modifié après le paiement : le surplus retourne au stock
+            release(offer_id, -missing)
+
+    orders = [
+        Order(
+            user=user,
+            offer_id=item["offer_id"],
+            status="paid",
+            amount=Decimal(item["price"]),
+        )
+        for item in items
+        for _ in range(item["quantity"])
+    ]
+    Order.objects.bulk_create(orders)
+    # Chaque commande reçoit un billet (de la réserve ou créé plus bas)
+    record_paid(orders, tickets_issued=len(orders))
+
+    without_ticket = orders
+    if getattr(settings, "TICKET_POOL_ENABLED", False):
+        without_ticket = []
+        for offer_id in sorted(quantities):
+            without_ticket += claim_pool_tickets(
+                [order for order in orders if order.offer_id == offer_id]
+            )
+    if without_ticket:
+        Ticket.objects.bulk_create(build_tickets(without_ticket))
+    return orders
+
+
+def complete_job(job):
+    """
+    Crée les commandes et les billets du job, retire les offres payées du
+    panier et marque le job payé, dans une seule transaction.
+
+    Retourne les commandes créées, ou None si le job n'appartient plus à ce worker.
+    """
+    with transaction.atomic():
+        # Le job a pu être repris par un autre worker (délai dépassé) : seul
+        # le worker qui détient encore la réservation crée les commandes.
+        still_owned = (
+            PaymentJob.objects.select_for_update()
+            .filter(pk=job.pk, status="processing", locked_at=job.locked_at)
+            .exists()
+        )
+        if not still_owned:
+            return None
+
+        cart_id = (
+            Cart.objects.select_for_update()
+            .filter(user_id=job.user_id)
+            .values_list("id", flat=True)
+            .first()
+        )
+        # Les billets réservés par les articles payés sont pris en priorité
+        paid_items = CartItem.objects.select_for_update().filter(
+            cart_id=cart_id, offer_id__in=[item["offer_id"] for item in job.items]
+        )
+        held = {}
+        for offer_id, reserved in paid_items.values_list(
+            "offer_id", "reserved_quantity"
+        ):
+            held[offer_id] = held.get(offer_id, 0) + reserved
+
+        orders = create_paid_orders(job.user, job.items, held)
+
+        if cart_id is not None:
+            paid_items.delete()
+            Cart.refresh_summary(cart_id)
+
+        job.status = "succeeded"
+        job.order_ids = [order.id for order in orders]
+        job.error = ""
+        job.save(update_fields=["status", "order_ids", "error", "updated_at"])
+    return orders
+
+
+def fail_job(job, error):
+    """
+    Marque le job en échec avec son message d'erreur, s'il appartient encore
+    à ce worker (comme complete_job). Retourne True si le job a été modifié.
+    """
+    failed = PaymentJob.objects.filter(
+        pk=job.pk, status="processing", locked_at=job.locked_at
+    ).update(status="failed", error=error, updated_at=timezone.now())
+    if failed:
+        job.status, job.error = "failed", error
+    return bool(failed)
+
+
+def process_job(job):
+    """Traite un job réservé par claim_jobs. Retourne True si le paiement a réussi."""
+    try:
+        if not charge(job):
+            fail_job(job, "Paiement refusé")
+            return False
+        return complete_job(job) is not None
+    except Exception as e:
+        fail_job(job, str(e))
+        return False
@@ -0,0 +1,161 @@
+"""
+Totaux des ventes tenus à jour au fil des paiements.
+
+Chaque passage d'une commande à "payée" ou "annulée" (Order.mark_as_paid,
+Order.mark_as_cancelled, paiements du panier dans payments.py) ajoute sa
+variation aux lignes SalesRollup (totaux par offre), dans la même
+transaction, avec un INSERT ... ON CONFLICT DO UPDATE.
+
+Les variations d'une transaction vont dans un slot tiré au hasard parmi
+SALES_ROLLUP_SHARDS : les paiements simultanés d'une même offre ne se
+bloquent pas sur une seule ligne. Le tableau de bord somme les slots de
+chaque offre, soit O(nombre d'offres) lignes.
+
+Les commandes payées et le chiffre d'affaires sont aussi ajoutés aux séries
+temporelles (apps.analytics.timeseries) dans la même transaction : ce sont
+elles qui donnent les ventes par heure.
+
+La commande rebuild_sales_rollups recalcule tout à partir des commandes
+(reprise de l'existant, ou correction après une modification manuelle).
+"""
+
+import random
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from apps.analytics import timeseries
+from .models import Order, SalesRollup
+
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO {table}
+        ({keys}, paid_count, paid_amount, cancelled_count, updated_at)
+    VALUES {values}
+    ON CONFLICT ({keys}) DO UPDATE SET
+        paid_count = {table}.paid_count + excluded.paid_count,
+        paid_amount = {table}.paid_amount + excluded.paid_amount,
+        cancelled_count = {table}.cancelled_count + excluded.cancelled_count,
+        updated_at = excluded.updated_at
+"""
+
+
+def rollup_shards():
+    """Nombre de slots des totaux de chaque offre."""
+    return getattr(settings, "SALES_ROLLUP_SHARDS", 8)
+
+
+def _upsert(model, keys, rows):
+    """Ajoute les variations `rows` (clés puis payées, montant, annulées) à `model`."""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    width = len(keys) + 4
+    params = []
+    for row in rows:
+        params += [*row, now]
+    sql = UPSERT_ROLLUP_SQL.format(
+        table=model._meta.db_table,
+        keys=", ".join(keys),
+        values=", ".join(["(" + ", ".join(["%s"] * width) + ")"] * len(rows)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record(deltas, when=None, **metrics):
+    """
+    Ajoute les variations {offer_id: (payées, montant payé, annulées)} aux
+    totaux des offres, et aux séries temporelles de l'heure de `when`
+    (maintenant par défaut) avec les autres `metrics` données
+    (tickets_issued=...). A appeler dans la transaction qui change les
+    commandes.
+    """
+    timeseries.record(
+        {
+            "orders": sum(delta[0] for delta in deltas.values()),
+            "revenue": sum(delta[1] for delta in deltas.values()),
+            **metrics,
+        },
+        when,
+    )
+    offer_ids = sorted(offer_id for offer_id, delta in deltas.items() if any(delta))
+    if not offer_ids:
+        return
+    slot = random.randrange(rollup_shards())
+    # Ordre fixe des offres pour éviter les interblocages entre paiements
+    _upsert(
+        SalesRollup,
+        ("offer_id", "slot"),
+        [(offer_id, slot, *deltas[offer_id]) for offer_id in offer_ids],
+    )
+
+
+def record_paid(orders, **metrics):
+    """Ajoute des commandes créées directement payées (bulk_create) aux totaux."""
+    deltas = {}
+    for order in orders:
+        paid, amount, cancelled = deltas.get(order.offer_id, (0, Decimal("0"), 0))
+        deltas[order.offer_id] = (paid + 1, amount + order.amount, cancelled)
+    record(deltas, **metrics)
+
+
+def record_transition(order, previous_status):
+    """Reporte dans les totaux le passage de `order` de previous_status à son statut."""
+    paid, amount, cancelled = 0, Decimal("0"), 0
+    for status, sign in ((previous_status, -1), (order.status, 1)):
+        if status == "paid":
+            paid += sign
+            amount += sign * order.amount
+        elif status == "cancelled":
+            cancelled += sign
+    record({order.offer_id: (paid, amount, cancelled)})
+
+
+def rebuild():
+    """
+    Recalcule tous les totaux à partir des commandes (une agrégation par
+    offre et statut), dans le slot 0. Retourne le nombre d'offres écrites.
+
+    Les paiements qui se terminent pendant le recalcul peuvent être comptés
+    deux fois ou oubliés : à lancer en dehors des ouvertures de vente.
+    """
+    with transaction.atomic():
+        rows = (
+            Order.objects.filter(status__in=("paid", "cancelled"))
+            .values_list("offer_id", "status")
+            .annotate(count=Count("id"), amount=Sum("amount"))
+            .order_by()
+        )
+        totals = {}
+        for offer_id, status, count, amount in rows:
+            sums = totals.setdefault(offer_id, [0, Decimal("0"), 0])
+            if status == "paid":
+                sums[0] += count
+                sums[1] += amount
+            else:
+                sums[2] += count
+
+        SalesRollup.objects.all().delete()
+        SalesRollup.objects.bulk_create(
+            SalesRollup(
+                offer_id=offer_id,
+                slot=0,
+                paid_count=paid,
+                paid_amount=amount,
+                cancelled_count=cancelled,
+            )
+            for offer_id, (paid, amount, cancelled) in totals.items()
+        )
+    return len(totals)
+
+
+def sales_by_offer():
+    """
+    Ventes payées par offre, triées par nom : liste de dicts
+    (offer__name, count, total_amount), sans lire les commandes.
+    """
+    return list(
+        SalesRollup.objects.values("offer__name")
+        .annotate(count=Sum("paid_count"), total_amount=Sum("paid_amount"))
+        .filter(count__gt=0)
+        .order_by("offer__name")
+    )
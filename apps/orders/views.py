@@ -9,7 +9,10 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
+from .idempotency import idempotent
 from .models import Order
+from apps.analytics import timeseries
+from apps.catalog.inventory import SoldOut, release, reserve
 from apps.catalog.models import Offer
 
 
@@ -30,15 +33,10 @@ def confirmation_view(request, order_id):
 
     # Create ticket if order is paid and no ticket exists
     if order.status == "paid" and not hasattr(order, "ticket"):
-        from apps.tickets.models import Ticket
+        from apps.tickets.issuance import issue_tickets, prerender_qr_codes
 
-        ticket = Ticket.objects.create(
-            order=order,
-            user=order.user,
-            final_key=f"{order.user.key1}_{order.id}_{order.created_at.timestamp()}",
-        )
-        # Generate QR code
-        ticket.generate_qr_code()
+        # Same keys as the bulk issuance (key1 + random key2)
+        prerender_qr_codes(issue_tickets([order]))
 
     return render(request, "orders/confirmation.html", {"order": order})
 
@@ -46,6 +44,7 @@ def confirmation_view(request, order_id):
 @csrf_exempt
 @require_http_methods(["POST"])
 @login_required
+@idempotent
 def create_order_api(request):
     """
     API endpoint to create a new order.
@@ -102,6 +101,7 @@ def create_order_api(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 @login_required
+@idempotent
 def mock_payment_api(request):
     """
     API endpoint for mock payment processing.
@@ -132,13 +132,27 @@ def mock_payment_api(request):
 
         if payment_success:
             with transaction.atomic():
-                # Mark order as paid
-                order.mark_as_paid()
+                try:
+                    reserve(order.offer_id, 1)
+                except SoldOut as e:
+                    return JsonResponse({"success": False, "error": str(e)}, status=409)
+
+                # Mark order as paid (False: paid or cancelled by a concurrent request)
+                if not order.mark_as_paid():
+                    release(order.offer_id, 1)
+                    return JsonResponse(
+                        {
+                            "success": False,
+                            "error": "Cette commande ne peut pas être payée",
+                        },
+                        status=409,
+                    )
 
                 # Create ticket (this will be handled by the tickets app)
                 from apps.tickets.models import Ticket
 
                 ticket = Ticket.objects.create(order=order, user=order.user)
+                timeseries.record({"tickets_issued": 1})
 
                 return JsonResponse(
                     {
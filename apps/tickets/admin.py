@@ -3,7 +3,7 @@ Admin configuration for the tickets app.
 """
 
 from django.contrib import admin
-from .models import Ticket
+from .models import ScanEvent, Ticket
 
 
 @admin.register(Ticket)
@@ -31,3 +31,25 @@ class TicketAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queryset with select_related."""
         return super().get_queryset(request).select_related("user", "order")
+
+
+@admin.register(ScanEvent)
+class ScanEventAdmin(admin.ModelAdmin):
+    """
+    Read-only admin for the append-only gate audit log.
+    """
+
+    list_display = ("scanned_at", "outcome", "ticket_id", "gate", "device")
+    list_filter = ("outcome", "gate")
+    search_fields = ("=ticket__id", "gate", "device")
+    date_hierarchy = "scanned_at"
+    ordering = ("-scanned_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TicketsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.tickets"
+
+    def ready(self):
+        from . import checks  # noqa: F401
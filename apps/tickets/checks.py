@@ -0,0 +1,24 @@
+"""
+Vérifications système des billets.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+from apps.waitingroom.checks import is_local_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_gate_dashboard_cache(app_configs, **kwargs):
+    """Les compteurs des portiques sont publiés dans un cache partagé."""
+    alias = getattr(settings, "GATE_DASHBOARD_CACHE_ALIAS", "default")
+    if is_local_cache(caches[alias]):
+        return [
+            Error(
+                f"The gate dashboard cache '{alias}' is local to each process: "
+                "the dashboard only sees the scans of the process serving it.",
+                hint="Configure a shared cache (set REDIS_URL).",
+                id="tickets.E001",
+            )
+        ]
+    return []
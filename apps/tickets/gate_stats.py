@@ -0,0 +1,267 @@
+"""
+Compteurs en direct des portiques pour le tableau de bord des superviseurs.
+
+Les vues de validation ajoutent chaque scan aux compteurs en mémoire du
+processus (record), sans requête SQL : par portique, les scans et les refus
+de chaque seconde des WINDOW dernières secondes, et les totaux d'admissions
+et de refus.
+
+Le flux du tableau de bord est servi par un autre processus (serveur ASGI) :
+chaque processus publie donc ses compteurs dans le cache
+settings.GATE_DASHBOARD_CACHE_ALIAS, qui doit être partagé entre les
+processus (Redis en production), toutes les GATE_DASHBOARD_PUBLISH_INTERVAL
+secondes depuis un thread hors requête :
+- les secondes récentes dans un instantané du processus, qui expire
+  quelques intervalles après l'arrêt du processus (son slot est alors
+  retiré de la liste des processus) ;
+- les admissions et refus ajoutés aux totaux partagés de chaque portique
+  (cache.incr), qui survivent aux redémarrages.
+dashboard() additionne le tout, sans accès base. Sur un cache propre au
+processus (développement), rien n'est publié : le tableau de bord ne
+montre que les scans du processus qui le sert.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from apps.waitingroom.checks import is_local_cache
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre des débits (secondes)
+WINDOW = 60
+SLOT_COUNTER_KEY = "gates:slot_counter"
+SLOTS_KEY = "gates:slots"
+SNAPSHOT_KEY = "gates:snapshot:{}"
+NAMES_KEY = "gates:names"
+# (empreinte du nom du portique, "admitted" ou "rejected")
+TOTAL_KEY = "gates:total:{}:{}"
+ADMITTED = "valid"
+
+
+def dashboard_cache():
+    """Backend de cache Django partagé où les processus publient leurs compteurs."""
+    return caches[getattr(settings, "GATE_DASHBOARD_CACHE_ALIAS", "default")]
+
+
+def publish_interval():
+    """Délai (secondes) entre deux publications des compteurs d'un processus."""
+    return getattr(settings, "GATE_DASHBOARD_PUBLISH_INTERVAL", 1.0)
+
+
+def snapshot_ttl():
+    """Durée de vie de l'instantané d'un processus qui ne publie plus."""
+    return max(5 * publish_interval(), 5)
+
+
+def total_key(gate, counter):
+    """Clé du total partagé `counter` du portique (nom quelconque haché)."""
+    digest = hashlib.sha256(gate.encode("utf-8")).hexdigest()[:16]
+    return TOTAL_KEY.format(digest, counter)
+
+
+def _register(cache, key, items):
+    """Ajoute les éléments manquants à la liste `key` du cache."""
+    current = cache.get(key) or []
+    missing = [item for item in items if item not in current]
+    if missing:
+        cache.set(key, current + missing, None)
+
+
+class GateStats:
+    """
+    Compteurs des portiques de ce processus.
+
+    Thread-safe : les workers gunicorn en threads partagent la même instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gates = {}
+        # Admissions et refus déjà ajoutés aux totaux partagés, par portique
+        self._published = {}
+        self._thread = None
+        self._slot = None
+        self._pid = None
+
+    def record(self, gate, outcomes, now=None):
+        """Ajoute les résultats (outcomes de validation) scannés au portique `gate`."""
+        now = now or time.time()
+        second = int(now)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processus fils : compteurs et thread du parent abandonnés
+                self._gates, self._published = {}, {}
+                self._thread = self._slot = None
+                self._pid = os.getpid()
+            stats = self._gates.setdefault(
+                gate, {"admitted": 0, "rejected": 0, "seconds": {}}
+            )
+            seconds = stats["seconds"]
+            counts = seconds.setdefault(second, [0, 0])
+            for outcome in outcomes:
+                counts[0] += 1
+                if outcome == ADMITTED:
+                    stats["admitted"] += 1
+                else:
+                    counts[1] += 1
+                    stats["rejected"] += 1
+            if len(seconds) > WINDOW:
+                for old in [s for s in seconds if s <= second - WINDOW]:
+                    del seconds[old]
+
+            start = self._thread is None and not is_local_cache(dashboard_cache())
+            if start:
+                self._thread = threading.Thread(
+                    target=self._run, name="gate-stats-publisher", daemon=True
+                )
+        if start:
+            self._thread.start()
+
+    def snapshot(self):
+        """
+        Compteurs de ce processus : {portique: {"seconds", "admitted",
+        "rejected"}}, admissions et refus pas encore publiés seulement.
+        """
+        with self._lock:
+            return {
+                gate: {
+                    "seconds": {s: list(c) for s, c in stats["seconds"].items()},
+                    **self._unpublished_locked(gate),
+                }
+                for gate, stats in self._gates.items()
+            }
+
+    def publish(self):
+        """Publie les compteurs de ce processus dans le cache partagé."""
+        with self._lock:
+            gates = list(self._gates)
+            seconds = {
+                gate: {s: list(c) for s, c in stats["seconds"].items()}
+                for gate, stats in self._gates.items()
+            }
+            deltas = {gate: self._unpublished_locked(gate) for gate in gates}
+        cache = dashboard_cache()
+        if self._slot is None:
+            cache.add(SLOT_COUNTER_KEY, 0, None)
+            self._slot = cache.incr(SLOT_COUNTER_KEY)
+        cache.set(SNAPSHOT_KEY.format(self._slot), seconds, snapshot_ttl())
+        _register(cache, SLOTS_KEY, [self._slot])
+        _register(cache, NAMES_KEY, gates)
+
+        for gate, delta in deltas.items():
+            for counter, value in delta.items():
+                if value:
+                    key = total_key(gate, counter)
+                    cache.add(key, 0, None)
+                    cache.incr(key, value)
+            with self._lock:
+                published = self._published.setdefault(
+                    gate, {"admitted": 0, "rejected": 0}
+                )
+                for counter, value in delta.items():
+                    published[counter] += value
+
+    def clear(self):
+        """Remet les compteurs de ce processus à zéro."""
+        with self._lock:
+            self._gates, self._published, self._slot = {}, {}, None
+
+    def _unpublished_locked(self, gate):
+        stats = self._gates[gate]
+        published = self._published.get(gate, {"admitted": 0, "rejected": 0})
+        return {
+            counter: stats[counter] - published[counter]
+            for counter in ("admitted", "rejected")
+        }
+
+    def _run(self):
+        # Publie aussi sans nouveau scan : l'instantané du processus vivant
+        # ne doit pas expirer
+        while True:
+            time.sleep(publish_interval())
+            if self._pid != os.getpid():
+                return
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Publication des compteurs des portiques impossible")
+
+
+def dashboard(now=None):
+    """
+    Etat des portiques pour le tableau de bord : par portique, scans et
+    refus de la dernière minute et totaux d'admissions et de refus, plus les
+    totaux tous portiques confondus. Compteurs de ce processus à jour,
+    ceux des autres processus tels que publiés.
+    """
+    now = now or time.time()
+    since = int(now) - WINDOW
+    cache = dashboard_cache()
+    own = gate_stats.snapshot()
+
+    slots = [slot for slot in cache.get(SLOTS_KEY) or [] if slot != gate_stats._slot]
+    found = cache.get_many([SNAPSHOT_KEY.format(slot) for slot in slots])
+    expired = [slot for slot in slots if SNAPSHOT_KEY.format(slot) not in found]
+    if expired:
+        # Processus arrêtés ; un processus vivant se réinscrit à sa publication
+        current = cache.get(SLOTS_KEY) or []
+        cache.set(SLOTS_KEY, [s for s in current if s not in expired], None)
+
+    names = cache.get(NAMES_KEY) or []
+    totals = cache.get_many(
+        [
+            total_key(gate, counter)
+            for gate in names
+            for counter in ("admitted", "rejected")
+        ]
+    )
+
+    gates = {}
+
+    def row(gate):
+        return gates.setdefault(
+            gate,
+            {
+                "gate": gate,
+                "scans_per_minute": 0,
+                "rejected_per_minute": 0,
+                "admitted": 0,
+                "rejected": 0,
+            },
+        )
+
+    for gate in names:
+        for counter in ("admitted", "rejected"):
+            row(gate)[counter] += totals.get(total_key(gate, counter), 0)
+    for gate, stats in own.items():
+        row(gate)["admitted"] += stats["admitted"]
+        row(gate)["rejected"] += stats["rejected"]
+    for snapshot in [*found.values(), {g: s["seconds"] for g, s in own.items()}]:
+        for gate, seconds in snapshot.items():
+            for second, (scans, rejected) in seconds.items():
+                if second > since:
+                    row(gate)["scans_per_minute"] += scans
+                    row(gate)["rejected_per_minute"] += rejected
+
+    rows = [gates[gate] for gate in sorted(gates)]
+    return {
+        "generated_at": now,
+        "gates": rows,
+        "totals": {
+            key: sum(row[key] for row in rows)
+            for key in (
+                "scans_per_minute",
+                "rejected_per_minute",
+                "admitted",
+                "rejected",
+            )
+        },
+    }
+
+
+gate_stats = GateStats()
@@ -0,0 +1,175 @@
+"""
+Émission de billets en masse pour les commandes payées sans billet.
+
+Les commandes sont lues par lots (pagination par clé sur l'id, sans OFFSET),
+les billets sont insérés avec bulk_create et des clés pré-générées, et les
+QR codes peuvent être pré-rendus dans un pool de processus pour réchauffer
+le cache partagé des QR codes.
+
+Pour les ventes flash, une réserve de billets sans commande peut être
+pré-générée par offre (clés générées, QR code rendu et stocké) : le paiement
+se contente alors de réserver des lignes (SELECT ... FOR UPDATE SKIP LOCKED)
+et de les rattacher aux commandes.
+"""
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from apps.analytics import timeseries
+from apps.orders.models import Order
+from .models import Ticket
+from .qr_cache import qr_cache, qr_cache_key, render_qr_png
+
+
+def pending_orders():
+    """Commandes payées qui n'ont pas encore de billet."""
+    return Order.objects.filter(status="paid", ticket__isnull=True)
+
+
+def iter_pending_order_batches(chunk_size, start_after=0):
+    """
+    Parcourt les commandes en attente de billet par lots de `chunk_size`.
+
+    Chaque lot est une requête indépendante (id > dernier id vu), ce qui
+    garde une mémoire constante et permet de reprendre après `start_after`.
+    """
+    last_id = start_after
+    while True:
+        batch = list(
+            pending_orders()
+            .filter(id__gt=last_id)
+            .select_related("user")
+            .only("id", "user", "user__key1")
+            .order_by("id")[:chunk_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def build_tickets(orders):
+    """Construit (sans les enregistrer) les billets des commandes données."""
+    tickets = []
+    for order in orders:
+        key2, final_key = Ticket.build_keys(order.user.key1)
+        tickets.append(
+            Ticket(
+                order_id=order.id,
+                user_id=order.user_id,
+                key2=key2,
+                final_key=final_key,
+            )
+        )
+    return tickets
+
+
+def issue_tickets(orders):
+    """
+    Crée en une transaction les billets des commandes données.
+
+    Les conflits (billet créé entre-temps par un autre processus) sont ignorés.
+    bulk_create(ignore_conflicts=True) ne renseigne pas les clés primaires et
+    renvoie aussi les billets écartés : les billets réellement insérés sont
+    relus par leur final_key (aléatoire, unique) et retournés.
+    """
+    tickets = build_tickets(orders)
+    with transaction.atomic():
+        Ticket.objects.bulk_create(tickets, ignore_conflicts=True)
+        inserted = list(
+            Ticket.objects.filter(
+                final_key__in=[ticket.final_key for ticket in tickets]
+            ).select_related("order")
+        )
+        timeseries.record({"tickets_issued": len(inserted)})
+    return inserted
+
+
+def prerender_qr_codes(tickets, executor=None, chunksize=32):
+    """
+    Pré-rend les QR codes des billets (contenu selon QR_PAYLOAD_FORMAT, comme
+    la vue de l'image) et les range dans le cache des QR codes.
+
+    Si `executor` (ProcessPoolExecutor) est fourni, le rendu est réparti
+    entre ses processus. Retourne le nombre de QR codes rendus.
+    """
+    payloads = [ticket.qr_payload() for ticket in tickets]
+    if executor is not None:
+        pngs = executor.map(render_qr_png, payloads, chunksize=chunksize)
+    else:
+        pngs = map(render_qr_png, payloads)
+
+    rendered = 0
+    for payload, png in zip(payloads, pngs):
+        qr_cache.set(qr_cache_key(payload), png)
+        rendered += 1
+    return rendered
+
+
+def stored_qr_name(payload):
+    """Nom du fichier PNG stocké pour ce contenu de QR code (hash de rendu)."""
+    return f"{qr_cache_key(payload)[:16]}.png"
+
+
+def mint_pool_tickets(offer, count):
+    """
+    Crée `count` billets en réserve (sans commande ni propriétaire) pour
+    l'offre. La final_key ne dépend d'aucun utilisateur (key2 seule,
+    256 bits aléatoires) : le QR code peut donc être rendu à l'avance.
+    """
+    tickets = []
+    for _ in range(count):
+        key2, final_key = Ticket.build_keys(None)
+        tickets.append(Ticket(pool_offer=offer, key2=key2, final_key=final_key))
+    with transaction.atomic():
+        Ticket.objects.bulk_create(tickets)
+    return tickets
+
+
+def store_qr_images(tickets, executor=None, chunksize=32):
+    """
+    Rend le QR code des billets, l'enregistre dans le stockage (qr_image)
+    et dans le cache des QR codes. Retourne le nombre d'images stockées.
+    """
+    payloads = [ticket.qr_payload() for ticket in tickets]
+    if executor is not None:
+        pngs = executor.map(render_qr_png, payloads, chunksize=chunksize)
+    else:
+        pngs = map(render_qr_png, payloads)
+
+    for ticket, payload, png in zip(tickets, payloads, pngs):
+        ticket.qr_image.save(stored_qr_name(payload), ContentFile(png), save=False)
+        qr_cache.set(qr_cache_key(payload), png)
+    Ticket.objects.bulk_update(tickets, ["qr_image"])
+    return len(tickets)
+
+
+def pool_size(offer_id):
+    """Nombre de billets en réserve non attribués pour l'offre."""
+    return Ticket.objects.filter(pool_offer_id=offer_id, order__isnull=True).count()
+
+
+def claim_pool_tickets(orders):
+    """
+    Attribue des billets de la réserve aux commandes (toutes de la même
+    offre) et retourne les commandes restées sans billet (réserve vide).
+
+    Les lignes déjà réservées par un autre paiement sont sautées (SKIP
+    LOCKED) : les acheteurs simultanés ne s'attendent pas. A appeler dans
+    la transaction qui crée les commandes.
+    """
+    if not orders:
+        return []
+    tickets = list(
+        Ticket.objects.select_for_update(skip_locked=True)
+        .filter(pool_offer_id=orders[0].offer_id, order__isnull=True)
+        .order_by("id")
+        .only("id")[: len(orders)]
+    )
+    now = timezone.now()
+    for ticket, order in zip(tickets, orders):
+        ticket.order_id = order.id
+        ticket.user_id = order.user_id
+        ticket.updated_at = now
+    Ticket.objects.bulk_update(tickets, ["order", "user", "updated_at"])
+    return orders[len(tickets) :]
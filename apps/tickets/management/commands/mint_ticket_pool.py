@@ -0,0 +1,75 @@
+"""
+Management command to pre-mint a pool of unassigned tickets for a flash sale.
+
+Tickets are created without order or owner, their keys are generated and
+their QR codes rendered and stored ahead of the sale. With
+TICKET_POOL_ENABLED, checkout only claims pool rows
+(SELECT ... FOR UPDATE SKIP LOCKED) and binds them to the new orders.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.catalog.models import Offer
+from apps.tickets.issuance import mint_pool_tickets, pool_size, store_qr_images
+
+
+class Command(BaseCommand):
+    help = "Pre-mint unassigned tickets (keys + stored QR codes) for an offer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("offer", type=str, help="Offer name (solo, duo...)")
+        parser.add_argument("count", type=int, help="Number of tickets to mint")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Tickets created and rendered per batch (default: 500)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes used to render QR codes (default: 1, in-process)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            offer = Offer.objects.get(name=options["offer"])
+        except Offer.DoesNotExist:
+            raise CommandError(f"Unknown offer {options['offer']}")
+
+        count = options["count"]
+        chunk_size = options["chunk_size"]
+        workers = options["workers"]
+        if count < 1 or chunk_size < 1 or workers < 1:
+            raise CommandError("count, --chunk-size and --workers must be positive")
+
+        if not getattr(settings, "TICKET_POOL_ENABLED", False):
+            self.stdout.write(
+                self.style.WARNING(
+                    "TICKET_POOL_ENABLED is off: checkout will not use the pool yet"
+                )
+            )
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        minted = 0
+        started = time.monotonic()
+        try:
+            while minted < count:
+                tickets = mint_pool_tickets(offer, min(chunk_size, count - minted))
+                store_qr_images(tickets, executor=executor)
+                minted += len(tickets)
+                self.stdout.write(f"Minted {minted}/{count} tickets")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Minted {minted} tickets for {offer.name} in {elapsed:.1f}s "
+                f"(pool size: {pool_size(offer.id)})"
+            )
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tickets", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(fields=["updated_at"], name="tickets_updated_at_idx"),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0002_offer_stock"),
+        ("tickets", "0003_updated_at_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="pool_offer",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Offre de la réserve de billets pré-générés",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pool_tickets",
+                to="catalog.offer",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="order",
+            field=models.OneToOneField(
+                blank=True,
+                help_text="Commande associée à ce billet (vide pour un billet en réserve)",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="ticket",
+                to="orders.order",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Propriétaire du billet (vide pour un billet en réserve)",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tickets",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                condition=models.Q(("order__isnull", True)),
+                fields=["pool_offer", "id"],
+                name="tickets_pool_free_idx",
+            ),
+        ),
+    ]
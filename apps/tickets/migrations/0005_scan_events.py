@@ -0,0 +1,95 @@
+# Generated by Django 5.0.1 on 2026-10-18 01:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tickets", "0004_ticket_pool"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScanEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scanned_at", models.DateTimeField(help_text="Date et heure du scan")),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[
+                            ("valid", "Validé"),
+                            ("used", "Déjà utilisé"),
+                            ("unpaid", "Commande non payée"),
+                            ("unknown", "Billet inconnu"),
+                            ("invalid", "QR code invalide"),
+                        ],
+                        help_text="Résultat du scan",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "gate",
+                    models.CharField(blank=True, help_text="Portique", max_length=64),
+                ),
+                (
+                    "device",
+                    models.CharField(
+                        blank=True, help_text="Appareil de contrôle", max_length=64
+                    ),
+                ),
+                (
+                    "employee",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        db_index=False,
+                        help_text="Contrôleur connecté",
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "ticket",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        db_index=False,
+                        help_text="Billet scanné (vide si inconnu ou QR code invalide)",
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="scan_events",
+                        to="tickets.ticket",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Passage au portique",
+                "verbose_name_plural": "Passages au portique",
+                "db_table": "tickets_scanevent",
+                "ordering": ["-scanned_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["scanned_at"], name="scanevent_scanned_at_idx"
+                    ),
+                    models.Index(
+                        fields=["ticket", "scanned_at"], name="scanevent_ticket_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -6,12 +6,12 @@ Date : Septembre 2024
 """
 
 import secrets
-import qrcode
-from io import BytesIO
-from django.db import models, transaction
+from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from apps.orders.models import Order
+from .qr_cache import render_qr_png
+from .signed_payload import qr_payload
 
 User = get_user_model()
 
@@ -20,9 +20,10 @@ def qr_code_upload_path(instance, filename):
     """
     Génère le chemin d'upload pour les images de codes QR.
 
-    Format: media/qr/tickets/{ticket_id}_{final_key[:8]}.png
+    Format: media/qr/tickets/{ticket_id}_{final_key[:8]}_{filename}
+    (le nom de fichier contient le début du hash de rendu, voir issuance.py)
     """
-    return f"qr/tickets/{instance.id}_{instance.final_key[:8]}.png"
+    return f"qr/tickets/{instance.id}_{instance.final_key[:8]}_{filename}"
 
 
 class Ticket(models.Model):
@@ -34,6 +35,9 @@ class Ticket(models.Model):
     - final_key: Concatenation de user.key1 + key2
     - qr_image: Fichier image du code QR
     - status: Statut valide ou utilisé
+
+    Les billets pré-générés pour les ventes flash (réserve, voir issuance.py)
+    n'ont ni commande ni propriétaire tant qu'ils ne sont pas attribués.
     """
 
     STATUS_CHOICES = [
@@ -45,13 +49,25 @@ class Ticket(models.Model):
         Order,
         on_delete=models.CASCADE,
         related_name="ticket",
-        help_text="Commande associée à ce billet",
+        null=True,
+        blank=True,
+        help_text="Commande associée à ce billet (vide pour un billet en réserve)",
     )
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="tickets",
-        help_text="Propriétaire du billet",
+        null=True,
+        blank=True,
+        help_text="Propriétaire du billet (vide pour un billet en réserve)",
+    )
+    pool_offer = models.ForeignKey(
+        "catalog.Offer",
+        on_delete=models.CASCADE,
+        related_name="pool_tickets",
+        null=True,
+        blank=True,
+        help_text="Offre de la réserve de billets pré-générés",
     )
     key2 = models.CharField(max_length=64, help_text="Clé secrète générée à l'achat")
     final_key = models.CharField(
@@ -77,22 +93,48 @@ class Ticket(models.Model):
         verbose_name = "Billet"
         verbose_name_plural = "Billets"
         ordering = ["-created_at"]
+        indexes = [
+            # Deltas du manifeste de contrôle hors ligne (updated_at > curseur)
+            models.Index(fields=["updated_at"], name="tickets_updated_at_idx"),
+            # Billets en réserve non attribués (claim_pool_tickets)
+            models.Index(
+                fields=["pool_offer", "id"],
+                name="tickets_pool_free_idx",
+                condition=models.Q(order__isnull=True),
+            ),
+        ]
 
     def __str__(self):
-        return f"Billet #{self.id} - {self.user.email} - {self.status}"
+        owner = self.user.email if self.user_id else "réserve"
+        return f"Billet #{self.id} - {owner} - {self.status}"
 
     def save(self, *args, **kwargs):
         """
         Surcharge save pour générer key2 et final_key s'ils ne sont pas définis.
         """
         if not self.key2:
-            self.key2 = secrets.token_urlsafe(32)
+            self.key2 = self.generate_key2()
 
-        if not self.final_key and self.user.key1:
+        if not self.final_key and self.user_id and self.user.key1:
             self.final_key = self.user.key1 + self.key2
 
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def generate_key2():
+        """Génère une clé secrète key2 (même format que lors de save)."""
+        return secrets.token_urlsafe(32)
+
+    @classmethod
+    def build_keys(cls, key1):
+        """
+        Génère un couple (key2, final_key) pour un utilisateur de clé key1.
+
+        Utilisé par les créations en masse (bulk_create ne passe pas par save).
+        """
+        key2 = cls.generate_key2()
+        return key2, (key1 or "") + key2
+
     def generate_qr_code(self) -> bytes:
         """
         Génère le PNG du QR code pour ce billet et retourne les octets (sans écriture disque).
@@ -103,26 +145,12 @@ class Ticket(models.Model):
         if not self.final_key:
             return b""
 
-        # Créer le code QR
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(self.final_key)
-        qr.make(fit=True)
+        return render_qr_png(self.qr_payload())
 
-        # Créer l'image
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # Sauvegarder dans BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-
-        # Retourner le contenu binaire PNG (pas d'enregistrement dans media)
-        return buffer.getvalue()
+    def qr_payload(self):
+        """Contenu du QR code : final_key ou charge utile signée (QR_PAYLOAD_FORMAT)."""
+        offer_id = self.order.offer_id if self.order_id else self.pool_offer_id
+        return qr_payload(self.id, offer_id, self.final_key, self.created_at)
 
     def get_status_display_class(self):
         """Retourne la classe CSS pour l'affichage du statut."""
@@ -151,51 +179,89 @@ class Ticket(models.Model):
     @classmethod
     def validate_ticket(cls, final_key):
         """
-        Valide un billet par sa final_key.
+        Valide un billet par le contenu de son QR code et le marque comme
+        utilisé (voir validation.validate_final_key).
 
-        Cette méthode effectue une validation atomique et marque comme utilisé.
         Retourne un tuple (is_valid, ticket, message).
         """
-        try:
-            with transaction.atomic():
-                # Utiliser select_for_update pour éviter les conditions de course
-                ticket = cls.objects.select_for_update().get(final_key=final_key)
+        from .validation import OUTCOME_VALID, validate_final_key
 
-                if not ticket.is_valid():
-                    return False, ticket, "Ce billet a déjà été utilisé"
+        result = validate_final_key(final_key)
+        ticket_info = result["ticket_info"]
+        ticket = cls.objects.get(id=ticket_info["ticket_id"]) if ticket_info else None
+        return result["outcome"] == OUTCOME_VALID, ticket, result["message"]
 
-                # Vérifier si la commande associée est payée
-                if ticket.order.status != "paid":
-                    return False, ticket, "Cette commande n'est pas payée"
 
-                # Marquer comme utilisé
-                ticket.mark_as_used()
+class ScanEvent(models.Model):
+    """
+    Journal des passages au portique, en ajout seul.
 
-                return True, ticket, "Billet validé avec succès"
+    Une ligne par contenu scanné, refus compris (billet déjà utilisé,
+    inconnu, QR code invalide), avec le portique, l'appareil et le
+    contrôleur. Les lignes sont écrites par lots (voir scan_log.py).
 
-        except cls.DoesNotExist:
-            return False, None, "Billet non trouvé"
-        except Exception as e:
-            return False, None, f"Erreur lors de la validation: {str(e)}"
+    Aucune clé étrangère n'est contrainte en base : les insertions en masse
+    ne vérifient rien et la table peut être partitionnée par plage de
+    scanned_at sans toucher aux billets ni aux utilisateurs.
+    """
 
-    @classmethod
-    def get_ticket_info(cls, final_key):
-        """
-        Récupère les informations d'un billet par sa final_key.
+    OUTCOME_CHOICES = [
+        ("valid", "Validé"),
+        ("used", "Déjà utilisé"),
+        ("unpaid", "Commande non payée"),
+        ("unknown", "Billet inconnu"),
+        ("invalid", "QR code invalide"),
+    ]
 
-        Retourne les informations même si le billet est déjà utilisé.
-        Retourne un tuple (found, ticket, message).
-        """
-        try:
-            ticket = cls.objects.get(final_key=final_key)
+    scanned_at = models.DateTimeField(help_text="Date et heure du scan")
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="scan_events",
+        null=True,
+        blank=True,
+        help_text="Billet scanné (vide si inconnu ou QR code invalide)",
+    )
+    outcome = models.CharField(
+        max_length=10, choices=OUTCOME_CHOICES, help_text="Résultat du scan"
+    )
+    gate = models.CharField(max_length=64, blank=True, help_text="Portique")
+    device = models.CharField(
+        max_length=64, blank=True, help_text="Appareil de contrôle"
+    )
+    employee = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+        null=True,
+        blank=True,
+        help_text="Contrôleur connecté",
+    )
 
-            # Vérifier si la commande associée est payée
-            if ticket.order.status != "paid":
-                return False, ticket, "Cette commande n'est pas payée"
+    class Meta:
+        db_table = "tickets_scanevent"
+        verbose_name = "Passage au portique"
+        verbose_name_plural = "Passages au portique"
+        ordering = ["-scanned_at"]
+        indexes = [
+            models.Index(fields=["scanned_at"], name="scanevent_scanned_at_idx"),
+            # Historique d'un billet
+            models.Index(fields=["ticket", "scanned_at"], name="scanevent_ticket_idx"),
+        ]
 
-            return True, ticket, "Informations du billet récupérées"
+    def __str__(self):
+        return f"Scan {self.outcome} - billet #{self.ticket_id} - {self.scanned_at}"
+
+    def save(self, *args, **kwargs):
+        """Un passage enregistré ne se modifie pas."""
+        if not self._state.adding:
+            raise ValueError("Le journal des passages est en ajout seul")
+        super().save(*args, **kwargs)
 
-        except cls.DoesNotExist:
-            return False, None, "Billet introuvable"
-        except Exception as e:
-            return False, None, f"Erreur lors de la récupération: {str(e)}"
+    def delete(self, *args, **kwargs):
+        """Un passage enregistré ne se supprime pas."""
+        raise ValueError("Le journal des passages est en ajout seul")
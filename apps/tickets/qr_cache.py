@@ -0,0 +1,164 @@
+"""
+Cache de rendu des QR codes des billets.
+
+Le PNG d'un QR code ne dépend que de la final_key et des paramètres de rendu :
+on l'adresse donc par un hash de ces valeurs. Le cache est à deux niveaux :
+- un LRU borné en mémoire (par processus),
+- un backend de cache Django partagé optionnel (settings.QR_CACHE_ALIAS).
+
+Le même hash sert d'ETag fort, ce qui permet de répondre 304 sans rendu.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.cache import caches
+
+# Incrémenter si le rendu change (version de qrcode, couleurs...) pour
+# invalider les ETags déjà distribués aux navigateurs.
+QR_RENDER_VERSION = 1
+
+QR_RENDER_PARAMS = {
+    "version": 1,
+    "error_correction": qrcode.constants.ERROR_CORRECT_L,
+    "box_size": 10,
+    "border": 4,
+}
+
+
+def render_qr_png(data, **params):
+    """
+    Génère le PNG d'un QR code contenant `data` et retourne les octets.
+
+    Fonction de module (et non méthode) pour pouvoir être envoyée à un
+    pool de processus.
+    """
+    options = {**QR_RENDER_PARAMS, **params}
+    qr = qrcode.QRCode(**options)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_cache_key(data, **params):
+    """Retourne le hash (hex) identifiant le rendu de `data` avec ces paramètres."""
+    options = {**QR_RENDER_PARAMS, **params}
+    material = "|".join(
+        [str(QR_RENDER_VERSION), data]
+        + [f"{name}={options[name]}" for name in sorted(options)]
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class QRCodeCache:
+    """
+    Cache LRU borné des PNG de QR codes, avec compteurs de hits/miss/évictions.
+
+    Thread-safe : les workers gunicorn en threads partagent la même instance.
+    """
+
+    shared_key_prefix = "qr_png:"
+
+    def __init__(self, max_entries=1024, shared_alias=None, shared_timeout=86400):
+        self.max_entries = max_entries
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def shared(self):
+        """Backend de cache Django partagé, ou None s'il n'est pas configuré."""
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def get(self, key):
+        """Retourne le PNG en cache pour `key` ou None (compte hit/miss)."""
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+
+        shared = self.shared
+        if shared is not None:
+            png = shared.get(self.shared_key_prefix + key)
+            if png is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self._store_local(key, png)
+                return png
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, png):
+        """Enregistre un PNG dans le cache local et dans le cache partagé."""
+        self._store_local(key, png)
+        shared = self.shared
+        if shared is not None:
+            shared.set(self.shared_key_prefix + key, png, self.shared_timeout)
+
+    def get_or_render(self, data, **params):
+        """
+        Retourne un tuple (key, png) pour `data`, en ne rendant le QR code
+        qu'en cas d'absence dans le cache.
+        """
+        key = qr_cache_key(data, **params)
+        png = self.get(key)
+        if png is None:
+            png = render_qr_png(data, **params)
+            self.set(key, png)
+        return key, png
+
+    def clear(self):
+        """Vide le cache local et remet les compteurs à zéro."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Retourne les compteurs du cache (pour dimensionner max_entries)."""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (
+                    round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0
+                ),
+            }
+
+    def _store_local(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+qr_cache = QRCodeCache(
+    max_entries=getattr(settings, "QR_CACHE_MAX_ENTRIES", 1024),
+    shared_alias=getattr(settings, "QR_CACHE_ALIAS", None),
+)
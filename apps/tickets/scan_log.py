@@ -0,0 +1,188 @@
+"""
+Écriture par lots du journal des passages au portique (ScanEvent).
+
+Les vues de validation ajoutent chaque scan à un tampon en mémoire, sans
+requête SQL : la réponse au portique ne paie pas l'audit. Un thread du
+processus écrit le tampon en un bulk_create toutes les
+SCAN_LOG_FLUSH_INTERVAL secondes, ou dès que SCAN_LOG_BATCH_SIZE passages
+attendent. Le reste est écrit à l'arrêt du processus (atexit, appelé par
+gunicorn lors d'un arrêt propre des workers).
+
+Avec SCAN_LOG_FLUSH_INTERVAL = 0, pas de thread : le tampon est écrit par
+la requête qui le remplit (SCAN_LOG_BATCH_SIZE = 1 : écriture immédiate).
+
+Les billets validés (outcome "valid") sont comptés dans les séries
+temporelles des entrées (apps.analytics.timeseries, minute du passage)
+dans la transaction du lot : la requête de validation n'écrit pas dans les
+compteurs, très sollicités aux heures d'ouverture des portes.
+
+Si la base est indisponible, les passages sont gardés pour le lot suivant,
+dans la limite de SCAN_LOG_MAX_PENDING (les plus anciens sont perdus et
+comptés dans les statistiques).
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from apps.analytics import timeseries
+from .models import ScanEvent
+from .validation import OUTCOME_VALID
+
+logger = logging.getLogger(__name__)
+
+
+def scan_log_batch_size():
+    """Nombre de passages en attente qui déclenche une écriture."""
+    return getattr(settings, "SCAN_LOG_BATCH_SIZE", 200)
+
+
+def scan_log_flush_interval():
+    """Délai maximal (secondes) avant l'écriture d'un passage."""
+    return getattr(settings, "SCAN_LOG_FLUSH_INTERVAL", 0.25)
+
+
+def scan_log_max_pending():
+    """Nombre maximal de passages gardés en mémoire."""
+    return getattr(settings, "SCAN_LOG_MAX_PENDING", 10000)
+
+
+def _count_validated(events):
+    """Ajoute les billets validés du lot aux séries des entrées, par minute."""
+    minutes = Counter(
+        timeseries.truncate(event.scanned_at, "minute")
+        for event in events
+        if event.outcome == OUTCOME_VALID
+    )
+    for minute in sorted(minutes):
+        timeseries.record({"tickets_scanned": minutes[minute]}, minute)
+
+
+class ScanLogBuffer:
+    """
+    Tampon des passages au portique, écrit par lots.
+
+    Thread-safe : les workers gunicorn en threads partagent la même instance.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def add(self, outcome, ticket_id=None, gate="", device="", employee_id=None):
+        """Ajoute un passage (horodaté maintenant) au tampon."""
+        event = ScanEvent(
+            scanned_at=timezone.now(),
+            ticket_id=ticket_id,
+            outcome=outcome,
+            gate=gate[:64],
+            device=device[:64],
+            employee_id=employee_id,
+        )
+        with self._lock:
+            self._events.append(event)
+            full = len(self._events) >= scan_log_batch_size()
+
+        if scan_log_flush_interval() <= 0:
+            if full:
+                self.flush()
+        else:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+
+    def flush(self):
+        """Écrit les passages en attente. Retourne le nombre de lignes écrites."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            try:
+                with transaction.atomic():
+                    ScanEvent.objects.bulk_create(
+                        events, batch_size=scan_log_batch_size()
+                    )
+                    _count_validated(events)
+            except Exception:
+                logger.exception("Écriture de %d passages impossible", len(events))
+                self._requeue(events)
+                return 0
+
+        with self._lock:
+            self.written += len(events)
+            self.batches += 1
+        return len(events)
+
+    def clear(self):
+        """Vide le tampon sans écrire et remet les compteurs à zéro."""
+        with self._lock:
+            self._events = []
+            self.written = self.batches = self.failures = self.dropped = 0
+
+    def stats(self):
+        """Retourne les compteurs du tampon."""
+        with self._lock:
+            return {
+                "pending": len(self._events),
+                "written": self.written,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dropped": self.dropped,
+                "flusher_running": self._thread is not None
+                and self._pid == os.getpid(),
+            }
+
+    def _requeue(self, events):
+        """Remet en tête du tampon des passages dont l'écriture a échoué."""
+        with self._lock:
+            self.failures += 1
+            self._events = events + self._events
+            overflow = len(self._events) - scan_log_max_pending()
+            if overflow > 0:
+                del self._events[:overflow]
+                self.dropped += overflow
+
+    def _ensure_thread(self):
+        """Démarre le thread d'écriture (une fois par processus, après fork)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # Processus fils : les passages hérités sont écrits par le parent
+                self._events = []
+            else:
+                atexit.register(self.flush)
+            self._wake = threading.Event()
+            self._flush_lock = threading.Lock()
+            self._thread = threading.Thread(
+                target=self._run, name="scan-log-flusher", daemon=True
+            )
+            self._pid = pid
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(scan_log_flush_interval())
+            self._wake.clear()
+            # Connexion propre au thread : fermée si trop vieille ou cassée
+            close_old_connections()
+            self.flush()
+
+
+scan_log = ScanLogBuffer()
@@ -0,0 +1,149 @@
+"""
+Charge utile signée des QR codes (format optionnel "JO1").
+
+Le QR code contient l'id du billet, l'id de l'offre et une fenêtre de
+validité, signés en Ed25519. Le portique peut rejeter un code falsifié,
+malformé ou hors fenêtre sans requête SQL, et un appareil hors ligne peut
+vérifier la signature avec la clé publique (voir public_key_b64). La même
+clé signe le manifeste de validation hors ligne (sign_message).
+
+Format : "JO1." + base64url(struct ">BQIII" + signature de 64 octets)
+         version, ticket_id, offer_id, valid_from, valid_until (timestamps Unix)
+
+Les billets existants gardent leur QR code final_key (format historique),
+qui reste accepté par la validation.
+"""
+
+import base64
+import hashlib
+import struct
+import time
+from datetime import timedelta
+from functools import lru_cache
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from django.conf import settings
+
+SIGNED_PREFIX = "JO1."
+PAYLOAD_VERSION = 1
+PAYLOAD_STRUCT = struct.Struct(">BQIII")
+SIGNATURE_SIZE = 64
+
+
+class SignedPayloadError(ValueError):
+    """Charge utile signée invalide (malformée, falsifiée ou expirée)."""
+
+
+@lru_cache(maxsize=1)
+def _private_key():
+    """
+    Clé privée Ed25519 : settings.QR_SIGNING_KEY (graine base64 de 32 octets)
+    ou, à défaut, une graine dérivée de SECRET_KEY.
+    """
+    seed = getattr(settings, "QR_SIGNING_KEY", None)
+    if seed:
+        seed = base64.b64decode(seed)
+    else:
+        seed = hashlib.sha256(
+            b"apps.tickets.signed_payload" + settings.SECRET_KEY.encode("utf-8")
+        ).digest()
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+@lru_cache(maxsize=1)
+def _public_key():
+    return _private_key().public_key()
+
+
+def public_key_b64():
+    """Clé publique brute (32 octets) en base64, pour les appareils de contrôle."""
+    raw = _public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return base64.b64encode(raw).decode("ascii")
+
+
+def sign_message(message):
+    """Signature Ed25519 (base64) d'un message, avec la clé des QR codes."""
+    return base64.b64encode(_private_key().sign(message)).decode("ascii")
+
+
+def verify_message(signature, message):
+    """Vérifie une signature produite par sign_message."""
+    try:
+        _public_key().verify(base64.b64decode(signature), message)
+    except (InvalidSignature, ValueError):
+        return False
+    return True
+
+
+def is_signed_payload(value):
+    """Indique si le contenu scanné est au format signé."""
+    return value.startswith(SIGNED_PREFIX)
+
+
+def build_signed_payload(ticket_id, offer_id, valid_from, valid_until):
+    """Construit la chaîne à encoder dans le QR code (datetimes en entrée)."""
+    payload = PAYLOAD_STRUCT.pack(
+        PAYLOAD_VERSION,
+        ticket_id,
+        offer_id,
+        int(valid_from.timestamp()),
+        int(valid_until.timestamp()),
+    )
+    signature = _private_key().sign(payload)
+    token = base64.urlsafe_b64encode(payload + signature).rstrip(b"=")
+    return SIGNED_PREFIX + token.decode("ascii")
+
+
+def signed_payload_for(ticket_id, offer_id, issued_at):
+    """Charge utile d'un billet, valable QR_SIGNED_VALIDITY_DAYS après émission."""
+    validity = timedelta(days=getattr(settings, "QR_SIGNED_VALIDITY_DAYS", 365))
+    return build_signed_payload(ticket_id, offer_id, issued_at, issued_at + validity)
+
+
+def decode_signed_payload(value, now=None):
+    """
+    Vérifie la charge utile et retourne {"ticket_id", "offer_id", "valid_from",
+    "valid_until"}. Lève SignedPayloadError sinon (aucun accès base de données).
+    """
+    token = value[len(SIGNED_PREFIX) :]
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except ValueError:
+        raise SignedPayloadError("QR code malformé")
+
+    if len(raw) != PAYLOAD_STRUCT.size + SIGNATURE_SIZE:
+        raise SignedPayloadError("QR code malformé")
+
+    payload, signature = raw[: PAYLOAD_STRUCT.size], raw[PAYLOAD_STRUCT.size :]
+    try:
+        _public_key().verify(signature, payload)
+    except InvalidSignature:
+        raise SignedPayloadError("QR code falsifié")
+
+    version, ticket_id, offer_id, valid_from, valid_until = PAYLOAD_STRUCT.unpack(
+        payload
+    )
+    if version != PAYLOAD_VERSION:
+        raise SignedPayloadError("Version de QR code non supportée")
+
+    now = time.time() if now is None else now
+    if not valid_from <= now <= valid_until:
+        raise SignedPayloadError("QR code hors de sa période de validité")
+
+    return {
+        "ticket_id": ticket_id,
+        "offer_id": offer_id,
+        "valid_from": valid_from,
+        "valid_until": valid_until,
+    }
+
+
+def qr_payload(ticket_id, offer_id, final_key, issued_at):
+    """
+    Contenu du QR code d'un billet selon settings.QR_PAYLOAD_FORMAT :
+    "signed" pour la charge utile signée, sinon la final_key (historique).
+    """
+    if getattr(settings, "QR_PAYLOAD_FORMAT", "legacy") == "signed":
+        return signed_payload_for(ticket_id, offer_id, issued_at)
+    return final_key
@@ -2,10 +2,29 @@
 Tests for the tickets app.
 """
 
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import time
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from unittest import mock
+from django.test import Client, TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 from decimal import Decimal
-from apps.tickets.models import Ticket
+from apps.tickets.issuance import pool_size
+from apps.tickets.models import ScanEvent, Ticket
+from apps.tickets.qr_cache import QRCodeCache, qr_cache, qr_cache_key
+from apps.tickets.scan_log import ScanLogBuffer, scan_log
+from apps.tickets.signed_payload import (
+    SIGNED_PREFIX,
+    SignedPayloadError,
+    decode_signed_payload,
+    signed_payload_for,
+)
+from apps.tickets.validation import validate_final_key
 from apps.orders.models import Order
 from apps.catalog.models import Offer
 
@@ -159,3 +178,521 @@ class TicketModelTest(TestCase):
         ticket2 = Ticket.objects.create(order=order2, user=self.user)
 
         self.assertNotEqual(ticket1.final_key, ticket2.final_key)
+
+
+class QRCodeCacheTest(TestCase):
+    """Test cases for the QR render cache."""
+
+    def test_hit_after_miss(self):
+        """Test that a second lookup is served from the cache."""
+        cache = QRCodeCache(max_entries=4)
+
+        key1, png1 = cache.get_or_render("abc")
+        key2, png2 = cache.get_or_render("abc")
+
+        self.assertEqual(key1, key2)
+        self.assertEqual(png1, png2)
+        self.assertTrue(png1.startswith(b"\x89PNG"))
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = QRCodeCache(max_entries=2)
+        cache.get_or_render("a")
+        cache.get_or_render("b")
+        cache.get_or_render("a")
+        cache.get_or_render("c")
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertIsNone(cache.get(qr_cache_key("b")))
+        self.assertIsNotNone(cache.get(qr_cache_key("a")))
+
+    def test_key_depends_on_render_params(self):
+        """Test that render parameters are part of the cache key."""
+        self.assertNotEqual(qr_cache_key("abc"), qr_cache_key("abc", box_size=5))
+
+
+class TicketQRImageViewTest(TestCase):
+    """Test cases for the QR image view."""
+
+    def setUp(self):
+        """Set up test data."""
+        qr_cache.clear()
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        order = Order.objects.create(
+            user=self.user, offer=offer, amount=Decimal("50.00"), status="paid"
+        )
+        self.ticket = Ticket.objects.create(order=order, user=self.user)
+        self.url = reverse("tickets:ticket_qr_image", args=[self.ticket.id])
+        self.client.force_login(self.user)
+
+    def test_etag_and_not_modified(self):
+        """Test that a matching If-None-Match returns 304 without rendering."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(qr_cache.stats()["misses"], 1)
+
+    def test_other_user_ticket_not_found(self):
+        """Test that a user cannot fetch another user's QR code."""
+        other = User.objects.create_user(
+            email="other@example.com",
+            username="other",
+            first_name="Other",
+            last_name="User",
+            password="testpass123",
+        )
+        self.client.force_login(other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+# Pas de thread d'écriture du journal des passages pendant les tests
+@override_settings(SCAN_LOG_FLUSH_INTERVAL=0)
+class ValidateTicketApiTest(TestCase):
+    """Test cases for the gate validation API."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        order = Order.objects.create(
+            user=self.user, offer=self.offer, amount=Decimal("50.00"), status="paid"
+        )
+        self.ticket = Ticket.objects.create(order=order, user=self.user)
+        self.url = reverse("tickets:validate_ticket_api")
+        # Une seule requête sur PostgreSQL, UPDATE + SELECT ailleurs
+        self.expected_queries = 1 if connection.vendor == "postgresql" else 2
+        scan_log.clear()
+
+    def post(self, final_key):
+        return self.client.post(
+            self.url,
+            data=json.dumps({"final_key": final_key}),
+            content_type="application/json",
+        )
+
+    def test_valid_scan_query_count(self):
+        """Test that a successful scan costs a single round trip."""
+        with self.assertNumQueries(self.expected_queries):
+            response = self.post(self.ticket.final_key)
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data["success"])
+        self.assertEqual(data["ticket_id"], self.ticket.id)
+        self.assertEqual(data["user_name"], "Test User")
+        self.assertEqual(data["offer_name"], "Solo (1 personne)")
+        self.assertEqual(data["status"], "used")
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, "used")
+
+    def test_rescan_returns_ticket_info_query_count(self):
+        """Test that an already used ticket is reported from the same round trip."""
+        self.post(self.ticket.final_key)
+
+        with self.assertNumQueries(self.expected_queries):
+            response = self.post(self.ticket.final_key)
+
+        data = response.json()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(data["success"])
+        self.assertIn("déjà été utilisé", data["error"])
+        self.assertEqual(data["ticket_info"]["ticket_id"], self.ticket.id)
+        self.assertEqual(data["ticket_info"]["status"], "used")
+
+    def test_unpaid_order(self):
+        """Test that a ticket of an unpaid order is rejected and left valid."""
+        order = Order.objects.create(
+            user=self.user, offer=self.offer, amount=Decimal("50.00")
+        )
+        ticket = Ticket.objects.create(order=order, user=self.user)
+
+        response = self.post(ticket.final_key)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("pas payée", response.json()["error"])
+        self.assertNotIn("ticket_info", response.json())
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, "valid")
+
+    def test_unknown_key(self):
+        """Test that an unknown key is rejected."""
+        response = self.post("invalid_key")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("non trouvé", response.json()["error"])
+
+    def test_scans_are_audited(self):
+        """Test that every scan, rejected ones included, reaches the audit log."""
+        self.client.post(
+            self.url,
+            data=json.dumps({"final_key": self.ticket.final_key, "gate": "Porte A"}),
+            content_type="application/json",
+        )
+        self.client.post(
+            self.url,
+            data=json.dumps({"final_key": self.ticket.final_key}),
+            content_type="application/json",
+            HTTP_X_GATE_ID="Porte B",
+            HTTP_X_DEVICE_ID="scanner-7",
+        )
+        self.post("invalid_key")
+
+        # Rien n'est écrit pendant les requêtes
+        self.assertFalse(ScanEvent.objects.exists())
+        # SAVEPOINT, INSERT des passages, comptage du billet validé, RELEASE
+        with self.assertNumQueries(4):
+            self.assertEqual(scan_log.flush(), 3)
+
+        events = list(
+            ScanEvent.objects.order_by("id").values_list(
+                "outcome", "ticket_id", "gate", "device"
+            )
+        )
+        self.assertEqual(
+            events,
+            [
+                ("valid", self.ticket.id, "Porte A", ""),
+                ("used", self.ticket.id, "Porte B", "scanner-7"),
+                ("unknown", None, "", ""),
+            ],
+        )
+
+
+@override_settings(SCAN_LOG_FLUSH_INTERVAL=0)
+class ValidateTicketsBatchApiTest(TestCase):
+    """Test cases for the batch gate validation API."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.tickets = []
+        for status in ("paid", "paid", "pending"):
+            order = Order.objects.create(
+                user=self.user, offer=offer, amount=Decimal("50.00"), status=status
+            )
+            self.tickets.append(Ticket.objects.create(order=order, user=self.user))
+        self.tickets[1].mark_as_used()
+        self.url = reverse("tickets:validate_tickets_batch_api")
+        self.employee = User.objects.create_user(
+            email="employee@example.com",
+            username="employee",
+            password="testpass123",
+            is_employee=True,
+        )
+        self.client.force_login(self.employee)
+        scan_log.clear()
+
+    def post(self, payload):
+        return self.client.post(
+            self.url, data=json.dumps(payload), content_type="application/json"
+        )
+
+    def test_per_key_results(self):
+        """Test that every key gets its own outcome, in request order."""
+        valid, used, unpaid = self.tickets
+        keys = [valid.final_key, used.final_key, unpaid.final_key, "unknown"]
+
+        response = self.post({"final_keys": keys})
+
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["outcome"] for result in data["results"]],
+            ["valid", "used", "unpaid", "unknown"],
+        )
+        self.assertEqual(data["results"][0]["final_key"], valid.final_key)
+        self.assertEqual(
+            data["summary"],
+            {"valid": 1, "used": 1, "unpaid": 1, "unknown": 1, "invalid": 0},
+        )
+        self.assertIn("latency_ms", data)
+        valid.refresh_from_db()
+        unpaid.refresh_from_db()
+        self.assertEqual(valid.status, "used")
+        self.assertEqual(unpaid.status, "valid")
+
+    def test_duplicate_key_first_scan_wins(self):
+        """Test that a key scanned twice in one batch is only admitted once."""
+        key = self.tickets[0].final_key
+
+        response = self.post({"final_keys": [key, key]})
+
+        outcomes = [result["outcome"] for result in response.json()["results"]]
+        self.assertEqual(outcomes, ["valid", "used"])
+
+    def test_batch_scans_are_audited(self):
+        """Test that a batch adds one audit event per key."""
+        keys = [ticket.final_key for ticket in self.tickets]
+
+        self.post({"final_keys": keys, "gate": "Tourniquet 3"})
+        scan_log.flush()
+
+        self.assertEqual(
+            list(ScanEvent.objects.order_by("id").values_list("outcome", "gate")),
+            [
+                ("valid", "Tourniquet 3"),
+                ("used", "Tourniquet 3"),
+                ("unpaid", "Tourniquet 3"),
+            ],
+        )
+
+    def test_requires_employee(self):
+        """Test that anonymous users and customers cannot validate batches."""
+        keys = [self.tickets[0].final_key]
+
+        self.client.logout()
+        self.assertEqual(self.post({"final_keys": keys}).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.post({"final_keys": keys}).status_code, 403)
+
+        self.tickets[0].refresh_from_db()
+        self.assertEqual(self.tickets[0].status, "valid")
+
+    def test_csrf_is_enforced(self):
+        """Test that the session-authenticated endpoint is not CSRF exempt."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.employee)
+
+        response = client.post(
+            self.url,
+            data=json.dumps({"final_keys": [self.tickets[0].final_key]}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_payload(self):
+        """Test that a missing or oversized key list is rejected."""
+        self.assertEqual(self.post({"final_keys": []}).status_code, 400)
+        with self.settings(VALIDATION_BATCH_MAX_KEYS=1):
+            response = self.post({"final_keys": ["a", "b"]})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SCAN_LOG_FLUSH_INTERVAL=0, SCAN_LOG_BATCH_SIZE=3)
+class ScanLogBufferTest(TestCase):
+    """Test cases for the batched gate audit log writer."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.buffer = ScanLogBuffer()
+
+    def test_written_when_batch_is_full(self):
+        """Test that events are held until a batch is full."""
+        self.buffer.add("unknown")
+        self.buffer.add("invalid", gate="Porte A")
+        self.assertEqual(ScanEvent.objects.count(), 0)
+
+        # SAVEPOINT, INSERT des passages, RELEASE : aucun billet validé à compter
+        with self.assertNumQueries(3):
+            self.buffer.add("unknown")
+
+        self.assertEqual(ScanEvent.objects.count(), 3)
+        stats = self.buffer.stats()
+        self.assertEqual((stats["pending"], stats["written"]), (0, 3))
+        self.assertEqual(stats["batches"], 1)
+        self.assertFalse(stats["flusher_running"])
+
+    @override_settings(SCAN_LOG_BATCH_SIZE=100, SCAN_LOG_MAX_PENDING=2)
+    def test_failed_write_is_retried_within_bounds(self):
+        """Test that events survive a failed write, oldest dropped first."""
+        for device in ("1", "2", "3"):
+            self.buffer.add("unknown", device=device)
+
+        with mock.patch.object(
+            ScanEvent.objects, "bulk_create", side_effect=RuntimeError("db down")
+        ):
+            with self.assertLogs("apps.tickets.scan_log", "ERROR"):
+                self.assertEqual(self.buffer.flush(), 0)
+
+        stats = self.buffer.stats()
+        self.assertEqual((stats["pending"], stats["dropped"]), (2, 1))
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(
+            sorted(ScanEvent.objects.values_list("device", flat=True)), ["2", "3"]
+        )
+
+    def test_append_only(self):
+        """Test that a logged scan cannot be changed or deleted."""
+        self.buffer.add("unknown")
+        self.buffer.flush()
+        event = ScanEvent.objects.get()
+
+        event.gate = "Porte Z"
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+
+class SignedPayloadTest(TestCase):
+    """Test cases for signed QR payloads."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        order = Order.objects.create(
+            user=self.user, offer=self.offer, amount=Decimal("50.00"), status="paid"
+        )
+        self.ticket = Ticket.objects.create(order=order, user=self.user)
+        self.payload = signed_payload_for(
+            self.ticket.id, self.offer.id, self.ticket.created_at
+        )
+
+    def test_round_trip(self):
+        """Test that a signed payload decodes to the ticket it was built for."""
+        claims = decode_signed_payload(self.payload)
+
+        self.assertEqual(claims["ticket_id"], self.ticket.id)
+        self.assertEqual(claims["offer_id"], self.offer.id)
+
+    def test_forged_payload_rejected_without_query(self):
+        """Test that a tampered payload is rejected before any query."""
+        forged = self.payload[:-4] + ("AAAA" if self.payload[-4:] != "AAAA" else "BBBB")
+
+        with self.assertNumQueries(0):
+            result = validate_final_key(forged)
+        with self.assertNumQueries(0):
+            malformed = validate_final_key(SIGNED_PREFIX + "not-base64!")
+
+        self.assertEqual(result["outcome"], "invalid")
+        self.assertEqual(malformed["outcome"], "invalid")
+
+    def test_expired_payload_rejected(self):
+        """Test that a payload outside its validity window is rejected."""
+        with self.assertRaises(SignedPayloadError):
+            decode_signed_payload(self.payload, now=time.time() + 400 * 86400)
+
+    def test_signed_and_legacy_formats_validate(self):
+        """Test that both the signed payload and the legacy final_key validate."""
+        result = validate_final_key(self.payload)
+        self.assertEqual(result["outcome"], "valid")
+        self.assertEqual(result["ticket_info"]["ticket_id"], self.ticket.id)
+
+        result = validate_final_key(self.ticket.final_key)
+        self.assertEqual(result["outcome"], "used")
+
+    def test_qr_payload_follows_setting(self):
+        """Test that QR_PAYLOAD_FORMAT selects what the QR code encodes."""
+        self.assertEqual(self.ticket.qr_payload(), self.ticket.final_key)
+        with self.settings(QR_PAYLOAD_FORMAT="signed"):
+            self.assertTrue(self.ticket.qr_payload().startswith(SIGNED_PREFIX))
+
+
+class TicketPoolTest(TestCase):
+    """Test cases for the pre-minted flash sale ticket pool."""
+
+    def setUp(self):
+        """Set up test data."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, TICKET_POOL_ENABLED=True
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        qr_cache.clear()
+
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            username="testuser",
+            first_name="Test",
+            last_name="User",
+            password="testpass123",
+        )
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        call_command("mint_ticket_pool", "solo", "3", stdout=StringIO())
+
+    def test_mint_creates_unassigned_tickets_with_stored_qr(self):
+        """Test that minted tickets have keys and a stored QR image."""
+        tickets = Ticket.objects.filter(pool_offer=self.offer)
+
+        self.assertEqual(pool_size(self.offer.id), 3)
+        for ticket in tickets:
+            self.assertIsNone(ticket.order_id)
+            self.assertIsNone(ticket.user_id)
+            self.assertTrue(ticket.final_key)
+            self.assertTrue(ticket.qr_image.name.endswith(".png"))
+
+    def test_checkout_claims_pool_then_falls_back(self):
+        """Test that checkout binds pool tickets and creates the missing ones."""
+        from apps.orders.payments import create_paid_orders
+
+        items = [{"offer_id": self.offer.id, "quantity": 2, "price": "50.00"}]
+        orders = create_paid_orders(self.user, items)
+        claimed = Ticket.objects.filter(order__in=orders)
+        self.assertEqual(claimed.count(), 2)
+        self.assertTrue(all(ticket.pool_offer_id for ticket in claimed))
+        self.assertTrue(all(ticket.user_id == self.user.id for ticket in claimed))
+        self.assertEqual(pool_size(self.offer.id), 1)
+
+        orders = create_paid_orders(self.user, items)
+        self.assertEqual(Ticket.objects.filter(order__in=orders).count(), 2)
+        self.assertEqual(pool_size(self.offer.id), 0)
+
+    def test_qr_view_serves_stored_image(self):
+        """Test that a claimed ticket's QR code is read from storage."""
+        from apps.orders.payments import create_paid_orders
+
+        (order,) = create_paid_orders(
+            self.user, [{"offer_id": self.offer.id, "quantity": 1, "price": "50.00"}]
+        )
+        ticket = Ticket.objects.get(order=order)
+        with ticket.qr_image.open("rb") as stored:
+            stored_png = stored.read()
+        qr_cache.clear()
+        self.client.force_login(self.user)
+
+        response = self.client.get(
+            reverse("tickets:ticket_qr_image", kwargs={"ticket_id": ticket.id})
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, stored_png)
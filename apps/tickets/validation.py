@@ -0,0 +1,236 @@
+"""
+Validation des billets au portique.
+
+La transition valid -> used et la lecture des informations affichées au
+contrôleur (titulaire, offre, date d'achat, statut) sont faites en une seule
+requête SQL sur PostgreSQL (CTE UPDATE ... RETURNING + SELECT joint).
+L'UPDATE est conditionnel (status = 'valid' et commande payée) : en cas de
+double scan simultané, seul le premier passe.
+
+Les QR codes au format signé (voir signed_payload) sont vérifiés avant la
+requête : un code falsifié, malformé ou expiré est rejeté sans accès base.
+
+Les billets validés sont comptés dans les séries temporelles des entrées à
+l'écriture du journal des passages (voir scan_log), hors de la requête de
+validation.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from apps.catalog.models import Offer
+from apps.orders.models import Order
+from .models import Ticket
+from .signed_payload import (
+    SignedPayloadError,
+    decode_signed_payload,
+    is_signed_payload,
+)
+
+User = get_user_model()
+
+OUTCOME_VALID = "valid"
+OUTCOME_USED = "used"
+OUTCOME_UNPAID = "unpaid"
+OUTCOME_UNKNOWN = "unknown"
+OUTCOME_INVALID = "invalid"
+
+OUTCOME_MESSAGES = {
+    OUTCOME_VALID: "Billet validé avec succès",
+    OUTCOME_USED: "Ce billet a déjà été utilisé",
+    OUTCOME_UNPAID: "Cette commande n'est pas payée",
+    OUTCOME_UNKNOWN: "Billet non trouvé",
+    OUTCOME_INVALID: "QR code invalide",
+}
+
+OFFER_LABELS = dict(Offer.OFFER_TYPES)
+
+# Colonnes lues pour chaque billet, dans l'ordre attendu par _build_result
+ROW_FIELDS = (
+    "id",
+    "status",
+    "order__status",
+    "user__first_name",
+    "user__last_name",
+    "order__offer__name",
+    "created_at",
+)
+
+
+def _postgres_validate_sql(where, extra_columns=""):
+    """
+    UPDATE conditionnel + lecture jointe des billets sélectionnés par `where`.
+    """
+    return f"""
+WITH updated AS (
+    UPDATE {Ticket._meta.db_table} AS t
+    SET status = 'used', updated_at = %(now)s
+    FROM {Order._meta.db_table} AS o
+    WHERE ({where})
+      AND t.status = 'valid'
+      AND o.id = t.order_id
+      AND o.status = 'paid'
+    RETURNING t.id
+)
+SELECT {extra_columns}t.id, t.status, o.status, u.first_name, u.last_name, f.name,
+       t.created_at, t.id IN (SELECT id FROM updated)
+FROM {Ticket._meta.db_table} AS t
+JOIN {Order._meta.db_table} AS o ON o.id = t.order_id
+JOIN {User._meta.db_table} AS u ON u.id = t.user_id
+JOIN {Offer._meta.db_table} AS f ON f.id = o.offer_id
+WHERE ({where})
+"""
+
+
+POSTGRES_VALIDATE_BY_KEY_SQL = _postgres_validate_sql("t.final_key = %(value)s")
+POSTGRES_VALIDATE_BY_ID_SQL = _postgres_validate_sql("t.id = %(value)s")
+POSTGRES_VALIDATE_BATCH_SQL = _postgres_validate_sql(
+    "t.final_key = ANY(%(final_keys)s) OR t.id = ANY(%(ticket_ids)s)",
+    extra_columns="t.final_key, ",
+)
+
+
+def resolve_scanned_value(value):
+    """
+    Traduit le contenu scanné en critère de recherche, sans accès base :
+    ("final_key", clé) au format historique, ("id", ticket_id) au format signé,
+    ou ("invalid", message) si la charge utile signée est rejetée.
+    """
+    if not is_signed_payload(value):
+        return "final_key", value
+    try:
+        return "id", decode_signed_payload(value)["ticket_id"]
+    except SignedPayloadError as e:
+        return "invalid", str(e)
+
+
+def validate_final_key(final_key):
+    """
+    Valide un billet par le contenu de son QR code (final_key ou charge utile
+    signée) et retourne un dict :
+    {"outcome": ..., "message": ..., "ticket_info": {...} ou None}.
+    """
+    kind, value = resolve_scanned_value(final_key)
+    if kind == "invalid":
+        return _invalid_result(value)
+
+    now = timezone.now()
+    if connection.vendor == "postgresql":
+        sql = (
+            POSTGRES_VALIDATE_BY_ID_SQL
+            if kind == "id"
+            else POSTGRES_VALIDATE_BY_KEY_SQL
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {"now": now, "value": value})
+            row = cursor.fetchone()
+        if row is None:
+            return _build_result(None, False)
+        return _build_result(row[:-1], row[-1])
+
+    # Autres bases (tests locaux SQLite) : UPDATE conditionnel puis une lecture
+    lookup = {kind: value}
+    validated = Ticket.objects.filter(
+        status="valid", order__status="paid", **lookup
+    ).update(status="used", updated_at=now)
+    row = Ticket.objects.filter(**lookup).values_list(*ROW_FIELDS).first()
+    return _build_result(row, bool(validated))
+
+
+def validate_final_keys(final_keys):
+    """
+    Valide un lot de billets en une transaction ensembliste.
+
+    Retourne un résultat par clé, dans l'ordre reçu (même format que
+    validate_final_key, avec la clé en plus). Un billet présent plusieurs fois
+    dans le lot n'est validé qu'à sa première occurrence.
+    """
+    resolved = {value: resolve_scanned_value(value) for value in final_keys}
+    keys = [value for kind, value in resolved.values() if kind == "final_key"]
+    ids = [value for kind, value in resolved.values() if kind == "id"]
+    now = timezone.now()
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                POSTGRES_VALIDATE_BATCH_SQL,
+                {"now": now, "final_keys": keys, "ticket_ids": ids},
+            )
+            rows = [(row[0], row[1:-1], row[-1]) for row in cursor.fetchall()]
+    else:
+        lookup = Q(final_key__in=keys) | Q(id__in=ids)
+        with transaction.atomic():
+            eligible = set(
+                Ticket.objects.select_for_update()
+                .filter(lookup, status="valid", order__status="paid")
+                .values_list("id", flat=True)
+            )
+            Ticket.objects.filter(id__in=eligible).update(status="used", updated_at=now)
+            rows = [
+                (row[0], row[1:], row[1] in eligible)
+                for row in Ticket.objects.filter(lookup).values_list(
+                    "final_key", *ROW_FIELDS
+                )
+            ]
+
+    by_key = {final_key: (row, validated) for final_key, row, validated in rows}
+    by_id = {row[0]: (row, validated) for _, row, validated in rows}
+
+    results = []
+    seen = set()
+    for final_key in final_keys:
+        kind, value = resolved[final_key]
+        if kind == "invalid":
+            results.append({"final_key": final_key, **_invalid_result(value)})
+            continue
+        row, validated = (by_id if kind == "id" else by_key).get(value, (None, False))
+        ticket_id = row[0] if row else None
+        result = _build_result(row, validated and ticket_id not in seen)
+        seen.add(ticket_id)
+        results.append({"final_key": final_key, **result})
+    return results
+
+
+def _invalid_result(reason):
+    """Résultat d'un QR code signé rejeté avant tout accès base."""
+    return {
+        "outcome": OUTCOME_INVALID,
+        "message": f"{OUTCOME_MESSAGES[OUTCOME_INVALID]} : {reason}",
+        "ticket_info": None,
+    }
+
+
+def _build_result(row, validated):
+    """Construit le résultat de validation à partir d'une ligne ROW_FIELDS."""
+    if row is None:
+        return {
+            "outcome": OUTCOME_UNKNOWN,
+            "message": OUTCOME_MESSAGES[OUTCOME_UNKNOWN],
+            "ticket_info": None,
+        }
+
+    ticket_id, status, order_status, first_name, last_name, offer_name, created = row
+
+    if validated:
+        outcome = OUTCOME_VALID
+        status = "used"
+    elif status == "used" or order_status == "paid":
+        # Sur PostgreSQL la lecture voit l'état d'avant la requête : un billet
+        # "valid" d'une commande payée non mis à jour vient d'être scanné ailleurs
+        outcome = OUTCOME_USED
+        status = "used"
+    else:
+        outcome = OUTCOME_UNPAID
+
+    return {
+        "outcome": outcome,
+        "message": OUTCOME_MESSAGES[outcome],
+        "ticket_info": {
+            "ticket_id": ticket_id,
+            "user_name": f"{first_name} {last_name}".strip(),
+            "offer_name": OFFER_LABELS.get(offer_name, offer_name),
+            "purchase_date": created.isoformat(),
+            "status": status,
+        },
+    }
@@ -3,13 +3,29 @@ Views for the tickets app.
 """
 
 import json
+import time
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
+from django.utils.cache import get_conditional_response
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from .gate_stats import gate_stats
+from .issuance import stored_qr_name
 from .models import Ticket
+from .qr_cache import qr_cache, qr_cache_key, render_qr_png
+from .scan_log import scan_log
+from .signed_payload import public_key_b64, qr_payload
+from .validation import (
+    OUTCOME_MESSAGES,
+    OUTCOME_USED,
+    OUTCOME_VALID,
+    validate_final_key,
+    validate_final_keys,
+)
 
 
 @login_required
@@ -35,18 +51,70 @@ def ticket_detail_view(request, ticket_id):
 @login_required
 def ticket_qr_image_view(request, ticket_id):
     """
-    Génère et renvoie à la volée l'image PNG du QR code du billet (sans stockage disque).
-    """
-    ticket = get_object_or_404(Ticket, id=ticket_id, user=request.user)
+    Renvoie l'image PNG du QR code du billet (sans stockage disque).
 
-    png_bytes = ticket.generate_qr_code()
+    Le rendu est mis en cache (voir qr_cache) et servi avec un ETag fort :
+    un navigateur qui a déjà l'image reçoit un 304 sans aucun rendu.
+    Les billets issus de la réserve ont leur PNG déjà stocké (qr_image).
+    """
+    row = (
+        Ticket.objects.filter(id=ticket_id, user=request.user)
+        .values_list("final_key", "order__offer_id", "created_at", "qr_image")
+        .first()
+    )
+    if row is None:
+        raise Http404("Billet introuvable")
+
+    final_key, offer_id, created_at, qr_image = row
+    payload = qr_payload(ticket_id, offer_id, final_key, created_at)
+
+    cache_key = qr_cache_key(payload)
+    etag = f'"{cache_key}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = "private, max-age=3600"
+        return not_modified
+
+    png_bytes = qr_cache.get(cache_key)
+    if png_bytes is None:
+        # PNG pré-rendu par mint_ticket_pool, s'il correspond au contenu actuel
+        if qr_image and qr_image.endswith("_" + stored_qr_name(payload)):
+            with default_storage.open(qr_image, "rb") as stored:
+                png_bytes = stored.read()
+        else:
+            png_bytes = render_qr_png(payload)
+        qr_cache.set(cache_key, png_bytes)
 
     response = HttpResponse(png_bytes, content_type="image/png")
-    # Cache léger côté client (optionnel) pour éviter de régénérer à chaque hit
-    response["Cache-Control"] = "max-age=3600, public"
+    response["ETag"] = etag
+    # Image propre à l'utilisateur connecté : pas de cache partagé (proxy/CDN)
+    response["Cache-Control"] = "private, max-age=3600"
     return response
 
 
+def _log_scans(request, data, results):
+    """
+    Append scans to the gate audit log (written in batches, off the request)
+    and to the live gate counters of the supervisor dashboard.
+
+    Gate and device come from the "gate" and "device" JSON fields, or the
+    X-Gate-Id and X-Device-Id headers.
+    """
+    gate = str(data.get("gate") or request.headers.get("X-Gate-Id", ""))[:64]
+    device = str(data.get("device") or request.headers.get("X-Device-Id", ""))[:64]
+    employee_id = request.user.id if request.user.is_authenticated else None
+    for result in results:
+        ticket_info = result["ticket_info"]
+        scan_log.add(
+            result["outcome"],
+            ticket_id=ticket_info["ticket_id"] if ticket_info else None,
+            gate=gate,
+            device=device,
+            employee_id=employee_id,
+        )
+    gate_stats.record(gate, [result["outcome"] for result in results])
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def validate_ticket_api(request):
@@ -65,45 +133,30 @@ def validate_ticket_api(request):
                 {"success": False, "error": "final_key is required"}, status=400
             )
 
-        # Validate ticket
-        # D'abord essayer de valider le billet (marquer comme utilisé si valide)
-        is_valid, ticket, message = Ticket.validate_ticket(final_key)
+        # Validation et lecture des infos du billet en une seule requête
+        result = validate_final_key(final_key)
+        ticket_info = result["ticket_info"]
+        _log_scans(request, data, [result])
 
-        if is_valid:
+        if result["outcome"] == OUTCOME_VALID:
             # Billet valide et marqué comme utilisé
+            return JsonResponse(
+                {"success": True, **ticket_info, "message": result["message"]}
+            )
+        elif result["outcome"] == OUTCOME_USED:
+            # Retourner erreur mais avec les infos du billet
             return JsonResponse(
                 {
-                    "success": True,
-                    "ticket_id": ticket.id,
-                    "user_name": ticket.user.get_full_name(),
-                    "offer_name": ticket.order.offer.get_name_display(),
-                    "purchase_date": ticket.created_at.isoformat(),
-                    "status": ticket.status,
-                    "message": message,
-                }
+                    "success": False,
+                    "error": result["message"],
+                    "ticket_info": ticket_info,
+                },
+                status=400,
             )
         else:
-            # Si validation échouée, essayer de récupérer les infos quand même
-            found, ticket, info_message = Ticket.get_ticket_info(final_key)
-
-            if found and ticket:
-                # Retourner erreur mais avec les infos du billet
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "error": message,
-                        "ticket_info": {
-                            "ticket_id": ticket.id,
-                            "user_name": ticket.user.get_full_name(),
-                            "offer_name": ticket.order.offer.get_name_display(),
-                            "purchase_date": ticket.created_at.isoformat(),
-                            "status": ticket.status,
-                        },
-                    },
-                    status=400,
-                )
-            else:
-                return JsonResponse({"success": False, "error": message}, status=400)
+            return JsonResponse(
+                {"success": False, "error": result["message"]}, status=400
+            )
 
     except json.JSONDecodeError:
         return JsonResponse(
@@ -111,3 +164,88 @@ def validate_ticket_api(request):
         )
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+
+@require_http_methods(["POST"])
+def validate_tickets_batch_api(request):
+    """
+    API endpoint to validate a batch of tickets (turnstile controllers).
+
+    POST /api/billets/valider/lot/
+    Body: {"final_keys": ["abc123...", "def456..."]}
+
+    Restricted to employee sessions, with the usual CSRF protection: one
+    request burns up to VALIDATION_BATCH_MAX_KEYS tickets.
+    """
+    if not (request.user.is_authenticated and request.user.is_employee):
+        return JsonResponse({"success": False, "error": "Forbidden"}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        final_keys = data.get("final_keys")
+
+        if (
+            not isinstance(final_keys, list)
+            or not final_keys
+            or not all(isinstance(key, str) and key for key in final_keys)
+        ):
+            return JsonResponse(
+                {"success": False, "error": "final_keys must be a non-empty list"},
+                status=400,
+            )
+
+        max_keys = settings.VALIDATION_BATCH_MAX_KEYS
+        if len(final_keys) > max_keys:
+            return JsonResponse(
+                {
+                    "success": False,
+                    "error": f"At most {max_keys} final_keys per batch",
+                },
+                status=400,
+            )
+
+        started = time.perf_counter()
+        results = validate_final_keys(final_keys)
+        _log_scans(request, data, results)
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        summary = dict.fromkeys(OUTCOME_MESSAGES, 0)
+        for result in results:
+            summary[result["outcome"]] += 1
+
+        response = JsonResponse(
+            {
+                "success": True,
+                "count": len(results),
+                "summary": summary,
+                "latency_ms": latency_ms,
+                "results": results,
+            }
+        )
+        response["Server-Timing"] = f"validate;dur={latency_ms}"
+        return response
+
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"success": False, "error": "Invalid JSON data"}, status=400
+        )
+    except Exception as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def qr_public_key_api(request):
+    """
+    API endpoint exposing the public key of signed QR payloads.
+
+    GET /api/billets/cle-publique/
+    Gate devices use it to verify signed QR codes offline.
+    """
+    return JsonResponse(
+        {
+            "success": True,
+            "algorithm": "Ed25519",
+            "format": "JO1",
+            "public_key": public_key_b64(),
+        }
+    )
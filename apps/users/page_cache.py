@@ -0,0 +1,102 @@
+"""
+Cache des pages publiques pour les visiteurs anonymes.
+
+Les pages d'accueil, des offres et les pages statiques sont identiques pour
+tous les visiteurs non connectés : leur HTML est gardé dans le cache Django
+partagé (settings.PAGE_CACHE_ALIAS) et resservi sans rendu de template ni
+requête SQL. Le badge du panier n'est plus rendu côté serveur : il est
+chargé par base.html depuis l'API cart:summary_api.
+
+La clé contient la version du catalogue (apps.catalog.cache) : toute
+écriture sur une offre purge donc les pages en cache.
+
+Une requête n'est servie depuis le cache que si elle n'a ni cookie de
+session ni cookie de messages : un visiteur connecté reçoit toujours une
+page rendue pour lui, marquée "Cache-Control: private".
+"""
+
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from apps.catalog.cache import current_version
+
+CACHE_STATUS_HEADER = "X-Page-Cache"
+
+
+def page_cache():
+    """Backend de cache Django partagé utilisé pour les pages."""
+    return caches[getattr(settings, "PAGE_CACHE_ALIAS", "default")]
+
+
+def page_cache_timeout():
+    """Durée de vie (secondes) des pages en cache ; 0 désactive le cache."""
+    return getattr(settings, "PAGE_CACHE_TIMEOUT", 60)
+
+
+def is_cacheable_request(request):
+    """Requête GET anonyme, sans session ni message flash en attente."""
+    return (
+        page_cache_timeout() > 0
+        and request.method in ("GET", "HEAD")
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and getattr(settings, "MESSAGE_COOKIE_NAME", "messages") not in request.COOKIES
+    )
+
+
+def page_cache_key(request):
+    """Clé d'une page : version du catalogue + chemin complet (avec la query string)."""
+    path = hashlib.sha256(request.get_full_path().encode("utf-8")).hexdigest()
+    return f"page:v{current_version()}:{path}"
+
+
+def cache_anonymous_page(view_func):
+    """
+    Décorateur mettant en cache le HTML d'une vue pour les visiteurs anonymes.
+
+    Pendant le rendu mis en cache, request.page_cache vaut True : les
+    templates n'y insèrent pas de jeton CSRF (il serait partagé).
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            response = view_func(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            patch_vary_headers(response, ("Cookie",))
+            return response
+
+        cache = page_cache()
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response[CACHE_STATUS_HEADER] = "hit"
+        else:
+            request.page_cache = True
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+            # Jamais de cache si la réponse dépend du visiteur (cookie posé,
+            # jeton CSRF généré pendant le rendu)
+            if (
+                response.status_code != 200
+                or response.cookies
+                or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            ):
+                return response
+            cache.set(
+                key,
+                (response.content, response["Content-Type"]),
+                page_cache_timeout(),
+            )
+            response[CACHE_STATUS_HEADER] = "miss"
+
+        patch_cache_control(response, public=True, max_age=page_cache_timeout())
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+    return wrapper
@@ -13,8 +13,10 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse_lazy
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.generic import CreateView
 from .forms import CustomUserCreationForm, UserLoginForm
+from .page_cache import cache_anonymous_page
 
 
 class SignUpView(CreateView):
@@ -66,6 +68,14 @@ def login_view(request):
             if user is not None:
                 login(request, user)
                 messages.success(request, f"Bienvenue {user.get_full_name()} !")
+                # Retour à la page demandée (ex : finaliser le panier invité)
+                next_url = request.GET.get("next", "")
+                if url_has_allowed_host_and_scheme(
+                    next_url,
+                    allowed_hosts={request.get_host()},
+                    require_https=request.is_secure(),
+                ):
+                    return redirect(next_url)
                 return redirect("users:home")
             else:
                 messages.error(request, "Email ou mot de passe incorrect.")
@@ -92,6 +102,7 @@ def profile_view(request):
     return render(request, "users/profile.html", {"user": request.user})
 
 
+@cache_anonymous_page
 def home_view(request):
     """
     Home page view.
@@ -99,6 +110,7 @@ def home_view(request):
     return render(request, "home.html")
 
 
+@cache_anonymous_page
 def construction_view(request):
     """
     Construction page view for pages under development.
@@ -0,0 +1,221 @@
+"""
+Salle d'attente virtuelle pour l'ouverture des ventes.
+
+Quand la salle est ouverte, chaque visiteur qui arrive sur le parcours
+d'achat (offres, panier, paiement) reçoit un numéro de passage (compteur
+du cache partagé) dans un cookie signé. Les numéros sont admis au rythme
+de `rate` visiteurs par minute : le dernier numéro admis se calcule à
+partir d'un point d'ancrage (heure, numéro), sans écriture par requête.
+Un visiteur admis reçoit un laissez-passer signé valable
+WAITING_ROOM_PASS_TTL secondes.
+
+Tout l'état (ouverture et débit, ancrage, compteur) est dans le cache
+settings.WAITING_ROOM_CACHE_ALIAS, qui doit être partagé entre les
+processus (Redis en production) : ouvrir la salle sur un cache propre au
+processus est refusé (voir checks.py). Les administrateurs changent le débit
+en direct depuis le tableau de bord ; chaque processus relit l'état au
+plus toutes les WAITING_ROOM_LOCAL_TTL secondes.
+"""
+
+import math
+import threading
+import time
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from .checks import is_local_cache
+
+# Ouverture et débit (écrits par configure) ; ancrage (heure, numéro) à part
+STATE_KEY = "waitingroom:state"
+ANCHOR_KEY = "waitingroom:anchor"
+ISSUED_KEY = "waitingroom:issued"
+TICKET_COOKIE = "wr_ticket"
+PASS_COOKIE = "wr_pass"
+TICKET_SALT = "apps.waitingroom.ticket"
+PASS_SALT = "apps.waitingroom.pass"
+TICKET_MAX_AGE = 86400
+
+_local = {"state": None, "checked_at": 0.0}
+_lock = threading.Lock()
+
+
+def room_cache():
+    """Backend de cache Django partagé utilisé par la salle d'attente."""
+    return caches[getattr(settings, "WAITING_ROOM_CACHE_ALIAS", "default")]
+
+
+def pass_ttl():
+    """Durée de validité (secondes) du laissez-passer d'un visiteur admis."""
+    return getattr(settings, "WAITING_ROOM_PASS_TTL", 1800)
+
+
+def issued_count():
+    """Nombre de numéros distribués depuis la création du compteur."""
+    return room_cache().get(ISSUED_KEY, 0)
+
+
+def _read_state():
+    """Etat lu dans le cache partagé, créé à partir des settings s'il est absent."""
+    cache = room_cache()
+    values = cache.get_many([STATE_KEY, ANCHOR_KEY])
+    if len(values) < 2:
+        cache.add(
+            STATE_KEY,
+            {
+                "enabled": getattr(settings, "WAITING_ROOM_ENABLED", False)
+                and not is_local_cache(cache),
+                "rate": getattr(settings, "WAITING_ROOM_RATE", 600),
+            },
+            None,
+        )
+        cache.add(ANCHOR_KEY, (time.time(), issued_count()), None)
+        values = cache.get_many([STATE_KEY, ANCHOR_KEY])
+    anchor_time, anchor_number = values[ANCHOR_KEY]
+    return dict(values[STATE_KEY], anchor_time=anchor_time, anchor_number=anchor_number)
+
+
+def _remember(state):
+    with _lock:
+        _local.update(state=state, checked_at=time.monotonic())
+
+
+def get_state():
+    """
+    Etat de la salle : enabled, rate (admissions par minute), anchor_time et
+    anchor_number. Créé à partir des settings s'il est absent du cache.
+    """
+    now = time.monotonic()
+    with _lock:
+        if _local["state"] is not None and now - _local["checked_at"] < getattr(
+            settings, "WAITING_ROOM_LOCAL_TTL", 1
+        ):
+            return _local["state"]
+
+    state = _read_state()
+    _remember(state)
+    return state
+
+
+def admitted_upto(state, at=None):
+    """Dernier numéro admis à l'instant `at` (maintenant par défaut)."""
+    at = time.time() if at is None else at
+    elapsed = max(at - state["anchor_time"], 0)
+    return state["anchor_number"] + elapsed * state["rate"] / 60
+
+
+def configure(enabled=None, rate=None):
+    """
+    Ouvre/ferme la salle ou change le débit. Le point d'ancrage est déplacé
+    à maintenant pour que les numéros déjà admis le restent. Lève ValueError
+    si la salle est ouverte sur un cache propre au processus.
+    """
+    if enabled and is_local_cache(room_cache()):
+        raise ValueError(
+            "the waiting room needs a cache shared by all processes (REDIS_URL)"
+        )
+    # Etat relu dans le cache, pas la copie locale qui peut dater
+    state = _read_state()
+    now = time.time()
+    room = {
+        "enabled": state["enabled"] if enabled is None else bool(enabled),
+        "rate": state["rate"] if rate is None else max(int(rate), 1),
+    }
+    anchor = (now, admitted_upto(state, now))
+    room_cache().set_many({STATE_KEY: room, ANCHOR_KEY: anchor}, None)
+    state = dict(room, anchor_time=anchor[0], anchor_number=anchor[1])
+    _remember(state)
+    return state
+
+
+def issue_number():
+    """
+    Distribue le numéro suivant. Si la file est vide (le numéro est déjà
+    admissible), l'ancrage est ramené sur ce numéro : le temps passé sans
+    visiteurs ne permet pas d'admettre ensuite une rafale d'un coup.
+    """
+    cache = room_cache()
+    cache.add(ISSUED_KEY, 0, None)
+    number = cache.incr(ISSUED_KEY)
+    state = get_state()
+    now = time.time()
+    if admitted_upto(state, now) >= number:
+        # Seul l'ancrage est déplacé : l'ouverture et le débit ne sont écrits
+        # que par configure (la copie locale de l'état peut dater)
+        cache.set(ANCHOR_KEY, (now, number), None)
+        _remember(dict(state, anchor_time=now, anchor_number=number))
+    return number
+
+
+def is_admitted(number, state=None):
+    """Le numéro est-il passé ?"""
+    return number <= admitted_upto(state or get_state())
+
+
+def position(number, state=None):
+    """(place dans la file, attente estimée en secondes) pour un numéro."""
+    state = state or get_state()
+    ahead = max(math.ceil(number - admitted_upto(state)), 0)
+    return ahead, math.ceil(ahead * 60 / state["rate"])
+
+
+def room_stats():
+    """Compteurs exposés au tableau de bord d'administration."""
+    state = get_state()
+    issued = issued_count()
+    upto = admitted_upto(state)
+    return {
+        "enabled": state["enabled"],
+        "rate": state["rate"],
+        "issued": issued,
+        "admitted": min(math.floor(upto), issued),
+        "waiting": max(issued - math.floor(upto), 0),
+    }
+
+
+def read_ticket(request):
+    """Numéro de passage du visiteur (None s'il n'en a pas de valide)."""
+    value = request.COOKIES.get(TICKET_COOKIE)
+    if not value:
+        return None
+    try:
+        return int(signing.loads(value, salt=TICKET_SALT, max_age=TICKET_MAX_AGE))
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+def has_pass(request):
+    """Le visiteur a-t-il un laissez-passer encore valide ?"""
+    value = request.COOKIES.get(PASS_COOKIE)
+    if not value:
+        return False
+    try:
+        return signing.loads(value, salt=PASS_SALT, max_age=pass_ttl()) is True
+    except signing.BadSignature:
+        return False
+
+
+def give_ticket(response, number):
+    """Pose le cookie du numéro de passage."""
+    response.set_cookie(
+        TICKET_COOKIE,
+        signing.dumps(number, salt=TICKET_SALT),
+        max_age=TICKET_MAX_AGE,
+        httponly=True,
+        samesite="Lax",
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+    return response
+
+
+def give_pass(response):
+    """Pose le laissez-passer et retire le numéro de passage."""
+    response.set_cookie(
+        PASS_COOKIE,
+        signing.dumps(True, salt=PASS_SALT),
+        max_age=pass_ttl(),
+        httponly=True,
+        samesite="Lax",
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+    response.delete_cookie(TICKET_COOKIE, samesite="Lax")
+    return response
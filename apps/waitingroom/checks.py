@@ -0,0 +1,35 @@
+"""
+Vérifications système : les états partagés entre les processus (salle
+d'attente, compteurs des portiques) exigent un cache partagé.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_local_cache(cache):
+    """Le cache est-il propre au processus (non partagé entre les workers) ?"""
+    return isinstance(cache, LOCAL_CACHE_BACKENDS)
+
+
+@register(Tags.caches)
+def check_waiting_room_cache(app_configs, **kwargs):
+    """La salle d'attente ouverte au démarrage exige un cache partagé."""
+    alias = getattr(settings, "WAITING_ROOM_CACHE_ALIAS", "default")
+    if getattr(settings, "WAITING_ROOM_ENABLED", False) and is_local_cache(
+        caches[alias]
+    ):
+        return [
+            Error(
+                f"The waiting room cache '{alias}' is local to each process.",
+                hint="Configure a shared cache (set REDIS_URL) before "
+                "enabling WAITING_ROOM_ENABLED.",
+                id="waitingroom.E001",
+            )
+        ]
+    return []
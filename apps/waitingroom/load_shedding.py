@@ -0,0 +1,217 @@
+"""
+Délestage adaptatif des requêtes selon la priorité des routes.
+
+Chaque processus suit sa propre charge : le nombre de requêtes en cours et
+le temps passé par les requêtes dans la file du proxy (en-tête
+X-Request-Start, moyenne mobile exponentielle). La pression est le plus
+grand des rapports attente / LOAD_SHEDDING_TARGET_DELAY et requêtes en
+cours / LOAD_SHEDDING_MAX_IN_FLIGHT.
+
+X-Request-Start n'est lu que si LOAD_SHEDDING_TRUST_REQUEST_START indique
+que le proxy le pose lui-même (en écrasant celui du client). Un horodatage
+dans le futur ou trop ancien est ignoré, et chaque mesure est plafonnée :
+un en-tête forgé ne peut pas faire délester tout un processus.
+
+Les routes sont classées par priorité : validation aux portes > paiement >
+navigation > rapports d'administration. Une classe est refusée (503
+immédiat avec Retry-After, sans session ni requête SQL) dès que la
+pression atteint son seuil : les rapports cèdent les premiers, la
+validation des billets n'est jamais délestée.
+
+La durée de traitement est mesurée pour le suivi mais ne déclenche pas de
+délestage : une seule requête lente ne doit pas couper le site. Sans
+mesure récente, l'attente moyenne décroît (demi-vie DECAY_HALF_LIFE) pour
+que le délestage s'arrête de lui-même.
+"""
+
+import threading
+import time
+from django.conf import settings
+
+GATE = "gate"
+CHECKOUT = "checkout"
+BROWSING = "browsing"
+REPORTS = "reports"
+PRIORITIES = (GATE, CHECKOUT, BROWSING, REPORTS)
+
+# Premier préfixe correspondant ; les autres chemins sont de la navigation
+DEFAULT_ROUTES = (
+    ("/api/billets/valider/", GATE),
+    # Tableau de bord des superviseurs : comme les compteurs, pas comme un scan
+    ("/api/controle/portiques/", CHECKOUT),
+    ("/controle/portiques/", CHECKOUT),
+    ("/api/controle/", GATE),
+    ("/controle/", GATE),
+    # Les compteurs restent lisibles pendant une surcharge
+    ("/api/administration/metriques/", CHECKOUT),
+    ("/api/administration/", REPORTS),
+    ("/administration/", REPORTS),
+    ("/admin/", REPORTS),
+    ("/panier/resume/", BROWSING),
+    ("/panier/", CHECKOUT),
+    ("/finalisation/", CHECKOUT),
+    ("/api/commandes/", CHECKOUT),
+    ("/api/paiements/", CHECKOUT),
+    ("/file-attente/", CHECKOUT),
+)
+
+# Pression (multiple de l'objectif) à partir de laquelle une classe est refusée
+SHED_THRESHOLDS = {GATE: None, CHECKOUT: 4.0, BROWSING: 2.0, REPORTS: 1.0}
+# Délai (secondes) conseillé aux clients refusés
+RETRY_AFTER = {GATE: 1, CHECKOUT: 2, BROWSING: 5, REPORTS: 30}
+
+EWMA_ALPHA = 0.3
+DECAY_HALF_LIFE = 2.0
+# Écart d'horloge toléré avec le proxy et âge maximal plausible (secondes)
+# d'un horodatage X-Request-Start
+CLOCK_SKEW = 1.0
+MAX_REQUEST_START_AGE = 60.0
+# Plafond d'une mesure d'attente, en multiple du plus haut seuil de délestage
+MAX_QUEUE_DELAY_FACTOR = 4
+
+
+def is_enabled():
+    """Le délestage est-il actif ?"""
+    return getattr(settings, "LOAD_SHEDDING_ENABLED", True)
+
+
+def target_delay():
+    """Attente maximale visée (secondes) dans la file du proxy."""
+    return getattr(settings, "LOAD_SHEDDING_TARGET_DELAY", 0.1)
+
+
+def trust_request_start():
+    """L'en-tête X-Request-Start est-il posé par un proxy de confiance ?"""
+    return getattr(settings, "LOAD_SHEDDING_TRUST_REQUEST_START", False)
+
+
+def max_queue_delay():
+    """Plus grande mesure d'attente (secondes) prise en compte."""
+    highest = max(t for t in SHED_THRESHOLDS.values() if t is not None)
+    return MAX_QUEUE_DELAY_FACTOR * highest * target_delay()
+
+
+def max_in_flight():
+    """Requêtes simultanées par processus avant délestage (0 : pas de limite)."""
+    return getattr(settings, "LOAD_SHEDDING_MAX_IN_FLIGHT", 0)
+
+
+def classify(path):
+    """Classe de priorité d'un chemin."""
+    for prefix, priority in getattr(settings, "LOAD_SHEDDING_ROUTES", DEFAULT_ROUTES):
+        if path.startswith(prefix):
+            return priority
+    return BROWSING
+
+
+def parse_request_start(value, now):
+    """
+    Secondes passées dans la file du proxy d'après l'en-tête X-Request-Start
+    ("t=<horodatage>"), ou None s'il est absent, illisible, dans le futur ou
+    plus ancien que MAX_REQUEST_START_AGE.
+    """
+    if not value:
+        return None
+    try:
+        start = float(value.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    # nginx ($msec) donne des secondes, d'autres proxies des milli- ou microsecondes
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    delay = now - start
+    if not -CLOCK_SKEW <= delay <= MAX_REQUEST_START_AGE:
+        return None
+    return max(delay, 0.0)
+
+
+class LoadMonitor:
+    """
+    Charge d'un processus : requêtes en cours, attente dans la file du proxy
+    et durée de traitement (moyennes mobiles), compteurs par priorité.
+
+    Thread-safe : les workers gunicorn en threads partagent la même instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Remet la charge et les compteurs à zéro."""
+        with self._lock:
+            self.in_flight = 0
+            self._queue_delay = 0.0
+            self._queue_delay_at = time.monotonic()
+            self._service_time = 0.0
+            self.served = dict.fromkeys(PRIORITIES, 0)
+            self.shed = dict.fromkeys(PRIORITIES, 0)
+
+    def _current_queue_delay(self, now):
+        elapsed = max(now - self._queue_delay_at, 0.0)
+        return self._queue_delay * 0.5 ** (elapsed / DECAY_HALF_LIFE)
+
+    def _pressure(self, now):
+        pressure = self._current_queue_delay(now) / target_delay()
+        limit = max_in_flight()
+        if limit:
+            pressure = max(pressure, self.in_flight / limit)
+        return pressure
+
+    def record_queue_delay(self, delay):
+        """
+        Ajoute une mesure d'attente dans la file du proxy (secondes),
+        plafonnée à max_queue_delay().
+        """
+        delay = min(max(delay, 0.0), max_queue_delay())
+        with self._lock:
+            now = time.monotonic()
+            current = self._current_queue_delay(now)
+            self._queue_delay = current + EWMA_ALPHA * (delay - current)
+            self._queue_delay_at = now
+
+    def pressure(self):
+        """Pression actuelle, en multiple de l'objectif (1.0 : objectif atteint)."""
+        with self._lock:
+            return self._pressure(time.monotonic())
+
+    def admit(self, priority):
+        """
+        Accepte la requête (et la compte en cours) ou la refuse si la
+        pression dépasse le seuil de sa priorité.
+        """
+        threshold = SHED_THRESHOLDS.get(priority)
+        with self._lock:
+            if threshold is not None and self._pressure(time.monotonic()) >= threshold:
+                self.shed[priority] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def finish(self, priority, service_time):
+        """Termine une requête acceptée et enregistre sa durée de traitement."""
+        with self._lock:
+            self.in_flight -= 1
+            self.served[priority] += 1
+            self._service_time += EWMA_ALPHA * (service_time - self._service_time)
+
+    def stats(self):
+        """Retourne la charge et les compteurs du processus."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "enabled": is_enabled(),
+                "in_flight": self.in_flight,
+                "max_in_flight": max_in_flight(),
+                "queue_delay_ms": round(self._current_queue_delay(now) * 1000, 1),
+                "target_delay_ms": round(target_delay() * 1000, 1),
+                "service_time_ms": round(self._service_time * 1000, 1),
+                "pressure": round(self._pressure(now), 3),
+                "served": dict(self.served),
+                "shed": dict(self.shed),
+            }
+
+
+monitor = LoadMonitor()
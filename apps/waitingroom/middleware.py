@@ -0,0 +1,161 @@
+"""
+Middleware for the waiting room app.
+"""
+
+import time
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils.http import urlencode
+from . import admission, load_shedding
+
+DEFAULT_PATHS = (
+    "/offres/",
+    "/panier/",
+    "/finalisation/",
+    "/api/commandes/",
+    "/api/paiements/",
+)
+DEFAULT_EXEMPT_PATHS = ("/panier/resume/",)
+
+
+def is_protected(path):
+    """Is this path part of the purchase flow guarded by the waiting room?"""
+    exempt = getattr(settings, "WAITING_ROOM_EXEMPT_PATHS", DEFAULT_EXEMPT_PATHS)
+    if path.startswith(tuple(exempt)):
+        return False
+    return path.startswith(
+        tuple(getattr(settings, "WAITING_ROOM_PATHS", DEFAULT_PATHS))
+    )
+
+
+def is_staff_member(user):
+    """Staff, employees and admin panel users never wait."""
+    return user.is_authenticated and (
+        user.is_staff or user.is_employee or user.is_adminpanel
+    )
+
+
+class WaitingRoomMiddleware:
+    """
+    Admission control for the purchase flow during sale openings.
+
+    Visitors without a pass get a queue number and are sent to the waiting
+    room page (or get a 503 JSON answer on API calls) until their number is
+    admitted. Checks are a cookie signature and one cached state read.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_protected(request.path):
+            return self.get_response(request)
+        state = admission.get_state()
+        if (
+            not state["enabled"]
+            or admission.has_pass(request)
+            or is_staff_member(request.user)
+        ):
+            return self.get_response(request)
+
+        number = admission.read_ticket(request)
+        new_ticket = number is None
+        if new_ticket:
+            number = admission.issue_number()
+            state = admission.get_state()
+
+        if admission.is_admitted(number, state):
+            return admission.give_pass(self.get_response(request))
+
+        response = self.waiting_response(request, number, state)
+        if new_ticket:
+            admission.give_ticket(response, number)
+        return response
+
+    def waiting_response(self, request, number, state):
+        """Send the visitor to the waiting room."""
+        ahead, eta = admission.position(number, state)
+        waiting_url = (
+            reverse("waitingroom:waiting")
+            + "?"
+            + urlencode({"next": request.get_full_path()})
+        )
+        if request.method == "GET" and "application/json" not in request.headers.get(
+            "Accept", ""
+        ):
+            return redirect(waiting_url)
+
+        response = JsonResponse(
+            {
+                "success": False,
+                "waiting_room": True,
+                "message": "Forte affluence : vous êtes dans la file d'attente.",
+                "position": ahead,
+                "eta_seconds": eta,
+                "waiting_url": waiting_url,
+            },
+            status=503,
+        )
+        response["Retry-After"] = str(max(min(eta, 60), 1))
+        return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Fast 503 for low-priority routes while this worker is overloaded.
+
+    Placed before the session and auth middleware so that a shed request
+    costs no database query. Accepted requests are timed to feed the
+    worker's load monitor.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not load_shedding.is_enabled():
+            return self.get_response(request)
+
+        monitor = load_shedding.monitor
+        if load_shedding.trust_request_start():
+            # En-tête posé par le proxy, jamais celui envoyé par le client
+            queue_delay = load_shedding.parse_request_start(
+                request.headers.get("X-Request-Start"), time.time()
+            )
+            if queue_delay is not None:
+                monitor.record_queue_delay(queue_delay)
+
+        priority = load_shedding.classify(request.path)
+        if not monitor.admit(priority):
+            return self.shed_response(request, priority)
+
+        started = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            monitor.finish(priority, time.monotonic() - started)
+
+    def shed_response(self, request, priority):
+        """Cheap 503 answer, JSON for API calls and a bare page otherwise."""
+        message = "Service momentanément surchargé, merci de réessayer dans un instant."
+        if (
+            request.method == "GET"
+            and not request.path.startswith("/api/")
+            and "application/json" not in request.headers.get("Accept", "")
+        ):
+            response = HttpResponse(
+                '<!DOCTYPE html><html lang="fr"><head><meta charset="utf-8">'
+                "<title>JO Tickets</title></head>"
+                f"<body><h1>{message}</h1></body></html>",
+                status=503,
+            )
+        else:
+            response = JsonResponse(
+                {"success": False, "overloaded": True, "message": message},
+                status=503,
+            )
+        response["Retry-After"] = str(load_shedding.RETRY_AFTER[priority])
+        response["Cache-Control"] = "no-store"
+        return response
@@ -0,0 +1,341 @@
+"""
+Tests for the waiting room app.
+"""
+
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from apps.catalog.models import Offer
+from apps.waitingroom import admission, load_shedding
+from apps.waitingroom.checks import check_waiting_room_cache
+
+User = get_user_model()
+
+# Cache partagé entre les processus, comme Redis en production
+SHARED_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "jo_tickets_test_cache"),
+    }
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class WaitingRoomTest(TestCase):
+    """Test cases for the sale opening waiting room."""
+
+    def setUp(self):
+        """Set up test data."""
+        admission.room_cache().delete_many(
+            [admission.STATE_KEY, admission.ANCHOR_KEY, admission.ISSUED_KEY]
+        )
+        admission.configure(enabled=True, rate=60)
+        self.addCleanup(admission.configure, enabled=False)
+        self.offer = Offer.objects.create(
+            name="solo", capacity=1, price=Decimal("50.00"), is_active=True
+        )
+        self.now = time.time()
+        patcher = mock.patch(
+            "apps.waitingroom.admission.time.time", side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_visitor_of_idle_room_is_admitted(self):
+        """Test that an empty queue lets the visitor straight in."""
+        self.now += 3600
+
+        response = self.client.get(reverse("catalog:offers"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(admission.PASS_COOKIE, response.cookies)
+        # The pass is enough afterwards
+        self.assertEqual(self.client.get(reverse("catalog:offers")).status_code, 200)
+
+    def test_burst_is_queued_at_configured_rate(self):
+        """Test that visitors arriving together wait for their turn."""
+        self.now += 3600
+        self.client.get(reverse("catalog:offers"))
+        late = self.client_class()
+
+        response = late.get(reverse("catalog:offers"))
+
+        self.assertRedirects(
+            response,
+            reverse("waitingroom:waiting") + "?next=%2Foffres%2F",
+            fetch_redirect_response=False,
+        )
+        status = late.get(reverse("waitingroom:status_api")).json()
+        self.assertEqual(status, {"admitted": False, "position": 1, "eta_seconds": 1})
+
+        api = late.post(
+            reverse("cart:add_to_cart"),
+            data=json.dumps({"offer_id": self.offer.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(api.status_code, 503)
+        self.assertTrue(api.json()["waiting_room"])
+        self.assertEqual(api["Retry-After"], "1")
+
+        # One second later (60 visitors per minute) the number is admitted
+        self.now += 1
+        status = late.get(reverse("waitingroom:status_api"))
+        self.assertTrue(status.json()["admitted"])
+        self.assertIn(admission.PASS_COOKIE, status.cookies)
+        self.assertEqual(late.get(reverse("catalog:offers")).status_code, 200)
+
+    def test_closed_room_and_unprotected_pages_pass_through(self):
+        """Test that only the purchase flow is guarded, and only when open."""
+        self.client.get(reverse("catalog:offers"))
+        late = self.client_class()
+        self.assertEqual(late.get(reverse("users:home")).status_code, 200)
+        self.assertEqual(late.get(reverse("cart:summary_api")).status_code, 200)
+
+        admission.configure(enabled=False)
+
+        self.assertEqual(late.get(reverse("catalog:offers")).status_code, 200)
+
+    def test_visitor_does_not_undo_admin_change(self):
+        """Test that a worker with a stale state copy only moves the anchor."""
+        stale = admission.get_state()
+        admission.configure(enabled=False, rate=30)
+        # Copie locale d'un autre worker, pas encore relue
+        admission._local.update(state=stale, checked_at=time.monotonic())
+        self.now += 3600
+
+        admission.issue_number()
+
+        stored = admission.room_cache().get(admission.STATE_KEY)
+        self.assertEqual(stored, {"enabled": False, "rate": 30})
+        self.assertEqual(
+            admission.room_cache().get(admission.ANCHOR_KEY), (self.now, 1)
+        )
+
+    def test_admin_tunes_rate_live(self):
+        """Test the admin panel endpoint changing the admission rate."""
+        admin = User.objects.create_user(
+            email="admin@example.com",
+            username="admin",
+            password="testpass123",
+            is_adminpanel=True,
+        )
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            reverse("adminpanel:waiting_room_api"),
+            data=json.dumps({"rate": 120}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()["stats"]
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(stats["rate"], 120)
+        self.assertEqual(admission.get_state()["rate"], 120)
+
+        response = self.client.post(
+            reverse("adminpanel:waiting_room_api"),
+            data=json.dumps({"rate": 0}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class WaitingRoomCacheTest(TestCase):
+    """Test cases for the shared cache requirement of the waiting room."""
+
+    def test_cannot_open_on_local_cache(self):
+        """Test that opening the room on a per-process cache is refused."""
+        admin = User.objects.create_user(
+            email="admin@example.com",
+            username="admin",
+            password="testpass123",
+            is_adminpanel=True,
+        )
+        self.client.force_login(admin)
+
+        with self.assertRaises(ValueError):
+            admission.configure(enabled=True)
+        response = self.client.post(
+            reverse("adminpanel:waiting_room_api"),
+            data=json.dumps({"enabled": True}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(admission.get_state()["enabled"])
+
+    def test_system_check(self):
+        """Test the system check error when enabled on a local cache."""
+        self.assertEqual(check_waiting_room_cache(None), [])
+
+        with self.settings(WAITING_ROOM_ENABLED=True):
+            errors = check_waiting_room_cache(None)
+            self.assertEqual([error.id for error in errors], ["waitingroom.E001"])
+            with self.settings(CACHES=SHARED_CACHES):
+                self.assertEqual(check_waiting_room_cache(None), [])
+
+
+class LoadSheddingTest(TestCase):
+    """Test cases for the per-route priority load shedding."""
+
+    def setUp(self):
+        """Start from an idle worker."""
+        load_shedding.monitor.reset()
+        self.addCleanup(load_shedding.monitor.reset)
+
+    def overload(self, delay):
+        """Feed the monitor proxy queue delays (seconds) until it converges."""
+        for _ in range(30):
+            load_shedding.monitor.record_queue_delay(delay)
+
+    def test_routes_are_classified_by_priority(self):
+        """Test the route priority classes."""
+        self.assertEqual(load_shedding.classify("/api/billets/valider/"), "gate")
+        self.assertEqual(load_shedding.classify("/api/controle/manifeste/"), "gate")
+        self.assertEqual(load_shedding.classify("/api/paiements/1/"), "checkout")
+        self.assertEqual(load_shedding.classify("/panier/"), "checkout")
+        self.assertEqual(load_shedding.classify("/panier/resume/"), "browsing")
+        self.assertEqual(load_shedding.classify("/offres/"), "browsing")
+        self.assertEqual(load_shedding.classify("/administration/"), "reports")
+        self.assertEqual(
+            load_shedding.classify("/api/administration/metriques/delestage/"),
+            "checkout",
+        )
+
+    def test_request_start_header_formats(self):
+        """Test queue delay parsing for seconds, milliseconds and microseconds."""
+        now = 1700000000.5
+        parse = load_shedding.parse_request_start
+        self.assertAlmostEqual(parse("t=1700000000.25", now), 0.25)
+        self.assertAlmostEqual(parse("t=1700000000250", now), 0.25)
+        self.assertAlmostEqual(parse("1700000000250000", now), 0.25)
+        self.assertEqual(parse("t=1700000001.0", now), 0.0)
+        self.assertIsNone(parse("", now))
+        self.assertIsNone(parse("t=abc", now))
+        self.assertIsNone(parse("t=1700000100", now))
+        self.assertIsNone(parse("t=1", now))
+
+    def test_forged_request_start_is_harmless(self):
+        """Test that a client-sent X-Request-Start cannot shed the worker."""
+        forged = {"HTTP_X_REQUEST_START": f"t={time.time() - 50:.3f}"}
+
+        response = self.client.get(reverse("catalog:offers"), **forged)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(load_shedding.monitor.stats()["queue_delay_ms"], 0)
+
+        with self.settings(LOAD_SHEDDING_TRUST_REQUEST_START=True):
+            self.client.get(reverse("catalog:offers"), HTTP_X_REQUEST_START="t=1")
+            self.assertEqual(load_shedding.monitor.stats()["queue_delay_ms"], 0)
+
+        load_shedding.monitor.record_queue_delay(1.8e9)
+        self.assertLessEqual(
+            load_shedding.monitor.pressure(),
+            load_shedding.max_queue_delay() / load_shedding.target_delay(),
+        )
+
+    def test_idle_worker_serves_everything(self):
+        """Test that no request is shed without queueing."""
+        response = self.client.get(
+            reverse("catalog:offers"), HTTP_X_REQUEST_START=f"t={time.time():.3f}"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        stats = load_shedding.monitor.stats()
+        self.assertEqual(stats["served"]["browsing"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(sum(stats["shed"].values()), 0)
+
+    def test_low_priority_routes_are_shed_first(self):
+        """Test that browsing is shed before checkout and gates never are."""
+        self.overload(0.3)
+
+        self.assertEqual(self.client.get(reverse("catalog:offers")).status_code, 503)
+        self.assertEqual(
+            self.client.get(reverse("adminpanel:dashboard")).status_code, 503
+        )
+        self.assertNotEqual(self.client.get(reverse("cart:cart")).status_code, 503)
+
+        self.overload(5.0)
+        response = self.client.post(
+            reverse("cart:update_cart_batch"),
+            data="{}",
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.json()["overloaded"])
+        self.assertEqual(response["Retry-After"], "2")
+        response = self.client.post(
+            reverse("tickets:validate_ticket_api"),
+            data="{}",
+            content_type="application/json",
+        )
+        self.assertNotEqual(response.status_code, 503)
+
+        stats = load_shedding.monitor.stats()
+        self.assertEqual(
+            stats["shed"], {"gate": 0, "checkout": 1, "browsing": 1, "reports": 1}
+        )
+
+    def test_shed_page_is_cheap(self):
+        """Test that a shed page answers without session or database access."""
+        self.overload(1.0)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("catalog:offers"))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_queue_delay_decays_without_new_measures(self):
+        """Test that shedding stops on its own once measures stop coming."""
+        self.overload(1.0)
+        self.assertGreater(load_shedding.monitor.pressure(), 2)
+
+        later = time.monotonic() + 20 * load_shedding.DECAY_HALF_LIFE
+        with mock.patch(
+            "apps.waitingroom.load_shedding.time.monotonic", return_value=later
+        ):
+            self.assertLess(load_shedding.monitor.pressure(), 1)
+
+    @override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=2)
+    def test_in_flight_limit(self):
+        """Test that concurrent requests of a worker count as pressure."""
+        load_shedding.monitor.admit("checkout")
+        load_shedding.monitor.admit("checkout")
+
+        self.assertFalse(load_shedding.monitor.admit("reports"))
+        self.assertTrue(load_shedding.monitor.admit("checkout"))
+
+    @override_settings(LOAD_SHEDDING_ENABLED=False)
+    def test_disabled(self):
+        """Test that nothing is shed when load shedding is disabled."""
+        self.overload(5.0)
+
+        self.assertEqual(self.client.get(reverse("catalog:offers")).status_code, 200)
+
+    def test_admin_reads_counters_under_load(self):
+        """Test the admin panel counters endpoint stays reachable when overloaded."""
+        admin = User.objects.create_user(
+            email="admin@example.com",
+            username="admin",
+            password="testpass123",
+            is_adminpanel=True,
+        )
+        self.client.force_login(admin)
+        self.overload(0.2)
+
+        response = self.client.get(reverse("adminpanel:load_shedding_stats_api"))
+
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()["stats"]
+        self.assertGreaterEqual(stats["pressure"], 1)
+        # Lu pendant la requête, qui est comptée en cours
+        self.assertEqual(stats["in_flight"], 1)
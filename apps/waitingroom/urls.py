@@ -0,0 +1,13 @@
+"""
+URL configuration for the waiting room app.
+"""
+
+from django.urls import path
+from . import views
+
+app_name = "waitingroom"
+
+urlpatterns = [
+    path("file-attente/", views.waiting_view, name="waiting"),
+    path("file-attente/statut/", views.status_api, name="status_api"),
+]
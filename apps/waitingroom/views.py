@@ -0,0 +1,67 @@
+"""
+Views for the waiting room app.
+"""
+
+from django.shortcuts import redirect, render
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.http import JsonResponse
+from . import admission
+
+
+def _next_url(request):
+    """Page to go back to once admitted (same site only)."""
+    next_url = request.GET.get("next", "")
+    if url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return next_url
+    return "/offres/"
+
+
+def waiting_view(request):
+    """
+    Display the waiting room (polls the status endpoint).
+    """
+    next_url = _next_url(request)
+    state = admission.get_state()
+    number = admission.read_ticket(request)
+    if not state["enabled"] or admission.has_pass(request) or number is None:
+        return redirect(next_url)
+
+    ahead, eta = admission.position(number, state)
+    context = {
+        "title": "File d'attente",
+        "position": ahead,
+        "eta_seconds": eta,
+        "next_url": next_url,
+    }
+    response = render(request, "waitingroom/waiting.html", context)
+    response["Cache-Control"] = "private, no-store"
+    return response
+
+
+def status_api(request):
+    """
+    Return the visitor's position in the queue and gives the pass once admitted.
+
+    GET /file-attente/statut/
+
+    Only reads the signed ticket cookie and the cached room state.
+    """
+    state = admission.get_state()
+    number = admission.read_ticket(request)
+    if not state["enabled"] or admission.has_pass(request):
+        response = JsonResponse({"admitted": True, "position": 0, "eta_seconds": 0})
+    elif number is None:
+        response = JsonResponse(
+            {"admitted": False, "position": None, "eta_seconds": None}
+        )
+    elif admission.is_admitted(number, state):
+        response = admission.give_pass(
+            JsonResponse({"admitted": True, "position": 0, "eta_seconds": 0})
+        )
+    else:
+        ahead, eta = admission.position(number, state)
+        response = JsonResponse(
+            {"admitted": False, "position": ahead, "eta_seconds": eta}
+        )
+    response["Cache-Control"] = "private, no-store"
+    return response
@@ -3,6 +3,11 @@ ASGI config for jo_tickets project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The WSGI app (gunicorn) serves the site; an ASGI server (e.g.
+``uvicorn jo_tickets.asgi:application``) keeps the Server-Sent Events stream
+of the live gate dashboard (/api/controle/portiques/flux/) open without
+tying up a WSGI worker per supervisor.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
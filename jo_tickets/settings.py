@@ -42,6 +42,8 @@ LOCAL_APPS = [
     "apps.adminpanel",
     "apps.control",
     "apps.cart",
+    "apps.waitingroom",
+    "apps.analytics",
 ]
 
 INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS
@@ -49,11 +51,14 @@ INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    "apps.waitingroom.middleware.LoadSheddingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.waitingroom.middleware.WaitingRoomMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "apps.cart.middleware.GuestCartMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -70,7 +75,6 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "apps.cart.context_processors.cart_context",
             ],
         },
     },
@@ -95,6 +99,23 @@ DATABASES = {
 if IS_PROD:
     DATABASES["default"]["OPTIONS"] = {"sslmode": "require"}
 
+# Cache partagé entre les processus (Redis) : salle d'attente, versions du
+# catalogue, compteurs des portiques. Sans REDIS_URL (développement, tests),
+# cache en mémoire propre à chaque processus
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -160,6 +181,104 @@ LOGIN_URL = "/connexion/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
+# Cache des QR codes (LRU en mémoire + alias de cache Django partagé optionnel)
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "1024"))
+QR_CACHE_ALIAS = os.getenv("QR_CACHE_ALIAS") or None
+
+# Contenu des QR codes : "legacy" (final_key) ou "signed" (charge utile Ed25519
+# vérifiable sans base). QR_SIGNING_KEY : graine base64 de 32 octets (sinon
+# dérivée de SECRET_KEY).
+QR_PAYLOAD_FORMAT = os.getenv("QR_PAYLOAD_FORMAT", "legacy")
+QR_SIGNING_KEY = os.getenv("QR_SIGNING_KEY") or None
+QR_SIGNED_VALIDITY_DAYS = int(os.getenv("QR_SIGNED_VALIDITY_DAYS", "365"))
+
+# Nombre maximum de billets par appel à l'API de validation par lot
+VALIDATION_BATCH_MAX_KEYS = int(os.getenv("VALIDATION_BATCH_MAX_KEYS", "500"))
+
+# Octets de SHA-256(final_key) conservés dans le manifeste de contrôle hors ligne
+MANIFEST_DIGEST_BYTES = int(os.getenv("MANIFEST_DIGEST_BYTES", "6"))
+
+# File d'attente des paiements : temps de réponse simulé du prestataire
+# (secondes) et délai après lequel un job "en cours" est repris par un worker
+PAYMENT_PSP_DELAY = float(os.getenv("PAYMENT_PSP_DELAY", "1"))
+PAYMENT_JOB_TIMEOUT = int(os.getenv("PAYMENT_JOB_TIMEOUT", "300"))
+
+# Durée de conservation (secondes) des réponses associées à un Idempotency-Key
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+# Délai (secondes) après lequel une requête encore en cours est considérée
+# abandonnée (worker tué) : sa clé peut alors resservir
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "60"))
+
+# Cache du catalogue : alias du cache Django partagé et durée (secondes)
+# pendant laquelle chaque processus garde sa copie sans relire la version
+CATALOG_CACHE_ALIAS = os.getenv("CATALOG_CACHE_ALIAS", "default")
+CATALOG_CACHE_LOCAL_TTL = int(os.getenv("CATALOG_CACHE_LOCAL_TTL", "5"))
+
+# Cache des pages publiques pour les visiteurs anonymes (0 pour désactiver)
+PAGE_CACHE_ALIAS = os.getenv("PAGE_CACHE_ALIAS", "default")
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "60"))
+
+# Nombre de lignes (slots) sur lesquelles est réparti le stock d'une offre
+INVENTORY_SHARDS = int(os.getenv("INVENTORY_SHARDS", "16"))
+
+# Nombre de lignes (slots) sur lesquelles sont répartis les totaux des
+# ventes d'une offre (tableau de bord)
+SALES_ROLLUP_SHARDS = int(os.getenv("SALES_ROLLUP_SHARDS", "8"))
+
+# Séries temporelles : slots de chaque minute, durée (secondes) pendant
+# laquelle les minutes puis les heures sont gardées avant d'être regroupées
+ANALYTICS_SHARDS = int(os.getenv("ANALYTICS_SHARDS", "4"))
+ANALYTICS_MINUTE_RETENTION = int(os.getenv("ANALYTICS_MINUTE_RETENTION", "21600"))
+ANALYTICS_HOUR_RETENTION = int(os.getenv("ANALYTICS_HOUR_RETENTION", "2592000"))
+
+# Lignes lues par aller-retour avec la base pendant un export CSV/NDJSON
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+# Ventes flash : les paiements prennent les billets dans la réserve
+# pré-générée par la commande mint_ticket_pool
+TICKET_POOL_ENABLED = os.getenv("TICKET_POOL_ENABLED", "False").lower() == "true"
+
+# Durée (secondes) pendant laquelle les billets d'un panier restent réservés
+CART_RESERVATION_TTL = int(os.getenv("CART_RESERVATION_TTL", "900"))
+
+# Durée de vie (secondes) du cookie du panier des visiteurs non connectés
+GUEST_CART_MAX_AGE = int(os.getenv("GUEST_CART_MAX_AGE", "604800"))
+
+# Salle d'attente des ouvertures de ventes : état initial (modifiable en
+# direct depuis le tableau de bord), visiteurs admis par minute et durée
+# du laissez-passer (secondes)
+WAITING_ROOM_ENABLED = os.getenv("WAITING_ROOM_ENABLED", "False").lower() == "true"
+WAITING_ROOM_RATE = int(os.getenv("WAITING_ROOM_RATE", "600"))
+WAITING_ROOM_PASS_TTL = int(os.getenv("WAITING_ROOM_PASS_TTL", "1800"))
+
+# Délestage par priorité de route : activé, attente maximale visée dans la
+# file du proxy (secondes, en-tête X-Request-Start) et requêtes simultanées
+# par processus avant délestage (0 : pas de limite)
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "True").lower() == "true"
+LOAD_SHEDDING_TARGET_DELAY = float(os.getenv("LOAD_SHEDDING_TARGET_DELAY", "0.1"))
+LOAD_SHEDDING_MAX_IN_FLIGHT = int(os.getenv("LOAD_SHEDDING_MAX_IN_FLIGHT", "0"))
+# A n'activer que si le proxy pose X-Request-Start lui-même, en écrasant la
+# valeur du client (nginx : proxy_set_header X-Request-Start "t=${msec}")
+LOAD_SHEDDING_TRUST_REQUEST_START = (
+    os.getenv("LOAD_SHEDDING_TRUST_REQUEST_START", "False").lower() == "true"
+)
+
+# Journal des passages au portique : passages par lot, délai maximal avant
+# écriture (secondes, 0 : écriture par la requête, sans thread) et passages
+# gardés en mémoire si la base est indisponible
+SCAN_LOG_BATCH_SIZE = int(os.getenv("SCAN_LOG_BATCH_SIZE", "200"))
+SCAN_LOG_FLUSH_INTERVAL = float(os.getenv("SCAN_LOG_FLUSH_INTERVAL", "0.25"))
+SCAN_LOG_MAX_PENDING = int(os.getenv("SCAN_LOG_MAX_PENDING", "10000"))
+
+# Tableau de bord des portiques en direct : cache partagé où chaque
+# processus publie ses compteurs, délai maximal de publication et
+# intervalle de rafraîchissement du flux SSE (secondes)
+GATE_DASHBOARD_CACHE_ALIAS = os.getenv("GATE_DASHBOARD_CACHE_ALIAS", "default")
+GATE_DASHBOARD_PUBLISH_INTERVAL = float(
+    os.getenv("GATE_DASHBOARD_PUBLISH_INTERVAL", "1.0")
+)
+GATE_DASHBOARD_INTERVAL = float(os.getenv("GATE_DASHBOARD_INTERVAL", "1.0"))
+
 # Logging
 LOGGING = {
     "version": 1,
@@ -56,6 +56,8 @@ urlpatterns = [
     path("", include("apps.adminpanel.urls")),
     path("", include("apps.control.urls")),
     path("", include("apps.cart.urls")),
+    path("", include("apps.waitingroom.urls")),
+    path("", include("apps.analytics.urls")),
 ]
 
 # Serve media files in development
@@ -6,8 +6,9 @@ function addToCart(offerId, offerName, price, capacity) {
     button.innerHTML = '<span class="loading loading-spinner loading-sm"></span> Ajout...';
     button.disabled = true;
     
-    // Get CSRF token
-    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]');
+    // Get CSRF token (cached anonymous pages get it from the cart summary API)
+    const csrfInput = document.querySelector('[name=csrfmiddlewaretoken]');
+    const csrfToken = csrfInput ? csrfInput.value : window.CSRF_TOKEN;
     if (!csrfToken) {
         showMessage('Erreur de sécurité. Veuillez recharger la page.', 'error');
         button.innerHTML = originalText;
@@ -20,7 +21,7 @@ function addToCart(offerId, offerName, price, capacity) {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
-            'X-CSRFToken': csrfToken.value,
+            'X-CSRFToken': csrfToken,
             'Cache-Control': 'no-cache',
             'Pragma': 'no-cache'
         },
@@ -30,13 +31,16 @@ function addToCart(offerId, offerName, price, capacity) {
         })
     })
     .then(response => {
-        if (!response.ok) {
+        // 404, 409 (stock épuisé) et 503 (file d'attente, surcharge) renvoient un message JSON
+        if (!response.ok && ![404, 409, 503].includes(response.status)) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         return response.json();
     })
     .then(data => {
-        if (data.success) {
+        if (data.waiting_room) {
+            window.location.href = data.waiting_url;
+        } else if (data.success) {
             showMessage(data.message, 'success');
             // Update cart counter if it exists
             updateCartCounter(data.cart_total);
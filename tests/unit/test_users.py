@@ -471,3 +471,69 @@ class UserPasswordValidationTest(TestCase):
         response = self.client.post(self.signup_url, data)
         self.assertRedirects(response, reverse("users:home"))
         self.assertTrue(User.objects.filter(email="test@example.com").exists())
+
+
+class PageCacheTest(TestCase):
+    """Tests du cache des pages publiques pour les visiteurs anonymes."""
+
+    def setUp(self):
+        """Configuration des données de test."""
+        from django.core.cache import cache
+
+        cache.clear()
+        self.home_url = reverse("users:home")
+        self.user = User.objects.create_user(
+            email="test@example.com",
+            first_name="Jean",
+            last_name="Dupont",
+            password="MotDePasse123!",
+        )
+
+    def test_anonymous_page_is_served_from_cache(self):
+        """Test que la deuxième visite anonyme est servie sans rendu."""
+        first = self.client.get(self.home_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.home_url)
+
+        self.assertEqual(first["X-Page-Cache"], "miss")
+        self.assertEqual(second["X-Page-Cache"], "hit")
+        self.assertEqual(second.content, first.content)
+        self.assertIn("public", second["Cache-Control"])
+        self.assertIn("Cookie", second["Vary"])
+
+    def test_cached_page_has_no_csrf_token_nor_cookie(self):
+        """Test qu'aucun jeton CSRF n'est partagé via une page en cache."""
+        response = self.client.get(reverse("catalog:offers"))
+
+        self.assertNotContains(response, "csrfmiddlewaretoken")
+        self.assertNotIn("csrftoken", response.cookies)
+
+    def test_logged_in_user_bypasses_cache(self):
+        """Test qu'un utilisateur connecté reçoit une page privée non cachée."""
+        self.client.get(self.home_url)
+        self.client.force_login(self.user)
+
+        response = self.client.get(self.home_url)
+
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertContains(response, 'id="cart-counter"')
+
+    def test_offer_change_purges_cached_pages(self):
+        """Test qu'une modification d'offre purge les pages en cache."""
+        from decimal import Decimal
+        from apps.catalog.cache import bump_catalog_version
+        from apps.catalog.models import Offer
+
+        bump_catalog_version()
+        offers_url = reverse("catalog:offers")
+        self.client.get(offers_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Offer.objects.create(
+                name="duo", capacity=2, price=Decimal("90.00"), is_active=True
+            )
+
+        response = self.client.get(offers_url)
+
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        self.assertContains(response, "Duo (2 personnes)")